@@ -0,0 +1,168 @@
+import bisect
+
+FIRST_FIT = 'first-fit'
+BEST_FIT = 'best-fit'
+
+
+class FreeListAllocator(object):
+    """ Allocator for a range of addresses
+
+    Free extents are kept in two sorted indices: by start address, to find the neighbours of a block
+    when freeing it, and by (size, start), to find a fitting extent with a binary search.
+    Freed blocks are merged with adjacent free extents.
+
+    Policies:
+        best-fit    the smallest free extent the block fits into, O(log n)
+        first-fit   the free extent with the lowest address the block fits into, O(n) in the worst case
+    """
+
+    def __init__(self, start, end, policy=BEST_FIT):
+        """
+        :param start: first address of the managed range
+        :param end: first address after the managed range
+        :param policy: BEST_FIT or FIRST_FIT
+        """
+        if policy not in (BEST_FIT, FIRST_FIT):
+            raise ValueError("Unknown allocation policy '{}'".format(policy))
+        self._policy = policy
+        self._start = start
+        self._end = end
+
+        self._starts = []       # start addresses of all free extents, sorted
+        self._extents = {}      # start address -> end address of each free extent
+        self._sizes = []        # (size, start) of all free extents, sorted
+        self._blocks = {}       # start address -> size of each allocated block
+        self._free = 0          # total size of all free extents
+
+        if end > start:
+            self._add_extent(start, end)
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def blocks(self):
+        """ returns {address: size} of all allocated blocks
+        """
+        return dict(self._blocks)
+
+    @property
+    def free_extents(self):
+        """ returns (start, end) of all free extents, sorted by address
+        """
+        return [(s, self._extents[s]) for s in self._starts]
+
+    @property
+    def free_bytes(self):
+        return self._free
+
+    @property
+    def bytes_in_use(self):
+        return self._end - self._start - self._free
+
+    @property
+    def largest_free_extent(self):
+        return self._sizes[-1][0] if self._sizes else 0
+
+    def size_of(self, address):
+        """ returns the size of the block allocated at the given address or None
+        """
+        return self._blocks.get(address)
+
+    def allocate(self, size):
+        """ reserve a block
+
+        :param size: size of the block in bytes
+        :return: the address of the block or None if there is no free extent large enough
+        """
+        if size < 1:
+            raise ValueError("Can't allocate {} bytes".format(size))
+
+        i = bisect.bisect_left(self._sizes, (size, self._start))
+        if i == len(self._sizes):
+            return None
+
+        if self._policy == BEST_FIT:
+            start = self._sizes[i][1]
+        else:
+            extents = self._extents
+            start = next(s for s in self._starts if extents[s] - s >= size)
+
+        end = self._extents[start]
+        self._remove_extent(start)
+        if end - start > size:
+            self._add_extent(start + size, end)
+
+        self._blocks[start] = size
+        return start
+
+    def free(self, address):
+        """ release a block and merge it with the free extents around it
+
+        :return: the size of the freed block or None if no block is allocated at the address
+        """
+        size = self._blocks.pop(address, None)
+        if size is None:
+            return None
+
+        start = address
+        end = address + size
+
+        # merge with the following extent
+        if end in self._extents:
+            following = self._extents[end]
+            self._remove_extent(end)
+            end = following
+
+        # merge with the preceding extent
+        i = bisect.bisect_left(self._starts, start)
+        if i > 0:
+            preceding = self._starts[i - 1]
+            if self._extents[preceding] == start:
+                self._remove_extent(preceding)
+                start = preceding
+
+        self._add_extent(start, end)
+        return size
+
+    def resize(self, address, size):
+        """ grow or shrink a block in place
+
+        :return: True if the block now has the new size, False if the following memory isn't free
+        """
+        old = self._blocks.get(address)
+        if old is None:
+            raise ValueError("No block allocated at {:04X}".format(address))
+        if size < 1:
+            raise ValueError("Can't resize to {} bytes".format(size))
+
+        end = address + old
+        following = self._extents.get(end)
+        if size > old:
+            if following is None or following - address < size:
+                return False
+            self._remove_extent(end)
+            if following > address + size:
+                self._add_extent(address + size, following)
+        elif size < old:
+            if following is not None:
+                self._remove_extent(end)
+            else:
+                following = end
+            self._add_extent(address + size, following)
+
+        self._blocks[address] = size
+        return True
+
+    def _add_extent(self, start, end):
+        bisect.insort(self._starts, start)
+        bisect.insort(self._sizes, (end - start, start))
+        self._extents[start] = end
+        self._free += end - start
+
+    def _remove_extent(self, start):
+        end = self._extents.pop(start)
+        self._free -= end - start
+        del self._starts[bisect.bisect_left(self._starts, start)]
+        del self._sizes[bisect.bisect_left(self._sizes, (end - start, start))]
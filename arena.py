@@ -0,0 +1,94 @@
+class ArenaError(Exception):
+    pass
+
+
+class Arena(object):
+    """ Bump allocator for short lived blocks
+
+    The arena requests chunks from the kernel and hands out consecutive pieces of them. Single blocks
+    can't be freed, reset() makes all of them available again in O(1) while keeping the chunks for
+    the next round, release() returns the chunks to the kernel.
+    """
+
+    def __init__(self, kernel, chunk_size=0x1000, alignment=4):
+        """
+        :param kernel: Kernel to allocate the chunks from
+        :param chunk_size: size of the chunks, larger blocks get a chunk of their own
+        :param alignment: every block starts at a multiple of this, has to be a power of two
+        """
+        if chunk_size < 1:
+            raise ValueError("Chunk size has to be at least 1")
+        if alignment < 1 or alignment & (alignment - 1):
+            raise ValueError("Alignment has to be a power of two")
+        self._kernel = kernel
+        self._chunk_size = chunk_size
+        self._alignment = alignment
+        self._chunks = []       # (address, size) of all chunks, kept over resets
+        self._current = 0       # index of the chunk allocations are served from
+        self._offset = 0        # next free offset in the current chunk
+        self._used = 0          # bytes handed out by the chunks before the current one
+
+    @property
+    def chunks(self):
+        return list(self._chunks)
+
+    @property
+    def bytes_in_use(self):
+        """ returns the bytes handed out since the last reset, including alignment padding
+        """
+        return self._used + self._offset if self._chunks else 0
+
+    def allocate(self, size):
+        """ allocate a block that lives until the next reset() or release()
+
+        :return: the address of the block
+        """
+        if size < 0:
+            raise ValueError("Can't allocate {} bytes".format(size))
+
+        alignment = self._alignment
+        if self._current < len(self._chunks):
+            address, chunk_size = self._chunks[self._current]
+            offset = ((address + self._offset + alignment - 1) & -alignment) - address
+            if offset + size <= chunk_size:
+                self._offset = offset + size
+                return address + offset
+            self._used += self._offset
+            self._current += 1
+
+        # move on to the next kept chunk if it's large enough, otherwise insert a new one
+        if self._current < len(self._chunks):
+            address, chunk_size = self._chunks[self._current]
+            offset = ((address + alignment - 1) & -alignment) - address
+        if self._current == len(self._chunks) or offset + size > chunk_size:
+            address, chunk_size = self._allocate_chunk(max(size, self._chunk_size))
+            offset = ((address + alignment - 1) & -alignment) - address
+            if offset + size > chunk_size:
+                # no room for the padding in front of the block in an unaligned chunk
+                self._kernel.free(address)
+                address, chunk_size = self._allocate_chunk(size + alignment - 1)
+                offset = ((address + alignment - 1) & -alignment) - address
+            self._chunks.insert(self._current, (address, chunk_size))
+        self._offset = offset + size
+        return address + offset
+
+    def _allocate_chunk(self, size):
+        address = self._kernel.allocate(size)
+        if address is None:
+            raise ArenaError("Couldn't allocate a chunk of {} bytes".format(size))
+        return address, size
+
+    def reset(self):
+        """ free all blocks at once, the chunks are kept and reused
+        """
+        self._current = 0
+        self._offset = 0
+        self._used = 0
+
+    def release(self):
+        """ free all blocks and return the chunks to the kernel
+        """
+        for address, size in self._chunks:
+            self._kernel.free(address)
+        self._chunks = []
+        self.reset()
@@ -0,0 +1,191 @@
+import re
+
+import register
+
+from instruction import Instruction, Register, Immediate, Memory, Label
+
+# bump whenever the output of assemble() changes, cached object files depend on it
+VERSION = 4
+
+# mnemonics and the amount of operands they take
+MNEMONICS = {
+    'NOP': (0,),
+    'LOCK': (0,),
+    'MOV': (2,),
+    'INC': (1,),
+    'DEC': (1,),
+    'PUSH': (1,),
+    'POP': (0, 1),
+    'PUSHA': (0,),
+    'POPA': (0,),
+    'CALL': (1,),
+    'RET': (0, 1),
+    'ENTER': (1, 2),
+    'LEAVE': (0,),
+    'INT': (1,),
+    'JMP': (1,),
+    'JC': (1,),
+    'JNC': (1,),
+    'CLC': (0,),
+    'STC': (0,),
+    'LOOP': (1,),
+}
+
+SIZES = {'byte': 8, 'word': 16, 'dword': 32}
+
+_NUMBER = re.compile(r'^[-+]?(0x[0-9a-f]+|[0-9][0-9a-f]*h|0b[01]+|[0-9]+)$')
+_IDENTIFIER = re.compile(r'^[A-Za-z_.][A-Za-z0-9_.]*$')
+
+
+class AssemblerError(Exception):
+    def __init__(self, line, message):
+        super().__init__("line {}: {}".format(line, message))
+        self.line = line
+
+
+class Program(object):
+    """ Assembled program
+
+    instructions holds the decoded instructions, labels maps every label to the index of the
+    instruction it points to.
+    """
+
+    def __init__(self, instructions, labels):
+        self.instructions = instructions
+        self.labels = labels
+
+
+def assemble(source):
+    """ assemble a program in a single pass over the source
+
+    Syntax, one instruction per line:
+        label:  mnemonic operand, operand     ; comment
+
+    Operands are registers, immediates (123, -5, 0x7b, 7bh, 0b1111011), labels and memory
+    operands like [ebx], [ebx+4] or dword [0x1000]. The LOCK prefix goes in front of the
+    instruction it makes atomic, on the same line or the line before.
+
+    :param source: the source code as string
+    :return: the assembled Program
+    """
+    instructions = []
+    labels = {}
+    fixups = []
+
+    for number, line in enumerate(source.splitlines(), 1):
+        code = line.split(';', 1)[0].strip()
+
+        if ':' in code:
+            label, _, code = code.partition(':')
+            label = label.strip()
+            if not _IDENTIFIER.match(label) or register.resolve(label) is not None:
+                raise AssemblerError(number, "invalid label '{}'".format(label))
+            if label in labels:
+                raise AssemblerError(number, "label '{}' is already defined".format(label))
+            labels[label] = len(instructions)
+            code = code.strip()
+
+        if not code:
+            continue
+
+        parts = code.split(None, 1)
+        mnemonic = parts[0].upper()
+
+        # prefix on the same line as the instruction it applies to, 'lock inc dword [ebx]'
+        if mnemonic == 'LOCK' and len(parts) > 1:
+            instructions.append(Instruction(mnemonic, [], number))
+            parts = parts[1].split(None, 1)
+            mnemonic = parts[0].upper()
+
+        if mnemonic not in MNEMONICS:
+            raise AssemblerError(number, "unknown instruction '{}'".format(parts[0]))
+
+        operands = [o.strip() for o in parts[1].split(',')] if len(parts) > 1 else []
+        if len(operands) not in MNEMONICS[mnemonic]:
+            raise AssemblerError(number, "{} takes {} operand(s)".format(
+                mnemonic, " or ".join(str(n) for n in MNEMONICS[mnemonic])))
+
+        ins = Instruction(mnemonic, [_parse_operand(o, number) for o in operands], number)
+        for index, operand in enumerate(ins.parameters):
+            if isinstance(operand, Label):
+                fixups.append((ins, index))
+        instructions.append(ins)
+
+    for ins, index in fixups:
+        name = ins.parameters[index].name
+        if name not in labels:
+            raise AssemblerError(ins.line, "undefined label '{}'".format(name))
+        ins.parameters[index] = Label(name, labels[name])
+
+    return Program(instructions, labels)
+
+
+def parse_number(text):
+    """ returns the value of a decimal, hex (0x.. or ..h) or binary (0b..) literal or None
+    """
+    text = text.lower()
+    if not _NUMBER.match(text):
+        return None
+    sign = -1 if text[0] == '-' else 1
+    text = text.lstrip('+-')
+    if text.startswith('0x'):
+        return sign * int(text[2:], 16)
+    if text.endswith('h'):
+        return sign * int(text[:-1], 16)
+    if text.startswith('0b'):
+        return sign * int(text[2:], 2)
+    return sign * int(text)
+
+
+def _parse_operand(text, number):
+    if not text:
+        raise AssemblerError(number, "missing operand")
+
+    size = None
+    words = text.split(None, 1)
+    if words[0].lower() in SIZES and len(words) > 1:
+        size = SIZES[words[0].lower()]
+        text = words[1]
+        if text.lower().startswith('ptr'):
+            text = text[3:].strip()
+
+    if text.startswith('['):
+        if not text.endswith(']'):
+            raise AssemblerError(number, "missing ']' in '{}'".format(text))
+        return _parse_memory(text[1:-1], size, number)
+    if size is not None:
+        raise AssemblerError(number, "size only allowed for memory operands")
+
+    reg = register.resolve(text)
+    if reg is not None:
+        return Register(text.upper(), reg)
+
+    value = parse_number(text)
+    if value is not None:
+        return Immediate(value)
+
+    if _IDENTIFIER.match(text):
+        return Label(text, None)
+
+    raise AssemblerError(number, "invalid operand '{}'".format(text))
+
+
+def _parse_memory(text, size, number):
+    base = None
+    displacement = 0
+    for term in re.findall(r'[-+]?[^-+]+', text.replace(' ', '')):
+        reg = register.resolve(term.lstrip('+'))
+        if reg is not None:
+            if base is not None:
+                raise AssemblerError(number, "only one register allowed in '[{}]'".format(text))
+            base = reg
+            continue
+
+        value = parse_number(term)
+        if value is None:
+            raise AssemblerError(number, "invalid memory operand '[{}]'".format(text))
+        displacement += value
+
+    if base is not None and register.width(base) != 32:
+        raise AssemblerError(number, "memory operands need a 32 bit base register")
+    return Memory(base, displacement & 0xffffffff, size)
@@ -0,0 +1,76 @@
+""" Allocation throughput of the kernel heap and of stdlib.malloc(), which serves small blocks from slabs
+
+Allocates and frees 100k blocks of random size, keeping up to 1000 of them alive at a time.
+
+Run from the repository root:
+    python -m benchmarks.allocator
+"""
+import logging
+import random
+import time
+
+import stdlib
+from machine import Machine, current_machine
+
+BLOCKS = 100000
+LIVE = 1000
+
+
+def run(name, allocate, free):
+    rnd = random.Random(42)
+    live = []
+    failed = 0
+    start = time.perf_counter()
+    for _ in range(BLOCKS):
+        if len(live) >= LIVE:
+            free(live.pop(rnd.randrange(len(live))))
+        try:
+            address = allocate(rnd.randint(1, 48))
+        except Exception:
+            address = None
+        if address is None:
+            failed += 1
+        else:
+            live.append(address)
+    for address in live:
+        free(address)
+    seconds = time.perf_counter() - start
+
+    print("{:<8} {:,} allocations and frees in {:.3f}s: {:,.0f} pairs/s ({} failed)".format(
+        name, BLOCKS, seconds, BLOCKS / seconds, failed))
+
+
+def scratch(name, requests, allocate, done):
+    """ every request allocates 32 scratch buffers and drops them all at the end
+    """
+    rnd = random.Random(42)
+    start = time.perf_counter()
+    for _ in range(requests):
+        buffers = [allocate(rnd.randint(16, 256)) for _ in range(32)]
+        done(buffers)
+    seconds = time.perf_counter() - start
+    print("{:<8} {:,} requests with 32 scratch buffers in {:.3f}s: {:,.0f} requests/s".format(
+        name, requests, seconds, requests / seconds))
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    kernel = Machine().kernel
+    run("kernel", kernel.allocate_memory, kernel.free_memory)
+    run("stdlib", stdlib.malloc, stdlib.free)
+
+    stats = current_machine().kernel.memory_statistics()
+    print("stdlib   allocation latency p50 <= {} ns, p99 <= {} ns, high water mark {:,} bytes".format(
+        stats.allocation_latency.percentile(50), stats.allocation_latency.percentile(99), stats.high_water_mark))
+
+    def free_all(buffers):
+        for address in buffers:
+            stdlib.free(address)
+    scratch("free", 5000, stdlib.malloc, free_all)
+    arena = stdlib.arena()
+    scratch("arena", 5000, arena.allocate, lambda buffers: arena.reset())
+    arena.release()
+
+
+if __name__ == '__main__':
+    main()
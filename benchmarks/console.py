@@ -0,0 +1,61 @@
+""" Lines per second printed through sys_write and the TextConsole
+
+Run from the repository root:
+    python -m benchmarks.console
+"""
+import logging
+import time
+
+from framebuffer import HeadlessScreen
+from machine import Machine
+
+LINES = 5000
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    machine = Machine(screen=HeadlessScreen())
+    core = machine.core
+    kernel = machine.kernel
+
+    message = b"log line: everything is fine\n"
+    core.set_memory_range(0x100, message)
+    start = time.perf_counter()
+    for _ in range(LINES):
+        core.EAX = 4
+        core.EBX = 1
+        core.ECX = 0x100
+        core.EDX = len(message)
+        kernel.interrupt(0x80)
+    seconds = time.perf_counter() - start
+    print("{:<32} {:>10,.0f} lines/s".format("sys_write, one line each", LINES / seconds))
+
+    console = kernel.console
+    start = time.perf_counter()
+    for n in range(LINES):
+        console.write("line {}: everything is fine\n".format(n))
+    console.flush()
+    seconds = time.perf_counter() - start
+    print("{:<32} {:>10,.0f} lines/s".format("console, one flush", LINES / seconds))
+
+    # area presenters have to update for a few changed characters and for an idle screen
+    screen = machine.screen
+    areas = []
+    screen.present = lambda frame, damage: areas.append(sum(rect.width * rect.height for rect in damage))
+    console.move_cursor(0, 0)
+    for n in range(100):
+        console.write("{:3}".format(n))
+        console.move_cursor(0, 0)
+        console.flush()
+    print("{:<32} {:>9.1f}% of the screen".format("damage of a 3 character update",
+                                                  100.0 * sum(areas) / len(areas) / len(screen.pixels)))
+
+    start = time.perf_counter()
+    for _ in range(LINES):
+        console.flush()
+    seconds = time.perf_counter() - start
+    print("{:<32} {:>10,.2f} us, {} frames".format("idle flush", seconds / LINES * 1e6, len(areas) - 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+""" Runs per second of one program over many initial states
+
+Compares a loop creating a Core and an Interpreter for every state with the Fleet runner,
+in process and with one worker process per host core.
+
+Run from the repository root:
+    python -m benchmarks.fleet
+"""
+import logging
+import os
+import time
+
+from assembler import assemble
+from core import Core
+from fleet import Fleet, State
+from interpreter import Interpreter
+
+SOURCE = """
+            mov ecx, 200
+    top:    inc eax
+            dec ebx
+            loop top
+            mov [0x100], eax
+"""
+RUNS = 2000
+
+
+def states():
+    return (State({'EAX': n, 'EBX': n * 3}) for n in range(RUNS))
+
+
+def report(name, seconds):
+    print("{:<24} {:,} runs in {:.3f}s: {:>8,.0f} runs/s".format(name, RUNS, seconds, RUNS / seconds))
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    program = assemble(SOURCE)
+
+    start = time.perf_counter()
+    for state in states():
+        core = Core()
+        core.EAX = state.registers['EAX']
+        core.EBX = state.registers['EBX']
+        Interpreter(program.instructions, core=core).run()
+        core.read_memory(0x100, 4)
+    report("loop", time.perf_counter() - start)
+
+    for workers in (0, os.cpu_count() or 1):
+        start = time.perf_counter()
+        with Fleet(program, workers=workers, read=[(0x100, 4)]) as fleet:
+            for result in fleet.map(states()):
+                pass
+        report("fleet, {} workers".format(workers), time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+""" Instructions per second of Interpreter.run
+
+Run from the repository root:
+    python -m benchmarks.interpreter
+"""
+import logging
+import time
+
+from assembler import assemble
+from blockcompiler import BlockInterpreter
+from interpreter import Interpreter
+
+BLOCK = """
+    mov eax, 5
+    inc eax
+    dec ebx
+    mov ecx, eax
+    mov dl, 0x7f
+    inc dl
+"""
+REPEAT = 5000
+
+LOOP = """
+    mov ecx, {}
+top:
+    inc eax
+    dec ebx
+    mov edx, eax
+    mov bl, 0x7f
+    loop top
+"""
+ITERATIONS = 50000
+
+STACK = """
+    mov ecx, {}
+top:
+    push eax
+    push ebx
+    pop edx
+    pop ebx
+    loop top
+"""
+
+CALL = """
+    mov ecx, {}
+top:
+    call save
+    loop top
+    jmp done
+save:
+    enter 8
+    pusha
+    inc eax
+    popa
+    leave
+    ret
+done:
+"""
+
+
+def measure(name, instructions, count, engine=Interpreter):
+    interpreter = engine(instructions)
+    start = time.perf_counter()
+    interpreter.run()
+    seconds = time.perf_counter() - start
+    print("{:<24} {:>9,} instructions in {:.3f}s: {:>10,.0f} instructions/s".format(
+        name, count, seconds, count / seconds))
+    return interpreter
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    program = assemble(BLOCK * REPEAT)
+    measure("straight line", program.instructions, len(program.instructions))
+    measure("straight line, blocks", program.instructions, len(program.instructions), BlockInterpreter)
+
+    program = assemble(LOOP.format(ITERATIONS))
+    measure("loop", program.instructions, 1 + ITERATIONS * 5)
+    measure("loop, blocks", program.instructions, 1 + ITERATIONS * 5, BlockInterpreter)
+
+    program = assemble(STACK.format(ITERATIONS))
+    measure("push/pop", program.instructions, 1 + ITERATIONS * 5)
+    measure("push/pop, blocks", program.instructions, 1 + ITERATIONS * 5, BlockInterpreter)
+
+    program = assemble(CALL.format(ITERATIONS))
+    measure("call/pusha", program.instructions, 2 + ITERATIONS * 8)
+    measure("call/pusha, blocks", program.instructions, 2 + ITERATIONS * 8, BlockInterpreter)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+""" Inputs per second of the NumPy lane engine compared to one Core per input
+
+Run from the repository root:
+    python -m benchmarks.lanes
+"""
+import logging
+import time
+
+import numpy as np
+
+import register
+from assembler import assemble
+from blockcompiler import BlockInterpreter
+from core import Core
+from lanes import LaneCore, LaneInterpreter
+
+SOURCE = """
+            mov ecx, 100
+    top:    inc eax
+            dec ebx
+            mov [0x100], eax
+            jnc skip
+            mov edx, eax
+    skip:   loop top
+"""
+LANES = 1000
+
+
+def report(name, seconds):
+    print("{:<16} {:,} inputs in {:.3f}s: {:>10,.0f} inputs/s".format(name, LANES, seconds, LANES / seconds))
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    program = assemble(SOURCE)
+    eax = np.arange(LANES, dtype=np.int64) * 7919
+    ebx = np.arange(LANES, dtype=np.int64) % 50
+
+    start = time.perf_counter()
+    for lane in range(LANES):
+        core = Core()
+        core.EAX = int(eax[lane])
+        core.EBX = int(ebx[lane])
+        BlockInterpreter(program.instructions, core=core).run()
+    report("cores, blocks", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    lanes = LaneCore(LANES)
+    lanes.mov_reg(register.EAX, eax)
+    lanes.mov_reg(register.EBX, ebx)
+    LaneInterpreter(program.instructions, lanes).run()
+    report("lanes", time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+""" Typed memory access throughput of Core
+
+Run from the repository root:
+    python -m benchmarks.memory
+"""
+import logging
+import timeit
+
+from core import Core
+
+NUMBER = 100000
+
+
+def bench(statement, core):
+    seconds = timeit.timeit(statement, globals={'core': core}, number=NUMBER)
+    return NUMBER / seconds
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    core = Core()
+    core.write_memory(0x1000, bytes(range(256)))
+
+    for statement in ("sum(core.get_memory_location(0x1000 + i) << (8 * i) for i in range(4))",
+                      "core.read_u32(0x1000)",
+                      "core.read_i32(0x1000)",
+                      "core.read_u32(0x0ffe)",
+                      "[core.set_memory_location(0x1000 + i, 0x12345678 >> (8 * i)) for i in range(4)]",
+                      "core.write_u32(0x1000, 0x12345678)",
+                      "[core.read_u32(0x1000 + 4 * i) for i in range(64)]",
+                      "core.read_u32_array(0x1000, 64)"):
+        print("{:<80} {:>12,.0f} ops/s".format(statement, bench(statement, core)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+""" Register get/set throughput of Core
+
+Run from the repository root:
+    python -m benchmarks.registers
+"""
+import logging
+import timeit
+
+import register
+from core import Core
+
+NUMBER = 200000
+
+
+def bench(statement, core):
+    seconds = timeit.timeit(statement, globals={'core': core, 'r': register.REGISTERS}, number=NUMBER)
+    return NUMBER / seconds
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    core = Core()
+
+    for statement in ("core.EAX = 0x12345678",
+                      "core.EAX",
+                      "core.AX = 0x1234",
+                      "core.AX",
+                      "core.AH = 0x12",
+                      "core.AH",
+                      "core.AL = 0x12",
+                      "core.AL",
+                      "core.inc('ECX')",
+                      "core.inc_reg(r['ECX'])",
+                      "core.mov_reg_imm(r['AL'], 0x12)",
+                      "core.get_reg(r['AL'])"):
+        print("{:<32} {:>12,.0f} ops/s".format(statement, bench(statement, core)))
+
+
+if __name__ == '__main__':
+    main()
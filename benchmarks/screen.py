@@ -0,0 +1,85 @@
+""" Drawing throughput of the screens
+
+Run from the repository root:
+    python -m benchmarks.screen
+
+ScreenEGA is only measured if PyQt5 is installed.
+"""
+import logging
+import time
+
+from framebuffer import HeadlessScreen, SCREEN_WIDTH, SCREEN_HEIGHT
+
+# one full screen of palette indices
+PATTERN = bytes((x ^ y) & 0x0f for y in range(SCREEN_HEIGHT) for x in range(SCREEN_WIDTH))
+
+
+def measure(name, screen, count):
+    start = time.perf_counter()
+    for i in range(count):
+        screen.set_pixel(i % SCREEN_WIDTH, (i // SCREEN_WIDTH) % SCREEN_HEIGHT, i & 0x0f)
+    seconds = time.perf_counter() - start
+    print("{:<28} {:>12,.0f} pixels/s".format(name + " set_pixel", count / seconds))
+
+    start = time.perf_counter()
+    for i in range(count // 64):
+        screen.set_character(0x41 + i % 26, i % 40, (i // 40) % 25, 1 + i % 15)
+    seconds = time.perf_counter() - start
+    print("{:<28} {:>12,.0f} chars/s".format(name + " set_character", count // 64 / seconds))
+
+    start = time.perf_counter()
+    for y in range(SCREEN_HEIGHT):
+        for x in range(SCREEN_WIDTH):
+            screen.set_pixel(x, y, (x ^ y) & 0x0f)
+    screen.update_screen_buffer()
+    seconds = time.perf_counter() - start
+    print("{:<28} {:>12.1f} ms".format(name + " full redraw", seconds * 1000))
+
+    start = time.perf_counter()
+    for _ in range(100):
+        screen.blit(0, 0, SCREEN_WIDTH, PATTERN)
+        screen.update_screen_buffer()
+    print("{:<28} {:>12.2f} ms".format(name + " full blit", (time.perf_counter() - start) / 100 * 1000))
+
+
+def text(name, set_character, screens=20):
+    """ fill the 40x25 text screen with characters
+    """
+    start = time.perf_counter()
+    for n in range(screens):
+        for y in range(25):
+            for x in range(40):
+                set_character(0x20 + (x + y + n) % 95, x, y, 1 + (x + n) % 15)
+    seconds = time.perf_counter() - start
+    print("{:<28} {:>12,.0f} chars/s".format(name, screens * 1000 / seconds))
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    screen = HeadlessScreen()
+    text("text fill, glyph runs", screen.set_character)
+    text("text fill, cached tiles", lambda c, x, y, color: screen.set_character(c, x, y, color, 0))
+    for scale in (1, 3, 4):
+        screen = HeadlessScreen(scale=scale)
+        measure("headless scale {}".format(scale), screen, 200000)
+
+        start = time.perf_counter()
+        for _ in range(20):
+            screen.to_png()
+        print("{:<28} {:>12.1f} ms".format("headless scale {} png".format(scale),
+                                           (time.perf_counter() - start) / 20 * 1000))
+
+    try:
+        from PyQt5.QtWidgets import QApplication
+    except ImportError:
+        print("PyQt5 isn't installed, skipping ScreenEGA")
+        return
+    from screen import ScreenEGA
+
+    app = QApplication([])
+    for scale in (1, 3, 4):
+        measure("qt scale {}".format(scale), ScreenEGA(scale=scale), 200000)
+
+
+if __name__ == '__main__':
+    main()
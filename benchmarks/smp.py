@@ -0,0 +1,41 @@
+""" Instructions per second of the SMP machine with an increasing number of cores
+
+Every core runs the same loop on its own counter, so the work is embarrassingly parallel and the
+total throughput should grow with the number of host cores.
+
+Run from the repository root:
+    python -m benchmarks.smp
+"""
+import logging
+import multiprocessing
+import time
+
+from assembler import assemble
+from smp import SMP
+
+SOURCE = """
+            mov ecx, 100000
+    top:    inc dword [esi]
+            inc eax
+            loop top
+            lock inc dword [0x100]
+"""
+INSTRUCTIONS = 1 + 100000 * 3 + 1
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    program = assemble(SOURCE)
+    counts = sorted({1, 2, multiprocessing.cpu_count()})
+    for cpus in counts:
+        with SMP(program, cpus=cpus) as smp:
+            start = time.perf_counter()
+            smp.run(registers=[{'ESI': 0x1000 + cpu * 4} for cpu in range(cpus)])
+            seconds = time.perf_counter() - start
+        total = INSTRUCTIONS * cpus
+        print("{:>2} cores: {:>10,} instructions in {:.3f}s: {:>10,.0f} instructions/s".format(
+            cpus, total, seconds, total / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,471 @@
+import register
+
+from core import PUSHA
+from instruction import Register, Immediate, Memory, Label
+from interpreter import Interpreter, InterpreterError
+from memory import HOT_MASK, PAGE_SIZE
+
+BRANCHES = ('JMP', 'JC', 'JNC', 'LOOP', 'CALL', 'RET')
+
+# instructions ending a basic block, INT hands over to the kernel which works on the real registers
+TERMINATORS = BRANCHES + ('INT',)
+
+# longer straight line runs are split, compiling huge functions costs more than it saves
+MAX_BLOCK_LENGTH = 128
+
+
+class BlockInterpreter(Interpreter):
+    """ Interpreter compiling basic blocks to Python functions
+
+    The program is split into basic blocks at labels and branches. On its first execution, every block
+    is translated into Python source and compiled into one function. The function keeps the registers
+    it uses in local variables and only writes them back to the register file when the block is left.
+    Compiled blocks are cached by their start index until the program gets replaced with load().
+
+    The generated code doesn't log or trace, with verbose set or a trace attached to the core the
+    instruction closures of the Interpreter are used instead.
+    """
+
+    def __init__(self, instructions, core=None, kernel=None, verbose=False):
+        self._blocks = {}
+        self._leaders = None
+        super().__init__(instructions, core=core, kernel=kernel, verbose=verbose)
+
+    def load(self, instructions):
+        super().load(instructions)
+        self._blocks = {}
+        self._leaders = None
+
+    def run(self):
+        if self._verbose or self._core.trace is not None:
+            super().run()
+            return
+
+        if self._leaders is None:
+            self._leaders = self._find_leaders()
+
+        blocks = self._blocks
+        end = len(self._instructions)
+        pc = 0
+        while pc < end:
+            block = blocks.get(pc)
+            if block is None:
+                block = blocks[pc] = self.compile_block(pc)
+            pc = block()
+
+    def _find_leaders(self):
+        """ returns the indices of all instructions starting a basic block
+        """
+        leaders = {0}
+        for index, ins in enumerate(self._instructions):
+            if ins.instruction in TERMINATORS:
+                leaders.add(index + 1)
+            for operand in ins.parameters:
+                if isinstance(operand, Label):
+                    leaders.add(operand.target)
+        return leaders
+
+    def compile_block(self, start):
+        """ compile the basic block starting at the given instruction
+
+        :return: function executing the block and returning the index of the next instruction
+        """
+        if self._leaders is None:
+            self._leaders = self._find_leaders()
+
+        block = _Block(self._core, self._kernel)
+        index = start
+        while index < len(self._instructions):
+            ins = self._instructions[index]
+            index += 1
+            block.add(ins, index)
+            if ins.instruction == 'LOCK':
+                continue        # never split a prefix from its instruction
+            if ins.instruction in TERMINATORS or index in self._leaders or index - start >= MAX_BLOCK_LENGTH:
+                break
+        return block.build(start, index)
+
+
+class _Block(object):
+    """ Python source of a single basic block
+    """
+
+    def __init__(self, core, kernel):
+        self._core = core
+        self._kernel = kernel
+        self._body = []
+        self._exit = None
+        self._used = set()          # register file slots kept in locals
+        self._modified = set()      # slots that need to be written back
+        self._carry = False         # whether the block can set the carry flag
+        self._stack = False         # whether the block pushes or pops single entries
+        self._indexed = False       # whether ESP may be held as index i into the hot page instead of r5
+        self._lock = None           # pending LOCK prefix
+
+    def build(self, start, nxt):
+        if self._lock is not None:
+            raise InterpreterError(self._lock.line, "LOCK needs a following instruction")
+
+        lines = []
+        for slot in sorted(self._used):
+            lines.append("r{0} = regs[{0}]".format(slot))
+        if self._carry:
+            lines.append("cf = 0")
+        if self._stack:
+            lines.append("hot = memory.hot")
+            lines.append("words = memory.hot_words")
+            lines.append("i = -1")
+        lines.append("try:")
+        lines.extend("    " + line for line in self._body or ["pass"])
+        lines.append("finally:")
+        if self._stack:
+            lines.extend("    " + line for line in self._materialize())
+        for slot in sorted(self._modified):
+            lines.append("    regs[{0}] = r{0}".format(slot))
+        if self._carry:
+            lines.append("    if cf:")
+            lines.append("        set_flags(0x01)")
+        if not self._modified and not self._carry:
+            lines.append("    pass")
+        lines.extend(self._exit or ["return {}".format(nxt)])
+
+        namespace = {}
+        source = "def block(regs=regs, core=core, read_memory=core.memory.read, write_memory=core.memory.write, " \
+                 "memory=core.memory, read_u32=core.memory.read_u32, write_u32=core.memory.write_u32, " \
+                 "pack_all=PUSHA.pack, unpack_all=PUSHA.unpack, set_flags=core.set_flags, " \
+                 "clear_flags=core.clear_flags, inc_memory=core.inc_memory, dec_memory=core.dec_memory, " \
+                 "lock=core.memory_lock, from_bytes=int.from_bytes, interrupt=interrupt):\n"
+        source += "".join("    {}\n".format(line) for line in lines)
+        code = compile(source, "<block {:04X}>".format(start), "exec")
+        exec(code, {
+            'regs': self._core.register_file,
+            'core': self._core,
+            'PUSHA': PUSHA,
+            'interrupt': self._kernel.interrupt if self._kernel is not None else None
+        }, namespace)
+        return namespace['block']
+
+    def add(self, ins, nxt):
+        if ins.instruction == 'LOCK':
+            self._lock = ins
+            return
+
+        compiler = getattr(self, "_compile_" + ins.instruction.lower(), None)
+        if compiler is None:
+            raise InterpreterError(ins.line, "unsupported instruction '{}'".format(ins.instruction))
+
+        if self._lock is None:
+            compiler(ins, nxt)
+            return
+
+        # compile the locked instruction on its own and wrap it into the lock
+        if ins.instruction not in ('INC', 'DEC') or not isinstance(ins.parameters[0], Memory):
+            raise InterpreterError(self._lock.line, "LOCK can only be used with INC or DEC on memory")
+        self._lock = None
+        body = self._body
+        self._body = []
+        compiler(ins, nxt)
+        body.append("with lock:")
+        body.extend("    " + line for line in self._body)
+        self._body = body
+
+    """ Operand helpers
+    """
+    def _local(self, reg):
+        slot = register.OPERANDS[reg][0]
+        self._used.add(slot)
+        if slot == register.ESP and self._indexed:
+            self._body.extend(self._materialize())
+            self._body.append("i = -1")
+            self._indexed = False
+        return "r{}".format(slot)
+
+    def _address(self, operand):
+        if operand.base is None:
+            return str(operand.displacement)
+        return "(({} + {}) & 0xffffffff)".format(self._get(operand.base), operand.displacement)
+
+    def _get(self, reg):
+        slot, shift, mask, keep = register.OPERANDS[reg]
+        local = self._local(reg)
+        if shift:
+            local = "({} >> {})".format(local, shift)
+        if mask != 0xffffffff:
+            local = "({} & {})".format(local, hex(mask))
+        return local
+
+    def _size(self, operand, size, ins):
+        size = operand.size or size
+        if size is None:
+            raise InterpreterError(ins.line, "operand size unknown, use byte, word or dword")
+        return size
+
+    def _value(self, operand, size, ins):
+        """ returns an expression for the value of an operand and the largest value it can have
+        """
+        if isinstance(operand, Immediate):
+            return "({})".format(operand.value), operand.value
+        if isinstance(operand, Register):
+            return self._get(operand.id), register.OPERANDS[operand.id][2]
+        if isinstance(operand, Memory):
+            number = self._size(operand, size, ins) // 8
+            return "from_bytes(read_memory({}, {}), 'little')".format(self._address(operand), number), \
+                (1 << (number * 8)) - 1
+        raise InterpreterError(ins.line, "invalid operand {}".format(operand))
+
+    def _set(self, reg, expression, maximum=0xffffffff, negative=False):
+        """ emit an assignment to a register with the carry semantics of Core.mov_reg_imm()
+        """
+        slot, shift, mask, keep = register.OPERANDS[reg]
+        local = self._local(reg)
+        self._modified.add(slot)
+
+        if maximum > mask or negative:
+            self._carry = True
+            self._body.append("t = {}".format(expression))
+            self._body.append("if t > {} or t < 0:".format(hex(mask)))
+            self._body.append("    cf = 1")
+            expression = "t"
+
+        if mask == 0xffffffff:
+            self._body.append("{} = {} & 0xffffffff".format(local, expression))
+        else:
+            self._body.append("{0} = ({0} & {1}) | (({2} & {3}) << {4})".format(
+                local, hex(keep), expression, hex(mask), shift))
+
+    def _register(self, ins):
+        operand = ins.parameters[0]
+        if not isinstance(operand, Register):
+            raise InterpreterError(ins.line, "{} needs a register".format(ins.instruction))
+        return operand.id
+
+    def _label(self, ins):
+        operand = ins.parameters[0]
+        if not isinstance(operand, Label):
+            raise InterpreterError(ins.line, "{} needs a label".format(ins.instruction))
+        return operand.target
+
+    """ Instructions
+    """
+    def _compile_nop(self, ins, nxt):
+        pass
+
+    def _compile_mov(self, ins, nxt):
+        target, src = ins.parameters
+
+        if isinstance(target, Register):
+            if isinstance(src, Immediate):
+                self._set(target.id, "({})".format(src.value), src.value, src.value < 0)
+            else:
+                expression, maximum = self._value(src, register.width(target.id), ins)
+                self._set(target.id, expression, maximum)
+            return
+
+        if isinstance(target, Memory):
+            width = register.width(src.id) if isinstance(src, Register) else None
+            number = self._size(target, width, ins) // 8
+            expression, maximum = self._value(src, number * 8, ins)
+            self._body.append("write_memory({}, ({} & {}).to_bytes({}, 'little'))".format(
+                self._address(target), expression, hex((1 << (number * 8)) - 1), number))
+            return
+
+        raise InterpreterError(ins.line, "invalid MOV target {}".format(target))
+
+    def _compile_memory_update(self, ins, update):
+        operand = ins.parameters[0]
+        self._body.append("{}({}, {})".format(update, self._address(operand), self._size(operand, None, ins) // 8))
+
+    def _compile_inc(self, ins, nxt):
+        if isinstance(ins.parameters[0], Memory):
+            self._compile_memory_update(ins, "inc_memory")
+            return
+        reg = self._register(ins)
+        slot, shift, mask, keep = register.OPERANDS[reg]
+        local = self._local(reg)
+        self._modified.add(slot)
+        self._carry = True
+        self._body.append("if {} == {}:".format(self._get(reg), hex(mask)))
+        self._body.append("    {0} &= {1}".format(local, hex(keep)))
+        self._body.append("    cf = 1")
+        self._body.append("else:")
+        self._body.append("    {} += {}".format(local, 1 << shift))
+
+    def _compile_dec(self, ins, nxt):
+        if isinstance(ins.parameters[0], Memory):
+            self._compile_memory_update(ins, "dec_memory")
+            return
+        reg = self._register(ins)
+        slot, shift, mask, keep = register.OPERANDS[reg]
+        local = self._local(reg)
+        self._modified.add(slot)
+        self._carry = True
+        self._body.append("if {} == 0:".format(self._get(reg)))
+        self._body.append("    {0} |= {1}".format(local, hex(mask << shift)))
+        self._body.append("    cf = 1")
+        self._body.append("else:")
+        self._body.append("    {} -= {}".format(local, 1 << shift))
+
+    def _push(self, expression, exact=False):
+        """ emit a push of a 32 bit value onto the stack at ESP, exact expressions are known to be
+        in range and don't need to be masked
+
+        Runs of pushes and pops on the hot page of the memory work on its hot_words directly. ESP is
+        kept as the word index i into the page meanwhile, r5 is only brought up to date when the block
+        uses ESP otherwise or is left. Nothing within a block can invalidate the hot page.
+        """
+        self._stack_index()
+        if not exact or expression == "r{}".format(register.ESP):
+            self._body.append("v = {} & 0xffffffff".format(expression))
+            expression = "v"
+        self._body.append("if i > 0:")
+        self._body.append("    i -= 1")
+        self._body.append("    words[i] = {}".format(expression))
+        self._body.append("else:")
+        self._body.extend("    " + line for line in self._materialize())
+        self._body.append("    r{0} = (r{0} - 4) & 0xffffffff".format(register.ESP))
+        self._body.append("    write_u32(r{}, {})".format(register.ESP, expression))
+        self._body.extend("    " + line for line in self._reindex())
+
+    def _pop(self, target="v"):
+        """ emit a pop from the stack at ESP into the local target
+        """
+        self._stack_index()
+        self._body.append("if 0 <= i < {}:".format(PAGE_SIZE >> 2))
+        self._body.append("    {} = words[i]".format(target))
+        self._body.append("    i += 1")
+        self._body.append("else:")
+        self._body.extend("    " + line for line in self._materialize())
+        self._body.append("    {} = read_u32(r{})".format(target, register.ESP))
+        self._body.append("    r{0} = (r{0} + 4) & 0xffffffff".format(register.ESP))
+        self._body.extend("    " + line for line in self._reindex())
+
+    def _stack_index(self):
+        self._used.add(register.ESP)
+        self._modified.add(register.ESP)
+        self._stack = True
+        if not self._indexed:
+            self._body.extend(self._reindex(reload=False))
+            self._indexed = True
+
+    @staticmethod
+    def _reindex(reload=True):
+        """ lines setting i to the index of ESP into the hot page, -1 if it's elsewhere
+        The entry below ESP decides, so an empty stack at the end of the hot page is covered as well.
+        """
+        lines = ["hot = memory.hot", "words = memory.hot_words"] if reload else []
+        lines.append("t = (r{} - 4) & 0xffffffff".format(register.ESP))
+        lines.append("i = ((t - hot) >> 2) + 1 if t & {} == hot else -1".format(hex(HOT_MASK)))
+        return lines
+
+    @staticmethod
+    def _materialize():
+        """ lines bringing r5 up to date with i
+        """
+        return ["if i >= 0:", "    r{0} = (hot + (i << 2)) & 0xffffffff".format(register.ESP)]
+
+    def _compile_push(self, ins, nxt):
+        operand = ins.parameters[0]
+        expression, maximum = self._value(operand, 32, ins)
+        self._push(expression, isinstance(operand, Register) and maximum == 0xffffffff)
+
+    def _compile_pop(self, ins, nxt):
+        if not ins.parameters:
+            self._pop()
+            return
+        reg = self._register(ins)
+        if register.OPERANDS[reg][2] != 0xffffffff or reg == register.ESP:
+            self._pop()
+            self._set(reg, "v")
+            return
+        self._modified.add(register.OPERANDS[reg][0])
+        self._pop(self._local(reg))
+
+    def _compile_pusha(self, ins, nxt):
+        saved = [self._local(reg) for reg in (register.EDI, register.ESI, register.EBP, register.ESP,
+                                               register.EBX, register.EDX, register.ECX, register.EAX)]
+        esp = self._local(register.ESP)
+        self._modified.add(register.ESP)
+        self._body.append("v = pack_all({})".format(", ".join(saved)))
+        self._body.append("{0} = ({0} - {1}) & 0xffffffff".format(esp, PUSHA.size))
+        self._body.append("write_memory({}, v)".format(esp))
+
+    def _compile_popa(self, ins, nxt):
+        restored = []
+        for reg in (register.EDI, register.ESI, register.EBP, None, register.EBX, register.EDX, register.ECX, register.EAX):
+            if reg is None:
+                restored.append("v")
+            else:
+                restored.append(self._local(reg))
+                self._modified.add(reg)
+        esp = self._local(register.ESP)
+        self._modified.add(register.ESP)
+        self._body.append("{} = unpack_all(read_memory({}, {}))".format(", ".join(restored), esp, PUSHA.size))
+        self._body.append("{0} = ({0} + {1}) & 0xffffffff".format(esp, PUSHA.size))
+
+    def _compile_enter(self, ins, nxt):
+        size = ins.parameters[0]
+        if not isinstance(size, Immediate):
+            raise InterpreterError(ins.line, "ENTER needs an immediate")
+        if len(ins.parameters) > 1 and (not isinstance(ins.parameters[1], Immediate) or ins.parameters[1].value):
+            raise InterpreterError(ins.line, "ENTER only supports nesting level 0")
+        ebp = self._local(register.EBP)
+        self._modified.add(register.EBP)
+        self._push(ebp, True)
+        esp = self._local(register.ESP)
+        self._body.append("{} = {}".format(ebp, esp))
+        self._body.append("{0} = ({0} - {1}) & 0xffffffff".format(esp, size.value))
+
+    def _compile_leave(self, ins, nxt):
+        ebp = self._local(register.EBP)
+        esp = self._local(register.ESP)
+        self._modified.add(register.EBP)
+        self._modified.add(register.ESP)
+        self._body.append("{} = {}".format(esp, ebp))
+        self._pop(ebp)
+
+    def _compile_call(self, ins, nxt):
+        target = self._label(ins)
+        self._push(str(nxt), True)
+        self._exit = ["return {}".format(target)]
+
+    def _compile_ret(self, ins, nxt):
+        self._pop()
+        if ins.parameters:
+            release = ins.parameters[0]
+            if not isinstance(release, Immediate):
+                raise InterpreterError(ins.line, "RET needs an immediate")
+            esp = self._local(register.ESP)
+            self._body.append("{0} = ({0} + {1}) & 0xffffffff".format(esp, release.value))
+        self._exit = ["return v"]
+
+    def _compile_int(self, ins, nxt):
+        if self._kernel is None:
+            raise InterpreterError(ins.line, "INT needs a kernel")
+        expression, maximum = self._value(ins.parameters[0], 8, ins)
+        self._exit = ["interrupt({})".format(expression), "return {}".format(nxt)]
+
+    def _compile_jmp(self, ins, nxt):
+        self._exit = ["return {}".format(self._label(ins))]
+
+    def _compile_jc(self, ins, nxt):
+        self._exit = ["return {} if core.EFLAGS & 0x01 else {}".format(self._label(ins), nxt)]
+
+    def _compile_jnc(self, ins, nxt):
+        self._exit = ["return {} if core.EFLAGS & 0x01 else {}".format(nxt, self._label(ins))]
+
+    def _compile_clc(self, ins, nxt):
+        """ carries of the instructions before are dropped together with the flag itself
+        """
+        self._carry = True
+        self._body.append("cf = 0")
+        self._body.append("clear_flags(0x01)")
+
+    def _compile_stc(self, ins, nxt):
+        self._body.append("set_flags(0x01)")
+
+    def _compile_loop(self, ins, nxt):
+        target = self._label(ins)
+        local = self._local(register.ECX)
+        self._modified.add(register.ECX)
+        self._body.append("{0} = ({0} - 1) & 0xffffffff".format(local))
+        self._exit = ["return {} if {} else {}".format(target, local, nxt)]
@@ -0,0 +1,172 @@
+from framebuffer import CELL_WIDTH, CELL_HEIGHT, CharacterIndexError
+
+# attribute of a cell: foreground color in the low nibble, background color in the high nibble
+DEFAULT_ATTRIBUTE = 0x07
+
+TAB_SIZE = 8
+
+
+class TextConsole(object):
+    """ Text mode on top of a Framebuffer
+
+    Keeps the screen as columns x rows cells of a character and an attribute byte, like the text
+    memory of a CGA card, plus a cursor. Writing only changes cells and marks them dirty, render()
+    rasterizes just the dirty cells. Scrolling moves the cells, their dirty flags and the pixels
+    already drawn up by one row and fills the new bottom row, nothing has to be redrawn.
+
+    40x25 fits the default 320x200 framebuffer, 80x25 needs one that is 640 pixels wide.
+    """
+
+    def __init__(self, screen, columns=40, rows=25, attribute=DEFAULT_ATTRIBUTE):
+        """
+        :param screen: Framebuffer to draw to
+        :param columns: characters per row
+        :param rows: rows of text
+        :param attribute: attribute of the written characters
+        """
+        if columns * CELL_WIDTH > screen.screen_width or rows * CELL_HEIGHT > screen.screen_height:
+            raise ValueError("{}x{} characters don't fit on a {}x{} screen".format(
+                columns, rows, screen.screen_width, screen.screen_height))
+        self._screen = screen
+        self._columns = columns
+        self._rows = rows
+        self.attribute = attribute
+        self.cells = bytearray(bytes([0x20, attribute]) * (columns * rows))
+        self._dirty = bytearray(b"\x01" * (columns * rows))
+        self._x = 0
+        self._y = 0
+
+    @property
+    def columns(self):
+        return self._columns
+
+    @property
+    def rows(self):
+        return self._rows
+
+    @property
+    def cursor(self):
+        """ returns the (column, row) the next character is written to
+        """
+        return self._x, self._y
+
+    def move_cursor(self, x, y):
+        if not 0 <= x < self._columns or not 0 <= y < self._rows:
+            raise ValueError("({}/{}) is outside of the console".format(x, y))
+        self._x, self._y = x, y
+
+    @property
+    def dirty_cells(self):
+        return self._dirty.count(1)
+
+    def put(self, c, x, y, attribute=None):
+        """ set a single cell without moving the cursor
+        """
+        if not 0 <= x < self._columns or not 0 <= y < self._rows:
+            raise CharacterIndexError()
+        index = y * self._columns + x
+        self.cells[2 * index] = c
+        self.cells[2 * index + 1] = self.attribute if attribute is None else attribute
+        self._dirty[index] = 1
+
+    def clear(self):
+        self.cells[:] = bytes([0x20, self.attribute]) * (self._columns * self._rows)
+        self._dirty[:] = b"\x01" * len(self._dirty)
+        self._x = self._y = 0
+
+    def write(self, data):
+        """ write text at the cursor
+
+        Handles newline, carriage return, backspace and tab, NUL bytes are ignored. Lines wrap at
+        the right edge and the console scrolls when the cursor leaves the bottom row.
+
+        :param data: bytes or str
+        """
+        if isinstance(data, str):
+            data = data.encode('cp437', errors='replace')
+        columns = self._columns
+        cells = self.cells
+        dirty = self._dirty
+        attribute = self.attribute
+        x, y = self._x, self._y
+
+        for c in data:
+            if c == 0x0a:
+                x = 0
+                y += 1
+            elif c == 0x0d:
+                x = 0
+            elif c == 0x08:
+                x = max(x - 1, 0)
+            elif c == 0x09:
+                x = min((x // TAB_SIZE + 1) * TAB_SIZE, columns)
+            elif c:
+                if x >= columns:
+                    x = 0
+                    y += 1
+                if y >= self._rows:
+                    self.scroll(y - self._rows + 1)
+                    y = self._rows - 1
+                index = y * columns + x
+                cells[2 * index] = c
+                cells[2 * index + 1] = attribute
+                dirty[index] = 1
+                x += 1
+                continue
+            if y >= self._rows:
+                self.scroll(y - self._rows + 1)
+                y = self._rows - 1
+
+        self._x, self._y = min(x, columns), y
+
+    def scroll(self, lines=1):
+        """ move everything up by lines rows, the rows at the bottom become empty
+        """
+        lines = min(lines, self._rows)
+        columns = self._columns
+        keep = (self._rows - lines) * columns
+        self.cells[:2 * keep] = self.cells[2 * lines * columns:]
+        self.cells[2 * keep:] = bytes([0x20, self.attribute]) * (lines * columns)
+        self._dirty[:keep] = self._dirty[lines * columns:]
+        self._dirty[keep:] = bytes(lines * columns)
+
+        # the pixels of the cells already drawn move with them, the empty rows are filled right away
+        screen = self._screen
+        stride = screen.screen_width
+        pixels = screen.pixels
+        shift = lines * CELL_HEIGHT * stride
+        height = (self._rows - lines) * CELL_HEIGHT
+        if columns * CELL_WIDTH == stride:
+            pixels[:height * stride] = pixels[shift:shift + height * stride]
+        else:
+            width = columns * CELL_WIDTH
+            for offset in range(0, height * stride, stride):
+                pixels[offset:offset + width] = pixels[offset + shift:offset + shift + width]
+        screen.add_damage(0, 0, columns * CELL_WIDTH, height)
+        screen.fill_rect(0, height, columns * CELL_WIDTH, lines * CELL_HEIGHT, self.attribute >> 4)
+
+    def render(self):
+        """ draw the dirty cells to the framebuffer
+
+        :return: the amount of cells drawn
+        """
+        dirty = self._dirty
+        cells = self.cells
+        columns = self._columns
+        set_character = self._screen.set_character
+        count = 0
+        index = dirty.find(1)
+        while index >= 0:
+            c = cells[2 * index]
+            attribute = cells[2 * index + 1]
+            set_character(c, index % columns, index // columns, attribute & 0x0f, attribute >> 4)
+            dirty[index] = 0
+            count += 1
+            index = dirty.find(1, index + 1)
+        return count
+
+    def flush(self):
+        """ draw the dirty cells and publish the frame if anything changed
+        """
+        self.render()
+        self._screen.update_screen_buffer()
@@ -1,8 +1,15 @@
+import collections
 import logging
 import string
+import struct
+import sys
+from array import array
 
 import datatypes.exceptions as exceptions
 import register as r
+import tracer
+
+from memory import PagedMemory, PAGE_SHIFT, PAGE_SIZE, HOT_MASK, U16, I32, U64
 
 from datatypes.dword import *
 
@@ -14,99 +21,254 @@ ch.setFormatter(logging.Formatter(FORMAT))
 LOG.addHandler(ch)
 
 
-class Core(object):
+CoreSnapshot = collections.namedtuple('CoreSnapshot', ['memory', 'registers', 'eflags', 'ip'])
 
-    def __init__(self):
-        # memory
-        self._mem = [int(0)] * (0xffff+1)
+# registers saved by PUSHA, in memory order starting at ESP: EDI, ESI, EBP, ESP, EBX, EDX, ECX, EAX
+PUSHA = struct.Struct('<8I')
+# registers restored by POPA, in the same order
+POPA_ORDER = (r.EDI, r.ESI, r.EBP, r.EBX, r.EDX, r.ECX, r.EAX)
 
-        # stack
-        self._stack = [int(0)] * (0xff+1)
 
-        # registers
-        self._EAX = r.Register32()
-        self._EBX = r.Register32()
-        self._ECX = r.Register32()
-        self._EDX = r.Register32()
+class Core(object):
 
-        self._EIP = r.Register32()
-        self._ESP = r.Register32()
-        self._EBP = r.Register32()
+    def __init__(self, memory=None):
+        """
+        :param memory: memory to work on, e.g. memory shared with other cores, a new PagedMemory if not given
+        """
+        # memory
+        self._memory = memory if memory is not None else PagedMemory()
 
-        self._ESI = r.Register32()
-        self._EDI = r.Register32()
+        # registers
+        self._registers = r.register_file()
 
         # special stuff
         self._IP = 0        # instruction pointer
         self._EFLAGS = 0    # Flags register
-        self._stack_pointer = -1
 
+        # optional tracer.TraceBuffer, nothing gets recorded while it is None
+        self._trace = None
+
+
+    @property
+    def trace(self):
+        """ trace buffer recording register writes, memory writes and stack operations
+        Set it to a tracer.TraceBuffer to enable tracing or to None to disable it.
+        """
+        return self._trace
+
+    @trace.setter
+    def trace(self, value):
+        self._trace = value
+
+    """ Snapshots
+    """
+    def snapshot(self):
+        """ capture the complete state of the core
+        The memory is shared copy-on-write with the snapshot, pages are only copied once they get written to.
+
+        :return: a CoreSnapshot that can be passed to restore()
+        """
+        return CoreSnapshot(
+            memory=self._memory.snapshot(),
+            registers=self._registers[:],
+            eflags=self._EFLAGS,
+            ip=self._IP
+        )
+
+    def restore(self, snapshot):
+        """ reset the core to a state captured with snapshot()
+        A snapshot can be restored any number of times and into any number of cores.
+        """
+        self._memory.restore(snapshot.memory)
+        self._registers[:] = snapshot.registers
+        self._EFLAGS = snapshot.eflags
+        self._IP = snapshot.ip
+
+    def fork(self):
+        """ create a new core in the same state as this one, with a copy-on-write copy of its PagedMemory
+        Other memories, e.g. memory shared with other cores, are copied page by page into a PagedMemory.
+        """
+        core = Core()
+        if isinstance(self._memory, PagedMemory):
+            core.restore(self.snapshot())
+            return core
+
+        memory = core.memory
+        for page in self._memory.pages:
+            memory.write(page << PAGE_SHIFT, self._memory.read(page << PAGE_SHIFT, PAGE_SIZE))
+        core.restore(CoreSnapshot(memory=memory.snapshot(), registers=self._registers[:], eflags=self._EFLAGS,
+                                  ip=self._IP))
+        return core
 
     """ Stack
+
+        The stack lives in memory at ESP and grows downwards, every entry is a 32 bit little endian value.
+        ESP starts at 0, so the first entry is stored at FFFFFFFCh.
     """
     def push(self, src):
         if isinstance(src, int):
             value = src
-        elif hasattr(self, src.upper()):
-            value = getattr(self, src.upper())
         else:
-            raise TypeError("Invalid value for push()")
-
-        LOG.debug("Pushing {:08X} to stack".format(value))
-        try:
-            self._stack[self._stack_pointer + 1] = value & 0xffffffff
-        except:
-            raise OverflowError("Stack Overflow")
+            reg = r.resolve(src) if isinstance(src, str) else None
+            if reg is None:
+                raise TypeError("Invalid value for push()")
+            value = self.get_reg(reg)
+
+        self.push_imm(value)
+
+    def push_imm(self, value):
+        if self._trace is not None:
+            self._trace.record(tracer.PUSH, 0, value & 0xffffffff)
+        regs = self._registers
+        esp = regs[r.ESP] = (regs[r.ESP] - 4) & 0xffffffff
+        memory = self._memory
+        if esp & HOT_MASK == memory.hot:
+            memory.hot_words[(esp - memory.hot) >> 2] = value & 0xffffffff
+        else:
+            memory.write_u32(esp, value)
 
-        self._stack_pointer += 1
+    def push_reg(self, reg):
+        self.push_imm(self.get_reg(reg))
 
     def pop(self, target=None):
-        if self._stack_pointer < 0:
-            raise IndexError("Stack is empty")
-
-        value = self._stack[self._stack_pointer]
-
         if target is None:
-            pass
-        elif hasattr(self, target.upper()):
-            setattr(self, target.upper(), value)
-        else:
+            self.pop_reg(None)
+            return
+
+        reg = r.resolve(target)
+        if reg is None:
             raise TypeError("Invalid target for pop()")
+        self.pop_reg(reg)
 
-        self._stack_pointer -= 1
+    def pop_reg(self, reg):
+        """ pop the topmost stack entry into a register, or discard it if reg is None
+        """
+        value = self.pop_imm()
+        if reg is not None:
+            self.mov_reg_imm(reg, value)
 
-    def dump_stack(self):
-        count = 0
+    def pop_imm(self):
+        """ pop the topmost stack entry and return it
+        """
+        regs = self._registers
+        esp = regs[r.ESP]
+        regs[r.ESP] = (esp + 4) & 0xffffffff
+        memory = self._memory
+        if esp & HOT_MASK == memory.hot:
+            return memory.hot_words[(esp - memory.hot) >> 2]
+        return memory.read_u32(esp)
+
+    def pusha(self):
+        """ push EAX, ECX, EDX, EBX, the original ESP, EBP, ESI and EDI with a single 32 byte write
+        """
+        regs = self._registers
+        esp = (regs[r.ESP] - PUSHA.size) & 0xffffffff
+        values = regs[r.EDI], regs[r.ESI], regs[r.EBP], regs[r.ESP], regs[r.EBX], regs[r.EDX], regs[r.ECX], regs[r.EAX]
+        self._memory.write(esp, PUSHA.pack(*values))
+        regs[r.ESP] = esp
+        if self._trace is not None:
+            for value in reversed(values):
+                self._trace.record(tracer.PUSH, 0, value)
+
+    def popa(self):
+        """ pop the registers saved with pusha(), the saved ESP is skipped
+        """
+        regs = self._registers
+        esp = regs[r.ESP]
+        regs[r.EDI], regs[r.ESI], regs[r.EBP], _, regs[r.EBX], regs[r.EDX], regs[r.ECX], regs[r.EAX] = \
+            PUSHA.unpack(self._memory.read(esp, PUSHA.size))
+        regs[r.ESP] = (esp + PUSHA.size) & 0xffffffff
+        if self._trace is not None:
+            for reg in POPA_ORDER:
+                self._trace.record(tracer.REGISTER_WRITE, reg, regs[reg])
+
+    def enter(self, size):
+        """ set up a stack frame: push EBP, point EBP to it and reserve size bytes below
+        """
+        self.push_imm(self._registers[r.EBP])
+        regs = self._registers
+        regs[r.EBP] = regs[r.ESP]
+        regs[r.ESP] = (regs[r.ESP] - size) & 0xffffffff
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.EBP, regs[r.EBP])
+
+    def leave(self):
+        """ release the stack frame set up with enter()
+        """
+        regs = self._registers
+        regs[r.ESP] = regs[r.EBP]
+        regs[r.EBP] = self.pop_imm()
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.EBP, regs[r.EBP])
+
+    def dump_stack(self, limit=0x10):
+        """ log the topmost stack entries
+        """
         LOG.debug("Stack dump:")
-        while count <= self._stack_pointer:
-            LOG.debug("{:02X}h {:8X}".format(count, self._stack[count]))
-            count += 1
+        esp = self._registers[r.ESP]
+        count = min(limit, ((0x100000000 - esp) & 0xffffffff) // 4)
+        for address in range(esp, esp + count * 4, 4):
+            LOG.debug("{:08X}h {:8X}".format(address, int.from_bytes(self._memory.read(address, 4), 'little')))
 
     """ CORE commands
 
-        This is all the commands the Core will be able to execute
+        This is all the commands the Core will be able to execute.
+        The string based commands take register names, they resolve the name and hand over to the
+        *_reg() commands which take operand ids as returned by register.resolve().
     """
-    def inc(self, target):
-        if hasattr(self, target.upper()):
-            LOG.debug("Incrementing register {}".format(target.upper()))
-            value = getattr(self, target.upper())
-            try:
-                setattr(self, target.upper(), value + 1)
-            except exceptions.CarryOverException:
-                self._EFLAGS |= 0x01
+    def get_reg(self, reg):
+        slot, shift, mask, keep = r.OPERANDS[reg]
+        return (self._registers[slot] >> shift) & mask
+
+    def mov_reg_imm(self, reg, value):
+        slot, shift, mask, keep = r.OPERANDS[reg]
+        regs = self._registers
+        regs[slot] = (regs[slot] & keep) | ((value & mask) << shift)
+        if value > mask or value < 0:
+            self._EFLAGS |= 0x01
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, reg, value & mask)
+
+    def mov_reg_reg(self, target, src):
+        self.mov_reg_imm(target, self.get_reg(src))
+
+    def inc_reg(self, reg):
+        slot, shift, mask, keep = r.OPERANDS[reg]
+        regs = self._registers
+        value = regs[slot]
+        if (value >> shift) & mask == mask:
+            regs[slot] = value & keep
+            self._EFLAGS |= 0x01
+        else:
+            regs[slot] = value + (1 << shift)
+        if self._trace is not None:
+            self._trace.record(tracer.INC, reg)
+            self._trace.record(tracer.REGISTER_WRITE, reg, (regs[slot] >> shift) & mask)
+
+    def dec_reg(self, reg):
+        slot, shift, mask, keep = r.OPERANDS[reg]
+        regs = self._registers
+        value = regs[slot]
+        if (value >> shift) & mask == 0:
+            regs[slot] = value | (mask << shift)
+            self._EFLAGS |= 0x01
         else:
+            regs[slot] = value - (1 << shift)
+        if self._trace is not None:
+            self._trace.record(tracer.DEC, reg)
+            self._trace.record(tracer.REGISTER_WRITE, reg, (regs[slot] >> shift) & mask)
+
+    def inc(self, target):
+        reg = r.resolve(target)
+        if reg is None:
             raise ValueError("Invalid INC parameter")
+        self.inc_reg(reg)
 
     def dec(self, target):
-        if hasattr(self, target.upper()):
-            LOG.debug("Decrementing register {}".format(target.upper()))
-            value = getattr(self, target.upper())
-            try:
-                setattr(self, target.upper(), value - 1)
-            except exceptions.CarryOverException:
-                self._EFLAGS |= 0x01
-        else:
+        reg = r.resolve(target)
+        if reg is None:
             raise ValueError("Invalid DEC parameter")
+        self.dec_reg(reg)
 
     # TODO: needs size check to only allow same size target and source
     def mov(self, target, src):
@@ -115,7 +277,10 @@ class Core(object):
             value = 0
         elif isinstance(src, str):
             # src is a register
-            value = getattr(self, src.upper())
+            reg = r.resolve(src)
+            if reg is None:
+                raise ValueError("Invalid MOV source")
+            value = self.get_reg(reg)
         elif isinstance(src, int):
             # src is plain integer
             value = src
@@ -123,64 +288,174 @@ class Core(object):
             raise ValueError()
 
         if isinstance(target, str):
-            try:
-                setattr(self, target.upper(), value)
-            except exceptions.CarryOverException:
-                self._EFLAGS |= 0x01
+            reg = r.resolve(target)
+            if reg is None:
+                raise ValueError("Invalid MOV target")
+            self.mov_reg_imm(reg, value)
 
 
     """ Memory operations start here
     """
+    @property
+    def memory(self):
+        return self._memory
+
+    @property
+    def memory_lock(self):
+        """ lock making read-modify-write operations atomic for all cores sharing the memory
+        """
+        return self._memory.lock
+
+    def inc_memory(self, offset, number):
+        """ increment the little endian value of number bytes at offset, wrapping around sets the carry flag
+        """
+        value = int.from_bytes(self.read_memory(offset, number), 'little')
+        if value == (1 << (number * 8)) - 1:
+            value = 0
+            self._EFLAGS |= 0x01
+        else:
+            value += 1
+        self.write_memory(offset, value.to_bytes(number, 'little'))
+
+    def dec_memory(self, offset, number):
+        """ decrement the little endian value of number bytes at offset, wrapping around sets the carry flag
+        """
+        value = int.from_bytes(self.read_memory(offset, number), 'little')
+        if value == 0:
+            value = (1 << (number * 8)) - 1
+            self._EFLAGS |= 0x01
+        else:
+            value -= 1
+        self.write_memory(offset, value.to_bytes(number, 'little'))
+
+    def read_memory(self, offset, number):
+        """ read a block of memory
+
+        :param offset: start address
+        :param number: amount of bytes to read
+        :return: the bytes read
+        """
+        self._check_range(offset, number)
+        return self._memory.read(offset, number)
+
+    @staticmethod
+    def _check_range(offset, number):
+        if not isinstance(offset, int) or not isinstance(number, int):
+            raise ValueError("Address and length must be integers")
+
+    def write_memory(self, offset, data):
+        """ write a block of memory
+
+        :param offset: start address
+        :param data: bytes or any other object supporting the buffer protocol
+        """
+        if not isinstance(offset, int):
+            raise ValueError("Address must be an integer")
+        self._memory.write(offset, data)
+        if self._trace is not None:
+            self._trace.record(tracer.MEMORY_BLOCK_WRITE, 0, offset & 0xffffffff, len(memoryview(data).cast('B')))
+
+    def fill_memory(self, offset, number, value=0x00):
+        """ set a block of memory to a single byte value
+        """
+        if not isinstance(offset, int) or not isinstance(value, int):
+            raise ValueError("Address and value must be integers")
+        self._memory.fill(offset, number, value)
+        if self._trace is not None:
+            self._trace.record(tracer.MEMORY_BLOCK_WRITE, 0, offset & 0xffffffff, number)
+
+    def copy_memory(self, target, src, number):
+        """ copy a block of memory, overlapping ranges are handled like memmove()
+        """
+        self._memory.copy(target, src, number)
+        if self._trace is not None:
+            self._trace.record(tracer.MEMORY_BLOCK_WRITE, 0, target & 0xffffffff, number)
+
+    """ Typed access, all values are little endian and wrap around at the end of the address space
+    """
+    def read_u16(self, offset):
+        self._check_range(offset, 2)
+        return self._memory.unpack(U16, offset)
+
+    def read_u32(self, offset):
+        self._check_range(offset, 4)
+        return self._memory.read_u32(offset)
+
+    def read_i32(self, offset):
+        self._check_range(offset, 4)
+        return self._memory.unpack(I32, offset)
+
+    def read_u64(self, offset):
+        self._check_range(offset, 8)
+        return self._memory.unpack(U64, offset)
+
+    def write_u16(self, offset, value):
+        self.write_memory(offset, (value & 0xffff).to_bytes(2, 'little'))
+
+    def write_u32(self, offset, value):
+        self.write_memory(offset, (value & 0xffffffff).to_bytes(4, 'little'))
+
+    def write_u64(self, offset, value):
+        self.write_memory(offset, (value & 0xffffffffffffffff).to_bytes(8, 'little'))
+
+    def read_u32_array(self, offset, number):
+        """ returns number consecutive dwords as array('I')
+        """
+        values = array('I', self.read_memory(offset, number * 4))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def write_u32_array(self, offset, values):
+        """ store a sequence of dwords at offset with a single write
+        """
+        values = array('I', [value & 0xffffffff for value in values])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        self.write_memory(offset, values.tobytes())
+
     def set_memory_range(self, address, values):
-        for v in values:
-            self.set_memory_location(address, v)
-            address += 1
+        if not isinstance(values, (bytes, bytearray, memoryview)):
+            values = bytes(v & 0xff for v in values)
+        self.write_memory(address, values)
 
     def set_memory_location(self, offset, value):
         if not isinstance(offset, int) or not isinstance(value, int):
             raise ValueError("Address or value must be integers")
-        offset &= 0xffff
-        value &= 0xff
-        self._mem[offset] = value
-        #LOG.debug("memory at address {:04X} is set to {:02X}".format(offset, self._mem[offset]))
+        self._memory.set(offset, value)
+        if self._trace is not None:
+            self._trace.record(tracer.MEMORY_WRITE, 0, offset & 0xffffffff, value & 0xff)
 
     def get_memory_location(self, offset):
         if not isinstance(offset, int):
            raise ValueError("Address must be an integer")
-        offset &= 0xffff
-        return self._mem[offset]
+        return self._memory.get(offset)
 
     def get_memory_range(self, offset, number):
-        result = []
-        while number > 0:
-            result.append(self.get_memory_location(offset))
-            number -= 1
-            offset += 1
-        return result
+        return list(self.read_memory(offset, number))
 
     def dump_memory(self, limit=0xffff):
+        """ hexdump of all pages that have been written to
+
+        :param limit: maximum number of rows to return
+        """
         result = []
-        count = 1
-        rowcount = 0
-        line = "{:04X}h: ".format(rowcount*0x0f)
-        text = ""
-        for byte in self._mem:
-            line += "{:02X} ".format(int(byte))
-            if chr(byte) in string.whitespace or byte == 0x00:
-                text += '.'
-            else:
-                text += chr(byte)
-
-            if (count % 0x10) == 0:
-                line += "    {}".format(text)
-                result.append(line)
-                rowcount += 1
-                line = "{:04X}h: ".format(rowcount*0x10)
+        for page in self._memory.pages:
+            address = page << PAGE_SHIFT
+            data = self._memory.read(address, PAGE_SIZE)
+            for row in range(0, PAGE_SIZE, 0x10):
+                if len(result) >= limit:
+                    return result
+
+                line = "{:08X}h: ".format(address + row)
                 text = ""
-
-            if rowcount >= limit:
-                break
-            count += 1
+                for byte in data[row:row + 0x10]:
+                    line += "{:02X} ".format(byte)
+                    if chr(byte) in string.whitespace or byte == 0x00:
+                        text += '.'
+                    else:
+                        text += chr(byte)
+                result.append("{}    {}".format(line, text))
 
         return result
 
@@ -194,7 +469,7 @@ class Core(object):
         EBX: {:32b}
         ECX: {:32b}
         EDX: {:32b}
-        """.format(self._EAX.full, self._EBX.full, self._ECX.full, self._EDX.full)
+        """.format(*self._registers[r.EAX:r.EDX + 1])
 
     @property
     def EAX(self):
@@ -202,39 +477,54 @@ class Core(object):
         it is used in input/output and most arithmetic instructions. For example, in multiplication operation,
         one operand is stored in EAX or AX or AL register according to the size of the operand
         """
-        return self._EAX.full
+        return self._registers[r.EAX]
 
     @EAX.setter
     def EAX(self, value):
-        self._EAX.full = value
-        LOG.debug("EAX is now {}".format(self.EAX))
+        self._registers[r.EAX] = value & 0xffffffff
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['EAX'], self.EAX)
+        if value > 0xffffffff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def AX(self):
-        return self._EAX.half
+        return self._registers[r.EAX] & 0xffff
 
     @AX.setter
     def AX(self, value):
-        self._EAX.half = value
-        LOG.debug("AX is now {}".format(self.AX))
+        regs = self._registers
+        regs[r.EAX] = (regs[r.EAX] & 0xffff0000) | (value & 0xffff)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['AX'], self.AX)
+        if value > 0xffff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def AH(self):
-        return self._EAX.high
+        return (self._registers[r.EAX] >> 8) & 0xff
 
     @AH.setter
     def AH(self, value):
-        self._EAX.high = value
-        LOG.debug("AH is now {}".format(self.AH))
+        regs = self._registers
+        regs[r.EAX] = (regs[r.EAX] & 0xffff00ff) | ((value & 0xff) << 8)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['AH'], self.AH)
+        if value > 0xff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def AL(self):
-        return self._EAX.low
+        return self._registers[r.EAX] & 0xff
 
     @AL.setter
     def AL(self, value):
-        self._EAX.low = value
-        LOG.debug("AL is now {}".format(self.AL))
+        regs = self._registers
+        regs[r.EAX] = (regs[r.EAX] & 0xffffff00) | (value & 0xff)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['AL'], self.AL)
+        if value > 0xff or value < 0:
+            raise exceptions.CarryOverException()
 
 
     @property
@@ -242,39 +532,54 @@ class Core(object):
         """ base register (32Bit)
         used in indexed addressing
         """
-        return self._EBX.full
+        return self._registers[r.EBX]
 
     @EBX.setter
     def EBX(self, value):
-        self._EBX.full = value
-        LOG.debug("EBX is now {}".format(self.EBX))
+        self._registers[r.EBX] = value & 0xffffffff
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['EBX'], self.EBX)
+        if value > 0xffffffff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def BX(self):
-        return self._EBX.half
+        return self._registers[r.EBX] & 0xffff
 
     @BX.setter
     def BX(self, value):
-        self._EBX.half = value
-        LOG.debug("BX is now {}".format(self.BX))
+        regs = self._registers
+        regs[r.EBX] = (regs[r.EBX] & 0xffff0000) | (value & 0xffff)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['BX'], self.BX)
+        if value > 0xffff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def BH(self):
-        return self._EBX.high
+        return (self._registers[r.EBX] >> 8) & 0xff
 
     @BH.setter
     def BH(self, value):
-        self._EBX.high = value
-        LOG.debug("BH is now {}".format(self.BH))
+        regs = self._registers
+        regs[r.EBX] = (regs[r.EBX] & 0xffff00ff) | ((value & 0xff) << 8)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['BH'], self.BH)
+        if value > 0xff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def BL(self):
-        return self._EBX.low
+        return self._registers[r.EBX] & 0xff
 
     @BL.setter
     def BL(self, value):
-        self._EBX.low = value
-        LOG.debug("BL is now {}".format(self.BL))
+        regs = self._registers
+        regs[r.EBX] = (regs[r.EBX] & 0xffffff00) | (value & 0xff)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['BL'], self.BL)
+        if value > 0xff or value < 0:
+            raise exceptions.CarryOverException()
 
 
     @property
@@ -282,39 +587,54 @@ class Core(object):
         """ count register (32Bit)
         stores the loop count in iterative operations
         """
-        return self._ECX.full
+        return self._registers[r.ECX]
 
     @ECX.setter
     def ECX(self, value):
-        self._ECX.full = value
-        LOG.debug("ECX is now {}".format(self.ECX))
+        self._registers[r.ECX] = value & 0xffffffff
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['ECX'], self.ECX)
+        if value > 0xffffffff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def CX(self):
-        return self._ECX.half
+        return self._registers[r.ECX] & 0xffff
 
     @CX.setter
     def CX(self, value):
-        self._ECX.half = value
-        LOG.debug("CX is now {}".format(self.CX))
+        regs = self._registers
+        regs[r.ECX] = (regs[r.ECX] & 0xffff0000) | (value & 0xffff)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['CX'], self.CX)
+        if value > 0xffff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def CH(self):
-        return self._ECX.high
+        return (self._registers[r.ECX] >> 8) & 0xff
 
     @CH.setter
     def CH(self, value):
-        self._ECX.high = value
-        LOG.debug("CH is now {}".format(self.CH))
+        regs = self._registers
+        regs[r.ECX] = (regs[r.ECX] & 0xffff00ff) | ((value & 0xff) << 8)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['CH'], self.CH)
+        if value > 0xff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def CL(self):
-        return self._ECX.low
+        return self._registers[r.ECX] & 0xff
 
     @CL.setter
     def CL(self, value):
-        self._ECX.low = value
-        LOG.debug("CL is now {}".format(self.CL))
+        regs = self._registers
+        regs[r.ECX] = (regs[r.ECX] & 0xffffff00) | (value & 0xff)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['CL'], self.CL)
+        if value > 0xff or value < 0:
+            raise exceptions.CarryOverException()
 
 
     @property
@@ -323,45 +643,76 @@ class Core(object):
         It is also used in input/output operations.
         It is also used with AX register along with DX for multiply and divide operations involving large values.
         """
-        return self._EDX.full
+        return self._registers[r.EDX]
 
     @EDX.setter
     def EDX(self, value):
-        self._EDX.full = value
-        LOG.debug("EDX is now {}".format(self.EDX))
+        self._registers[r.EDX] = value & 0xffffffff
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['EDX'], self.EDX)
+        if value > 0xffffffff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def DX(self):
-        return self._EDX.half
+        return self._registers[r.EDX] & 0xffff
 
     @DX.setter
     def DX(self, value):
-        self._EDX.half = value
-        LOG.debug("DX is now {}".format(self.DX))
+        regs = self._registers
+        regs[r.EDX] = (regs[r.EDX] & 0xffff0000) | (value & 0xffff)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['DX'], self.DX)
+        if value > 0xffff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def DH(self):
-        return self._EDX.high
+        return (self._registers[r.EDX] >> 8) & 0xff
 
     @DH.setter
     def DH(self, value):
-        self._EDX.high = value
-        LOG.debug("DH is now {}".format(self.DH))
+        regs = self._registers
+        regs[r.EDX] = (regs[r.EDX] & 0xffff00ff) | ((value & 0xff) << 8)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['DH'], self.DH)
+        if value > 0xff or value < 0:
+            raise exceptions.CarryOverException()
 
     @property
     def DL(self):
-        return self._EDX.low
+        return self._registers[r.EDX] & 0xff
 
     @DL.setter
     def DL(self, value):
-        self._EDX.low = value
-        LOG.debug("DL is now {}".format(self.DL))
+        regs = self._registers
+        regs[r.EDX] = (regs[r.EDX] & 0xffffff00) | (value & 0xff)
+        if self._trace is not None:
+            self._trace.record(tracer.REGISTER_WRITE, r.REGISTERS['DL'], self.DL)
+        if value > 0xff or value < 0:
+            raise exceptions.CarryOverException()
 
 
+    @property
+    def register_file(self):
+        """ the flat register file, see register.register_file()
+        """
+        return self._registers
+
     @property
     def EFLAGS(self):
         return self._EFLAGS
 
+    def set_flags(self, mask):
+        """ set the given bits in EFLAGS
+        """
+        self._EFLAGS |= mask
+
+    def clear_flags(self, mask):
+        """ clear the given bits in EFLAGS
+        """
+        self._EFLAGS &= ~mask
+
     @EFLAGS.setter
     def EFLAGS(self, value):
         raise TypeError("EFLAGS is a readonly register")
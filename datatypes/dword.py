@@ -1,5 +1,3 @@
-import stdlib
-
 from datatypes.word import Word
 from datatypes.exceptions import CarryOverException
 
@@ -10,7 +8,7 @@ class Dword(object):
 
     @property
     def size(self):
-        return stdlib.sizeof(self._high) + stdlib.sizeof(self._low)
+        return self._high.size + self._low.size
 
     @property
     def value(self):
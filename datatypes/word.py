@@ -1,5 +1,3 @@
-import stdlib
-
 from datatypes.byte import Byte
 from datatypes.exceptions import CarryOverException
 
@@ -11,7 +9,7 @@ class Word(object):
 
     @property
     def size(self):
-        return stdlib.sizeof(self._high) + stdlib.sizeof(self._low)
+        return self._high.size + self._low.size
 
     @property
     def value(self):
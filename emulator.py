@@ -5,8 +5,7 @@ from PyQt5.QtCore import QThread
 from PyQt5.QtWidgets import QApplication
 
 import stdlib
-from core import Core
-from kernel import Kernel
+from machine import Machine
 from screen import ScreenEGA
 
 FORMAT = '%(asctime)-15s %(name)-12s %(levelname)-8s %(message)s'
@@ -18,19 +17,19 @@ LOG.addHandler(ch)
 
 
 class Emulator(QThread):
-    def __init__(self, core, screen):
+    def __init__(self, machine):
         super().__init__()
-        self.__core = core
-        self.__screen = screen
+        self.__machine = machine
+        self.__core = machine.core
 
     def run(self):
         LOG.info("Emulator started")
-        kernel = Kernel(core=self.__core, screen=self.__screen)
+        kernel = self.__machine.kernel
 
         msg = [ord(c) for c in "HELLO WORLD!"]
         msg.append(0x00)
         LOG.debug(len(msg))
-        addr = stdlib.malloc(len(msg))
+        addr = stdlib.malloc(len(msg), machine=self.__machine)
         length = len(msg)
 
         self.__core.EAX = 4        # sys_write
@@ -41,14 +40,14 @@ class Emulator(QThread):
 
         kernel.interrupt(0x80)      # handover to kernel
 
-        stdlib.free(addr)
+        stdlib.free(addr, machine=self.__machine)
 
 
 def main():
     app = QApplication(sys.argv)
     screen = ScreenEGA(scale=2)
     screen.show()
-    t = Emulator(core=Core(), screen=screen)
+    t = Emulator(Machine(screen=screen))
     t.start()
 
     sys.exit(app.exec_())
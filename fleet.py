@@ -0,0 +1,171 @@
+import collections
+import concurrent.futures
+import itertools
+import os
+
+import objectfile
+import register
+from blockcompiler import BlockInterpreter
+from machine import Machine
+
+# initial state of one run, registers by name and memory as {address: bytes}
+State = collections.namedtuple('State', ['registers', 'memory'])
+State.__new__.__defaults__ = ((), ())
+
+# final state of one run
+Result = collections.namedtuple('Result', [
+    'index',        # position of the state in the input
+    'registers',    # {name: value} of the 32 bit registers
+    'memory',       # bytes of every range passed as read=
+    'output',       # (fd, bytes) tuples written with sys_write()
+    'error'         # message of the exception that stopped the program or None
+])
+
+
+class Fleet(object):
+    """ Runs one program against many initial states in a pool of worker processes
+
+    Every worker gets the program once, as an object file, when it starts. It compiles the program
+    for its own machine and snapshots the clean core and kernel allocators, every state is then run
+    on a machine restored to that snapshot. States are sent in batches, with at most window batches in flight, so arbitrarily
+    long iterables of states can be streamed through the pool.
+
+        with Fleet(program, read=[(0x100, 16)]) as fleet:
+            for result in fleet.map(State({'EAX': n}) for n in range(10000)):
+                ...
+    """
+
+    def __init__(self, program, workers=None, read=(), engine=BlockInterpreter, batch_size=64, window=None):
+        """
+        :param program: assembler.Program to run
+        :param workers: amount of worker processes, all cores of the host by default,
+            0 runs everything in the calling process
+        :param read: (address, length) of the memory ranges to return with every result
+        :param engine: Interpreter or one of its subclasses, has to be importable by the workers
+        :param batch_size: amount of states sent to a worker at once
+        :param window: maximum amount of batches in flight, four per worker by default
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if batch_size < 1:
+            raise ValueError("Batch size has to be at least 1")
+
+        self._workers = workers
+        self._batch_size = batch_size
+        self._window = window if window is not None else max(1, workers) * 4
+        read = tuple(read)
+
+        if workers:
+            self._runner = None
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_initialize, initargs=(objectfile.dump(program), engine, read))
+        else:
+            self._runner = _Runner(program, engine, read)
+            self._executor = None
+
+    @property
+    def workers(self):
+        return self._workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """ shut the worker processes down
+        """
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def map(self, states):
+        """ run the program for every state
+
+        :param states: iterable of States
+        :return: iterator over the Results, in the order of the states
+        """
+        batches = _batches(enumerate(states), self._batch_size)
+
+        if self._executor is None:
+            for batch in batches:
+                yield from self._runner.run_batch(batch)
+            return
+
+        pending = collections.deque()
+        for batch in itertools.islice(batches, self._window):
+            pending.append(self._executor.submit(_run_batch, batch))
+        while pending:
+            results = pending.popleft().result()
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append(self._executor.submit(_run_batch, batch))
+            yield from results
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _Runner(object):
+    """ Machine running the program of a fleet, one per worker
+    """
+
+    def __init__(self, program, engine, read):
+        self._output = []
+        self._machine = Machine(output=lambda fd, data: self._output.append((fd, bytes(data))))
+        self._interpreter = self._machine.interpreter(program.instructions, engine=engine)
+        self._read = read
+        self._clean = self._machine.core.snapshot()
+        self._clean_kernel = self._machine.kernel.snapshot()
+
+    def run(self, index, state):
+        core = self._machine.core
+        core.restore(self._clean)
+        self._machine.kernel.restore(self._clean_kernel)
+        self._output = []
+
+        registers = state.registers.items() if hasattr(state.registers, 'items') else state.registers
+        for name, value in registers:
+            reg = register.resolve(name)
+            if reg is None:
+                raise ValueError("Invalid register '{}'".format(name))
+            core.mov_reg_imm(reg, value)
+        memory = state.memory.items() if hasattr(state.memory, 'items') else state.memory
+        for address, data in memory:
+            core.write_memory(address, data)
+
+        error = None
+        try:
+            self._interpreter.run()
+        except Exception as e:
+            error = "{}: {}".format(type(e).__name__, e)
+
+        return Result(
+            index=index,
+            registers=dict(zip(register.NAMES, core.register_file)),
+            memory=[core.read_memory(address, length) for address, length in self._read],
+            output=self._output,
+            error=error)
+
+    def run_batch(self, batch):
+        return [self.run(index, state) for index, state in batch]
+
+
+# runner of the worker process, set up by the pool initializer
+_runner = None
+
+
+def _initialize(image, engine, read):
+    global _runner
+    _runner = _Runner(objectfile.load(image), engine, read)
+
+
+def _run_batch(batch):
+    return _runner.run_batch(batch)
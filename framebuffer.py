@@ -0,0 +1,543 @@
+import functools
+import logging
+import math
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+from characters import ascii_dos
+
+LOG = logging.getLogger('framebuffer')
+
+
+class PixelIndexError(Exception):
+    def __init__(self):
+        super().__init__()
+
+
+class PixelColorError(Exception):
+    def __init__(self):
+        super().__init__()
+
+
+class CharacterIndexError(Exception):
+    def __init__(self):
+        super().__init__()
+
+
+class AsciiIndexError(Exception):
+    def __init__(self):
+        super().__init__()
+
+
+PALETTE = [                 # CGA color palette:
+    (0, 0, 0),              # black             #000000
+    (0, 0, 170),            # blue              #0000aa
+    (0, 170, 0),            # green             #00aa00
+    (0, 170, 170),          # cyan              #00aaaa
+    (170, 0, 0),            # red               #aa0000
+    (170, 0, 170),          # magenta           #aa00aa
+    (170, 85, 0),           # brown             #aa5500
+    (170, 170, 170),        # light grey        #aaaaaa
+    (85, 85, 85),           # dark grey         #555555
+    (85, 85, 255),          # bright blue       #5555ff
+    (85, 255, 85),          # bright green      #55ff55
+    (85, 255, 255),         # bright cyan       #55ffff
+    (255, 85, 85),          # bright red        #ff5555
+    (255, 85, 255),         # bright magenta    #ff55ff
+    (255, 255, 85),         # bright yellow     #ffff55
+    (255, 255, 255)         # bright white      #ffffff
+]
+
+SCREEN_WIDTH = 320
+SCREEN_HEIGHT = 200
+
+CELL_WIDTH = 8
+CELL_HEIGHT = 8
+GLYPH_COUNT = 256           # one glyph for every character code
+
+# area of a framebuffer changed by drawing
+Rect = namedtuple('Rect', ['x', 'y', 'width', 'height'])
+
+# more damaged areas than this are merged into their bounding box
+MAX_DAMAGE_RECTS = 16
+
+
+
+def _compile_glyph(bitmap):
+    """ returns the rows of an 8x8 glyph as bitmasks, the leftmost pixel is the highest bit
+    """
+    return tuple(sum(1 << (CELL_WIDTH - 1 - x) for x in range(CELL_WIDTH) if row[x]) for row in bitmap)
+
+
+def _runs(mask):
+    """ returns (start, length) of the runs of lit pixels in a glyph row
+    """
+    runs = []
+    start = None
+    for x in range(CELL_WIDTH + 1):
+        lit = x < CELL_WIDTH and mask & (1 << (CELL_WIDTH - 1 - x))
+        if lit and start is None:
+            start = x
+        elif not lit and start is not None:
+            runs.append((start, x - start))
+            start = None
+    return tuple(runs)
+
+
+# font image with the 8x8 glyphs of code page 437, 32 per row, lit pixels are black
+FONT_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cga8.png')
+
+
+def load_glyphs(path=FONT_IMAGE, count=GLYPH_COUNT):
+    """ returns the first count glyphs of a 1 bit grayscale PNG font image as row bitmasks
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError("{} isn't a PNG image".format(path))
+
+    position = 8
+    header = None
+    idat = b""
+    while position < len(data):
+        length, = struct.unpack('>I', data[position:position + 4])
+        kind = data[position + 4:position + 8]
+        if kind == b"IHDR":
+            header = struct.unpack('>IIBBBBB', data[position + 8:position + 21])
+        elif kind == b"IDAT":
+            idat += data[position + 8:position + 8 + length]
+        position += length + 12
+
+    width, height, depth, color_type, _, _, interlace = header
+    if (depth, color_type, interlace) != (1, 0, 0):
+        raise ValueError("{} isn't a non interlaced 1 bit grayscale image".format(path))
+
+    stride = width // 8 + 1
+    raw = zlib.decompress(idat)
+    rows = []
+    for y in range(height):
+        if raw[y*stride] != 0:
+            raise ValueError("{} uses PNG row filters".format(path))
+        rows.append(raw[y*stride + 1:(y + 1)*stride])
+
+    columns = width // CELL_WIDTH
+    return [tuple(~rows[(c // columns)*CELL_HEIGHT + y][c % columns] & 0xff for y in range(CELL_HEIGHT))
+            for c in range(count)]
+
+
+# every glyph as row bitmasks, the leftmost pixel is the highest bit, and the runs of lit pixels
+# of each row. ascii_dos is used if the font image is missing, it only covers the first 114 codes
+# and the rest are drawn blank.
+try:
+    GLYPHS = load_glyphs()
+except (IOError, ValueError) as e:
+    LOG.warning("Couldn't load the font image, falling back to ascii_dos: %s", e)
+    GLYPHS = [_compile_glyph(bitmap) for bitmap in ascii_dos]
+    GLYPHS += [(0,) * CELL_HEIGHT] * (GLYPH_COUNT - len(GLYPHS))
+if len(GLYPHS) != GLYPH_COUNT:
+    raise ImportError("expected {} glyphs, got {}".format(GLYPH_COUNT, len(GLYPHS)))
+GLYPH_RUNS = [tuple(_runs(mask) for mask in glyph) for glyph in GLYPHS]
+
+
+@functools.lru_cache(maxsize=1024)
+def glyph_tile(c, color, background):
+    """ returns a glyph rendered in color on background as eight rows of eight palette indices
+    """
+    return tuple(bytes(color if mask & (1 << (CELL_WIDTH - 1 - x)) else background for x in range(CELL_WIDTH))
+                 for mask in GLYPHS[c])
+
+
+# one glyph row in every color
+_SOLID = [bytes([color]) * CELL_WIDTH for color in range(len(PALETTE))]
+
+
+class Framebuffer(object):
+    """ Image of palette indices, one byte per pixel, 320x200 by default
+
+    Drawing goes to pixels, update_screen_buffer() publishes them as the current frame and hands
+    it to present(). Presenters override present() to show or store the frames.
+
+    Every drawing operation records the area it changed. A frame is only published if something
+    changed since the last one, present() gets the changed areas so presenters can update just
+    those. Code writing to pixels directly reports its changes with add_damage().
+    """
+
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        self.screen_width = width
+        self.screen_height = height
+        self.pixels = bytearray(width * height)
+        self._frame = bytes(self.pixels)
+        self._frames = 0
+        self._damage = []                   # [x, y, width, height] of the areas changed
+        self._box = [width, height, 0, 0]   # left, top, right, bottom of the pixels set
+
+    @property
+    def damage(self):
+        """ returns the Rects changed since the last published frame
+        """
+        damage = [Rect(*rect) for rect in self._damage]
+        left, top, right, bottom = self._box
+        if left < right:
+            damage.append(Rect(left, top, right - left, bottom - top))
+        if len(damage) > MAX_DAMAGE_RECTS:
+            damage = [bounding_rect(damage)]
+        return damage
+
+    def add_damage(self, x, y, width, height):
+        """ record a changed area, the parts outside of the screen are clipped
+        """
+        left, right = max(x, 0), min(x + width, self.screen_width)
+        top, bottom = max(y, 0), min(y + height, self.screen_height)
+        if left >= right or top >= bottom:
+            return
+        damage = self._damage
+        if damage:
+            last = damage[-1]
+            # cells drawn one after the other along a row or a column extend the last area
+            if last[1] == top and last[3] == bottom - top and last[0] + last[2] == left:
+                last[2] += right - left
+                return
+            if last[0] == left and last[2] == right - left and last[1] + last[3] == top:
+                last[3] += bottom - top
+                return
+        damage.append([left, top, right - left, bottom - top])
+        if len(damage) > MAX_DAMAGE_RECTS:
+            self._damage = [list(bounding_rect(damage))]
+
+    @property
+    def frame(self):
+        """ returns the last published frame as bytes of palette indices, row by row
+        """
+        return self._frame
+
+    @property
+    def frames(self):
+        """ returns the amount of frames published so far
+        """
+        return self._frames
+
+    def cls(self, color_index=0):
+        if not 0 <= color_index < len(PALETTE):
+            raise PixelColorError()
+        self.pixels[:] = bytes([color_index]) * len(self.pixels)
+        self._damage = [[0, 0, self.screen_width, self.screen_height]]
+
+    def set_pixel(self, x, y, color_index):
+        """ Set the pixel at the given position to the specified color
+
+        :param x: x coordinate
+        :param y: y coordinate
+        :param color_index: index of the color in the CGA color palette
+        """
+        width = self.screen_width
+        if x >= width or x < 0:
+            raise PixelIndexError()
+        if y >= self.screen_height or y < 0:
+            raise PixelIndexError()
+        if color_index >= len(PALETTE) or color_index < 0:
+            raise PixelColorError()
+        self.pixels[y*width + x] = color_index
+
+        box = self._box
+        if x < box[0]:
+            box[0] = x
+        if x >= box[2]:
+            box[2] = x + 1
+        if y < box[1]:
+            box[1] = y
+        if y >= box[3]:
+            box[3] = y + 1
+
+    def get_pixel(self, x, y):
+        if x >= self.screen_width or x < 0 or y >= self.screen_height or y < 0:
+            raise PixelIndexError()
+        return self.pixels[y*self.screen_width + x]
+
+    def set_character(self, c, x, y, color, background=None):
+        """ draw a character into the cell at column x and row y
+
+        :param background: color of the unlit pixels, they are left alone if not given
+        """
+        if c < 0 or c >= GLYPH_COUNT:
+            raise AsciiIndexError()
+        width = self.screen_width
+        if x < 0 or x >= width // CELL_WIDTH or y < 0 or y >= self.screen_height // CELL_HEIGHT:
+            raise CharacterIndexError()
+        if color >= len(PALETTE) or color < 0:
+            raise PixelColorError()
+        if background is not None and (background >= len(PALETTE) or background < 0):
+            raise PixelColorError()
+
+        pixels = self.pixels
+        offset = y*CELL_HEIGHT*width + x*CELL_WIDTH
+        left, top = x*CELL_WIDTH, y*CELL_HEIGHT
+        last = self._damage[-1] if self._damage else None
+        if last is not None and last[1] == top and last[3] == CELL_HEIGHT and last[0] + last[2] == left:
+            last[2] += CELL_WIDTH
+        else:
+            self.add_damage(left, top, CELL_WIDTH, CELL_HEIGHT)
+        if background is not None:
+            for row in glyph_tile(c, color, background):
+                pixels[offset:offset + CELL_WIDTH] = row
+                offset += width
+            return
+
+        solid = _SOLID[color]
+        for runs in GLYPH_RUNS[c]:
+            for start, length in runs:
+                pixels[offset + start:offset + start + length] = solid[:length]
+            offset += width
+
+    def fill_rect(self, x, y, width, height, color_index):
+        """ fill a rectangle row by row, the parts outside of the screen are clipped
+        """
+        if color_index >= len(PALETTE) or color_index < 0:
+            raise PixelColorError()
+        stride = self.screen_width
+        left, right = max(x, 0), min(x + width, stride)
+        top, bottom = max(y, 0), min(y + height, self.screen_height)
+        if left >= right:
+            return
+        row = bytes([color_index]) * (right - left)
+        pixels = self.pixels
+        for offset in range(top*stride + left, bottom*stride + left, stride):
+            pixels[offset:offset + len(row)] = row
+        self.add_damage(left, top, right - left, bottom - top)
+
+    def blit(self, x, y, width, data):
+        """ copy rows of width palette indices to the screen, they mustn't leave it
+        """
+        if width < 1:
+            raise ValueError("Can't blit rows of {} pixels".format(width))
+        stride = self.screen_width
+        height = len(data) // width
+        if x < 0 or y < 0 or x + width > stride or y + height > self.screen_height or len(data) % width:
+            raise PixelIndexError()
+        if data and max(data) >= len(PALETTE):
+            raise PixelColorError()
+        self.add_damage(x, y, width, height)
+        if x == 0 and width == stride:
+            self.pixels[y*stride:(y + height)*stride] = data
+            return
+        pixels = self.pixels
+        for row in range(height):
+            offset = (y + row)*stride + x
+            pixels[offset:offset + width] = data[row*width:(row + 1)*width]
+
+    def draw_square(self, p, width, height, color):
+        self.fill_rect(p[0], p[1], width + 1, height, color)
+
+    def draw_relation(self, func, color, start=0, end=319, shift=0):
+        for x in range(start+shift, end+shift+1):
+            ret = func(x)
+
+            for y in ret:
+                try:
+                    self.set_pixel(x, round(y), color)
+                except PixelIndexError:
+                    pass
+
+    def draw_function(self, func, color, start=0, end=319, shift=0, offset=0):
+        for x in range(start+shift, end+shift+1):
+            y = func(x)
+            y_next = func(x+1)
+
+            try:
+                if y - y_next >= 1 or y - y_next <= -1:
+                    self.draw_line((x, y + offset), (x + 1, y_next + offset), color)
+                else:
+                    self.set_pixel(x, y + offset, color)
+            except PixelIndexError:
+                pass
+
+    def draw_line(self, a, b, color):
+        # special case: vertical line
+        if a[0] == b[0]:
+            if a[1] < b[1]:
+                x1, y1 = a
+                x2, y2 = b
+            else:
+                x1, y1 = b
+                x2, y2 = a
+
+            self.draw_relation(lambda x: range(round(y1), round(y2)), color, start=x1, end=x2)
+            return
+
+        if a[0] < b[0]:
+            x1, y1 = a
+            x2, y2 = b
+        else:
+            x1, y1 = b
+            x2, y2 = a
+
+        slope = round((y2 - y1) / (x2 - x1), 2)   # slope per pixel
+
+        x_current, y_current = x1, y1
+        for xi in range(x1, x2+1):
+            y_new = y_current + slope
+            if slope <= 1 and slope >= -1:
+                try:
+                    self.set_pixel(xi, round(y_new), color)
+                except PixelIndexError:
+                    continue
+            else:
+                for yi in range(round(y_current), round(y_current+abs(slope))):
+                    try:
+                        self.set_pixel(xi, round(yi), color)
+                    except PixelIndexError:
+                        continue
+
+            x_current, y_current = xi, y_new
+
+    def draw_circle(self, p, r, color):
+        for x in range(-r, r):
+            y = round(math.sqrt(abs(math.pow(r, 2)-math.pow(x, 2))))
+            y_next = round(math.sqrt(abs(math.pow(r, 2)-math.pow(x+1, 2))))
+
+            try:
+                if y_next-y >= 1 or y_next-y <= -1:
+                    self.draw_line((p[0] + x, p[1] + y - 1), (p[0] + x, p[1] + y_next - 1), color)
+                else:
+                    self.set_pixel(p[0] + x, p[1] + y - 1, color)
+            except PixelIndexError:
+                pass
+
+            try:
+                if y-y_next >= 1 or y-y_next <= -1:
+                    self.draw_line((p[0] + x, p[1] - y_next), (p[0] + x, p[1] - y), color)
+                else:
+                    self.set_pixel(p[0] + x, p[1] - y, color)
+            except PixelIndexError:
+                pass
+
+    def update_screen_buffer(self):
+        """ publish the pixels as new frame, if anything changed since the last one
+
+        :return: True if a frame was published
+        """
+        damage = self.damage
+        if not damage:
+            return False
+        self._damage = []
+        self._box = [self.screen_width, self.screen_height, 0, 0]
+        self._frame = bytes(self.pixels)
+        self._frames += 1
+        self.present(self._frame, damage)
+        return True
+
+    def present(self, frame, damage):
+        """ called with every published frame and the Rects changed since the last one
+        """
+        pass
+
+
+def bounding_rect(rects):
+    """ returns the smallest Rect containing all of the given ones
+    """
+    left = min(rect[0] for rect in rects)
+    top = min(rect[1] for rect in rects)
+    right = max(rect[0] + rect[2] for rect in rects)
+    bottom = max(rect[1] + rect[3] for rect in rects)
+    return Rect(left, top, right - left, bottom - top)
+
+
+def scale_frame(frame, scale, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """ returns a frame scaled up by an integer factor with nearest neighbour
+    Every row is widened once with strided slice assignments and then repeated.
+    """
+    if scale == 1:
+        return frame
+    rows = []
+    for y in range(height):
+        row = frame[y*width:(y + 1)*width]
+        wide = bytearray(width * scale)
+        for k in range(scale):
+            wide[k::scale] = row
+        rows.append(bytes(wide) * scale)
+    return b"".join(rows)
+
+
+# lookup tables from palette index to one color channel, for bytes.translate()
+_CHANNELS = [bytes(PALETTE[i][channel] if i < len(PALETTE) else 0 for i in range(256)) for channel in range(3)]
+
+
+def encode_ppm(frame, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """ returns a frame of palette indices as binary PPM image
+    """
+    rgb = bytearray(len(frame) * 3)
+    for channel, table in enumerate(_CHANNELS):
+        rgb[channel::3] = frame.translate(table)
+    return "P6\n{} {}\n255\n".format(width, height).encode('ascii') + bytes(rgb)
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_png(frame, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    """ returns a frame of palette indices as indexed 8 bit PNG image
+    """
+    rows = b"".join(b"\x00" + frame[y*width:(y + 1)*width] for y in range(height))
+    return b"\x89PNG\r\n\x1a\n" + \
+        _png_chunk(b"IHDR", struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)) + \
+        _png_chunk(b"PLTE", bytes(value for color in PALETTE for value in color)) + \
+        _png_chunk(b"IDAT", zlib.compress(rows)) + \
+        _png_chunk(b"IEND", b"")
+
+
+ENCODERS = {
+    '.ppm': encode_ppm,
+    '.png': encode_png
+}
+
+
+class HeadlessScreen(Framebuffer):
+    """ Screen without a display
+
+    Works like ScreenEGA but needs neither Qt nor a display, so the emulator runs in batch jobs. If
+    a directory is given every published frame is written to it as frame_00001.png and so on. Like
+    on ScreenEGA the scale is only applied to the exported images.
+    """
+
+    def __init__(self, directory=None, format='png', scale=1, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        """
+        :param directory: directory to write the frames to, nothing is written if not given
+        :param format: png or ppm
+        :param scale: integer factor the exported images are scaled up by
+        :param width: width of the screen, 640 fits 80 columns of text
+        :param height: height of the screen
+        """
+        super().__init__(width, height)
+        if '.' + format not in ENCODERS:
+            raise ValueError("Unknown image format '{}'".format(format))
+        if scale < 1:
+            raise ValueError("Scale has to be at least 1")
+        self._directory = directory
+        self._format = format
+        self._scale = scale
+
+    def present(self, frame, damage):
+        if self._directory is not None:
+            self.save(os.path.join(self._directory, "frame_{:05d}.{}".format(self.frames, self._format)), frame)
+
+    def _encode(self, encoder, frame):
+        scale = self._scale
+        width, height = self.screen_width, self.screen_height
+        return encoder(scale_frame(frame, scale, width, height), width*scale, height*scale)
+
+    def to_ppm(self):
+        return self._encode(encode_ppm, self.frame)
+
+    def to_png(self):
+        return self._encode(encode_png, self.frame)
+
+    def save(self, path, frame=None):
+        """ write a frame, the current one by default, as image file, the format follows the extension
+        """
+        encoder = ENCODERS.get(os.path.splitext(path)[1].lower())
+        if encoder is None:
+            raise ValueError("Can't tell the image format of '{}'".format(path))
+        with open(path, "wb") as f:
+            f.write(self._encode(encoder, self.frame if frame is None else frame))
@@ -0,0 +1,184 @@
+import sys
+from collections import namedtuple
+
+# snapshot of the heap returned by Kernel.memory_statistics()
+MemoryStatistics = namedtuple('MemoryStatistics', [
+    'bytes_in_use',             # bytes requested by all live blocks
+    'live_blocks',
+    'high_water_mark',          # largest bytes_in_use ever reached
+    'allocations',
+    'reallocations',            # blocks resized in place
+    'frees',
+    'failed_allocations',
+    'heap_in_use',              # bytes reserved on the heap, including slab and size class overhead
+    'free_bytes',
+    'largest_free_extent',
+    'fragmentation',            # 1 - largest_free_extent / free_bytes
+    'allocation_latency',       # Histogram of allocation times in ns
+    'free_latency'              # Histogram of free times in ns
+])
+
+# estimated allocations of one caller, see AllocationProfile
+AllocationSite = namedtuple('AllocationSite', ['filename', 'line', 'function', 'allocations', 'bytes', 'live_bytes'])
+
+
+class Histogram(object):
+    """ Histogram with power of two buckets
+    Bucket n counts the values from 2^(n-1) up to 2^n - 1, bucket 0 counts zeros.
+    """
+
+    def __init__(self):
+        self._buckets = [0] * 65
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, value):
+        self._buckets[value.bit_length()] += 1
+        self._count += 1
+
+    def buckets(self):
+        """ returns (upper bound, count) of all non empty buckets
+        """
+        return [((1 << n) - 1, count) for n, count in enumerate(self._buckets) if count]
+
+    def percentile(self, p):
+        """ returns the upper bound of the bucket containing the p-th percentile
+        """
+        rank = self._count * p / 100.0
+        seen = 0
+        for n, count in enumerate(self._buckets):
+            seen += count
+            if count and seen >= rank:
+                return (1 << n) - 1
+        return 0
+
+    def dump(self):
+        """ returns the histogram as printable lines
+        """
+        width = max([count for _, count in self.buckets()] or [1])
+        return ["{:>12} ns: {:>8} {}".format(bound, count, "#" * (count * 40 // width))
+                for bound, count in self.buckets()]
+
+
+class AllocationProfile(object):
+    """ Sampling profile of the callers requesting memory
+
+    Every rate-th allocation the first stack frame outside of the modules listed in skip is recorded.
+    The counters of every site are multiplied by the rate, so they estimate the total over all
+    allocations. live_bytes are the sampled bytes that haven't been freed yet, sites that keep
+    growing there never free what they allocate.
+    """
+
+    def __init__(self, rate=1, skip=('kernel', 'stdlib', 'heapstats', 'arena')):
+        if rate < 1:
+            raise ValueError("Sampling rate has to be at least 1")
+        self._rate = rate
+        self._skip = frozenset(skip)
+        self._countdown = rate
+        self._sites = {}        # (filename, line, function) -> [allocations, bytes, live bytes]
+        self._sampled = {}      # address -> (site, size) of sampled blocks that are still live
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def allocated(self, address, size):
+        self._countdown -= 1
+        if self._countdown:
+            return
+        self._countdown = self._rate
+
+        frame = sys._getframe(1)
+        while frame.f_back is not None and frame.f_globals.get('__name__') in self._skip:
+            frame = frame.f_back
+        site = (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+        counters = self._sites.get(site)
+        if counters is None:
+            counters = self._sites[site] = [0, 0, 0]
+        counters[0] += 1
+        counters[1] += size
+        counters[2] += size
+        self._sampled[address] = (site, size)
+
+    def resized(self, address, size):
+        sample = self._sampled.get(address)
+        if sample is not None:
+            self._sites[sample[0]][2] += size - sample[1]
+            self._sampled[address] = (sample[0], size)
+
+    def freed(self, address):
+        sample = self._sampled.pop(address, None)
+        if sample is not None:
+            self._sites[sample[0]][2] -= sample[1]
+
+    def sites(self):
+        """ returns the AllocationSites sorted by the bytes they allocated, largest first
+        """
+        rate = self._rate
+        sites = [AllocationSite(filename, line, function, allocations * rate, size * rate, live * rate)
+                 for (filename, line, function), (allocations, size, live) in self._sites.items()]
+        return sorted(sites, key=lambda site: site.bytes, reverse=True)
+
+
+class HeapStats(object):
+    """ Counters of the allocations going through the kernel
+    """
+
+    def __init__(self):
+        self.allocations = 0
+        self.reallocations = 0
+        self.frees = 0
+        self.failed_allocations = 0
+        self.bytes_in_use = 0
+        self.high_water_mark = 0
+        self.allocation_latency = Histogram()
+        self.free_latency = Histogram()
+        self.profile = None         # AllocationProfile, if profiling
+        self._live = {}             # address -> requested size
+
+    @property
+    def live_blocks(self):
+        return len(self._live)
+
+    def allocated(self, address, size, ns):
+        self.allocation_latency.add(ns)
+        if address is None:
+            self.failed_allocations += 1
+            return
+
+        self.allocations += 1
+        self._live[address] = size
+        self.bytes_in_use += size
+        if self.bytes_in_use > self.high_water_mark:
+            self.high_water_mark = self.bytes_in_use
+        if self.profile is not None:
+            self.profile.allocated(address, size)
+
+    def size_of(self, address):
+        """ returns the requested size of a live block or None
+        """
+        return self._live.get(address)
+
+    def resized(self, address, size, ns):
+        self.allocation_latency.add(ns)
+        self.reallocations += 1
+        self.bytes_in_use += size - self._live[address]
+        self._live[address] = size
+        if self.bytes_in_use > self.high_water_mark:
+            self.high_water_mark = self.bytes_in_use
+        if self.profile is not None:
+            self.profile.resized(address, size)
+
+    def freed(self, address, ns):
+        self.free_latency.add(ns)
+        size = self._live.pop(address, None)
+        if size is None:
+            return
+
+        self.frees += 1
+        self.bytes_in_use -= size
+        if self.profile is not None:
+            self.profile.freed(address)
@@ -1,4 +1,17 @@
+import collections
+
+# operand types of a decoded instruction
+Register = collections.namedtuple('Register', ['name', 'id'])                   # id as returned by register.resolve()
+Immediate = collections.namedtuple('Immediate', ['value'])
+Memory = collections.namedtuple('Memory', ['base', 'displacement', 'size'])     # base register id or None, size in bit or None
+Label = collections.namedtuple('Label', ['name', 'target'])                     # target is the index of the instruction
+
+
 class Instruction(object):
-    def __init__(self):
-        self.instruction = None
-        self.parameters = []
\ No newline at end of file
+    def __init__(self, instruction=None, parameters=None, line=None):
+        self.instruction = instruction
+        self.parameters = parameters if parameters is not None else []
+        self.line = line        # line in the source file, for error messages
+
+    def __repr__(self):
+        return "Instruction({!r}, {!r}, line={})".format(self.instruction, self.parameters, self.line)
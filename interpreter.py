@@ -1,10 +1,11 @@
 import json
 import logging
 
-
-import stdlib
+import register
 
 from core import Core
+from instruction import Register, Immediate, Memory, Label
+from memory import HOT_MASK
 
 FORMAT = '%(asctime)-15s %(name)-12s %(levelname)-8s %(message)s'
 LOG = logging.getLogger('interpreter')
@@ -13,31 +14,425 @@ ch = logging.StreamHandler()
 ch.setFormatter(logging.Formatter(FORMAT))
 LOG.addHandler(ch)
 
+class InterpreterError(Exception):
+    def __init__(self, line, message):
+        super().__init__("line {}: {}".format(line, message))
+        self.line = line
+
+
 class Interpreter(object):
+    """ Executes assembled instructions on a Core
 
-    def __init__(self, instructions):
-        self._instructions = instructions
+    Before running, every instruction is compiled into a closure with its operands already resolved,
+    the run loop then only has to call the closure of the current instruction. Each closure returns
+    the index of the next instruction.
+    """
 
-        self._core = Core()
+    def __init__(self, instructions, core=None, kernel=None, verbose=False):
+        """
+        :param instructions: list of Instructions as produced by the assembler
+        :param core: the Core to run on, a new one is created if not given
+        :param kernel: Kernel handling INT instructions
+        :param verbose: log every instruction and dump the registers after it
+        """
+        self._core = core if core is not None else Core()
+        self._kernel = kernel
+        self._verbose = verbose
+
+        self._instructions = None
+        self._program = None
+        self.load(instructions)
 
         self._pointer = {}
 
+    @property
+    def core(self):
+        return self._core
+
+    def load(self, instructions):
+        """ replace the program, it gets compiled again on the next run
+        """
+        self._instructions = list(instructions)
+        self._program = None
+
+    def compile(self):
+        """ compile all instructions into closures
+        """
+        compilers = {
+            'NOP': self._compile_nop,
+            'LOCK': self._compile_lock,
+            'MOV': self._compile_mov,
+            'INC': self._compile_inc,
+            'DEC': self._compile_dec,
+            'PUSH': self._compile_push,
+            'POP': self._compile_pop,
+            'PUSHA': self._compile_pusha,
+            'POPA': self._compile_popa,
+            'CALL': self._compile_call,
+            'RET': self._compile_ret,
+            'ENTER': self._compile_enter,
+            'LEAVE': self._compile_leave,
+            'INT': self._compile_int,
+            'JMP': self._compile_jmp,
+            'JC': self._compile_jc,
+            'JNC': self._compile_jnc,
+            'CLC': self._compile_clc,
+            'STC': self._compile_stc,
+            'LOOP': self._compile_loop,
+        }
+
+        program = []
+        for index, ins in enumerate(self._instructions):
+            if ins.instruction not in compilers:
+                raise InterpreterError(ins.line, "unsupported instruction '{}'".format(ins.instruction))
+            program.append(compilers[ins.instruction](ins, index + 1))
+        self._program = program
+
     def run(self):
-        LOG.debug("Interpreting {} instructions".format(len(self._instructions)))
-        for i in self._instructions:
-            LOG.debug("{} {}, {}".format(i.instruction, i.parameters[0], i.parameters[1]))
-            if i.instruction == 'MOV':
-                setattr(self._core, i.parameters[0], int(i.parameters[1]))
-                LOG.debug(self._core.dump_registers())
-            elif i.instruction == 'INC':
-                setattr(self._core, i.parameters[0], getattr(self._core, ))
+        if self._program is None:
+            self.compile()
+
+        program = self._program
+        end = len(program)
+        pc = 0
+
+        if self._verbose:
+            LOG.debug("Interpreting {} instructions".format(end))
+            while pc < end:
+                ins = self._instructions[pc]
+                LOG.debug("{} {}".format(ins.instruction, ins.parameters))
+                pc = program[pc]()
                 LOG.debug(self._core.dump_registers())
 
-        memdump = self._core.dump_memory()
-        LOG.debug("Memory dump:".format())
-        for row in memdump:
-            LOG.debug(row)
+            LOG.debug("Memory dump:")
+            for row in self._core.dump_memory():
+                LOG.debug(row)
+        else:
+            while pc < end:
+                pc = program[pc]()
+
+    """ Operand helpers
+    """
+    def _address(self, operand):
+        """ returns a function computing the effective address of a memory operand
+        """
+        displacement = operand.displacement
+        if operand.base is None:
+            return lambda: displacement
+        get_reg = self._core.get_reg
+        base = operand.base
+        return lambda: (get_reg(base) + displacement) & 0xffffffff
+
+    def _reader(self, operand, size, ins):
+        """ returns a function reading the value of an operand
+        """
+        if isinstance(operand, Immediate):
+            value = operand.value
+            return lambda: value
+        if isinstance(operand, Register):
+            get_reg = self._core.get_reg
+            reg = operand.id
+            return lambda: get_reg(reg)
+        if isinstance(operand, Memory):
+            address = self._address(operand)
+            read_memory = self._core.read_memory
+            number = self._size(operand, size, ins) // 8
+            return lambda: int.from_bytes(read_memory(address(), number), 'little')
+        raise InterpreterError(ins.line, "invalid operand {}".format(operand))
+
+    def _size(self, operand, size, ins):
+        size = operand.size or size
+        if size is None:
+            raise InterpreterError(ins.line, "operand size unknown, use byte, word or dword")
+        return size
+
+    def _label(self, ins):
+        operand = ins.parameters[0]
+        if not isinstance(operand, Label):
+            raise InterpreterError(ins.line, "{} needs a label".format(ins.instruction))
+        return operand.target
+
+    def _immediate(self, ins, index):
+        operand = ins.parameters[index]
+        if not isinstance(operand, Immediate):
+            raise InterpreterError(ins.line, "{} needs an immediate".format(ins.instruction))
+        return operand.value
+
+    def _register(self, ins):
+        operand = ins.parameters[0]
+        if not isinstance(operand, Register):
+            raise InterpreterError(ins.line, "{} needs a register".format(ins.instruction))
+        return operand.id
+
+    """ Instruction compilers
+
+        Each one takes the instruction and the index of the following instruction and returns the closure
+    """
+    def _compile_nop(self, ins, nxt):
+        return lambda: nxt
+
+    def _compile_mov(self, ins, nxt):
+        target, src = ins.parameters
+        core = self._core
+
+        if isinstance(target, Register):
+            reg = target.id
+            if isinstance(src, Immediate):
+                mov_reg_imm = core.mov_reg_imm
+                value = src.value
+
+                def mov():
+                    mov_reg_imm(reg, value)
+                    return nxt
+                return mov
+
+            if isinstance(src, Register):
+                mov_reg_reg = core.mov_reg_reg
+                src = src.id
+
+                def mov():
+                    mov_reg_reg(reg, src)
+                    return nxt
+                return mov
+
+            mov_reg_imm = core.mov_reg_imm
+            read = self._reader(src, register.width(reg), ins)
+
+            def mov():
+                mov_reg_imm(reg, read())
+                return nxt
+            return mov
+
+        if isinstance(target, Memory):
+            width = register.width(src.id) if isinstance(src, Register) else None
+            number = self._size(target, width, ins) // 8
+            mask = (1 << (number * 8)) - 1
+            address = self._address(target)
+            read = self._reader(src, number * 8, ins)
+            write_memory = core.write_memory
+
+            def mov():
+                write_memory(address(), (read() & mask).to_bytes(number, 'little'))
+                return nxt
+            return mov
+
+        raise InterpreterError(ins.line, "invalid MOV target {}".format(target))
+
+    def _compile_lock(self, ins, nxt):
+        """ the LOCK prefix, compiles the following instruction into a closure holding the memory lock
+        """
+        locked = self._locked(ins, nxt)
+        instruction = getattr(self, "_compile_" + locked.instruction.lower())(locked, nxt + 1)
+        lock = self._core.memory_lock
+
+        def lock_():
+            with lock:
+                return instruction()
+        return lock_
+
+    def _locked(self, ins, nxt):
+        """ returns the instruction a LOCK prefix applies to
+        """
+        if nxt >= len(self._instructions):
+            raise InterpreterError(ins.line, "LOCK needs a following instruction")
+        locked = self._instructions[nxt]
+        if locked.instruction not in ('INC', 'DEC') or not isinstance(locked.parameters[0], Memory):
+            raise InterpreterError(ins.line, "LOCK can only be used with INC or DEC on memory")
+        return locked
+
+    def _compile_inc(self, ins, nxt):
+        if isinstance(ins.parameters[0], Memory):
+            return self._compile_memory_update(ins, nxt, self._core.inc_memory)
+        inc_reg = self._core.inc_reg
+        reg = self._register(ins)
+
+        def inc():
+            inc_reg(reg)
+            return nxt
+        return inc
+
+    def _compile_dec(self, ins, nxt):
+        if isinstance(ins.parameters[0], Memory):
+            return self._compile_memory_update(ins, nxt, self._core.dec_memory)
+        dec_reg = self._core.dec_reg
+        reg = self._register(ins)
+
+        def dec():
+            dec_reg(reg)
+            return nxt
+        return dec
+
+    def _compile_memory_update(self, ins, nxt, update):
+        operand = ins.parameters[0]
+        address = self._address(operand)
+        number = self._size(operand, None, ins) // 8
+
+        def update_():
+            update(address(), number)
+            return nxt
+        return update_
+
+    def _compile_push(self, ins, nxt):
+        """ aligned pushes to the page the stack was last written to go straight into the memory's
+        hot_words, everything else through Core.push_imm()
+        """
+        core = self._core
+        push_imm = core.push_imm
+        read = self._reader(ins.parameters[0], 32, ins)
+        memory = core.memory
+        regs = core.register_file
+        esp_slot = register.ESP
+
+        def push():
+            esp = (regs[esp_slot] - 4) & 0xffffffff
+            hot = memory.hot
+            if esp & HOT_MASK == hot and core.trace is None:
+                memory.hot_words[(esp - hot) >> 2] = read() & 0xffffffff
+                regs[esp_slot] = esp
+            else:
+                push_imm(read())
+            return nxt
+        return push
+
+    def _compile_pop(self, ins, nxt):
+        core = self._core
+        pop_reg = core.pop_reg
+        reg = self._register(ins) if ins.parameters else None
+        if reg is None or register.OPERANDS[reg][2] != 0xffffffff or reg == register.ESP:
+            def pop():
+                pop_reg(reg)
+                return nxt
+            return pop
+
+        memory = core.memory
+        regs = core.register_file
+        esp_slot = register.ESP
+        slot = register.OPERANDS[reg][0]
+
+        def pop():
+            esp = regs[esp_slot]
+            hot = memory.hot
+            if esp & HOT_MASK == hot and core.trace is None:
+                regs[slot] = memory.hot_words[(esp - hot) >> 2]
+                regs[esp_slot] = (esp + 4) & 0xffffffff
+            else:
+                pop_reg(reg)
+            return nxt
+        return pop
+
+    def _compile_pusha(self, ins, nxt):
+        pusha = self._core.pusha
+
+        def pusha_():
+            pusha()
+            return nxt
+        return pusha_
+
+    def _compile_popa(self, ins, nxt):
+        popa = self._core.popa
+
+        def popa_():
+            popa()
+            return nxt
+        return popa_
+
+    def _compile_call(self, ins, nxt):
+        """ the return address pushed by CALL is the index of the following instruction
+        """
+        push_imm = self._core.push_imm
+        target = self._label(ins)
+
+        def call():
+            push_imm(nxt)
+            return target
+        return call
+
+    def _compile_ret(self, ins, nxt):
+        pop_imm = self._core.pop_imm
+        release = self._immediate(ins, 0) if ins.parameters else 0
+        if not release:
+            return lambda: pop_imm()
+
+        regs = self._core.register_file
+        esp = register.ESP
+
+        def ret():
+            target = pop_imm()
+            regs[esp] = (regs[esp] + release) & 0xffffffff
+            return target
+        return ret
+
+    def _compile_enter(self, ins, nxt):
+        enter = self._core.enter
+        size = self._immediate(ins, 0)
+        if len(ins.parameters) > 1 and self._immediate(ins, 1):
+            raise InterpreterError(ins.line, "ENTER only supports nesting level 0")
+
+        def enter_():
+            enter(size)
+            return nxt
+        return enter_
+
+    def _compile_leave(self, ins, nxt):
+        leave = self._core.leave
+
+        def leave_():
+            leave()
+            return nxt
+        return leave_
+
+    def _compile_int(self, ins, nxt):
+        if self._kernel is None:
+            raise InterpreterError(ins.line, "INT needs a kernel")
+        interrupt = self._kernel.interrupt
+        read = self._reader(ins.parameters[0], 8, ins)
+
+        def int_():
+            interrupt(read())
+            return nxt
+        return int_
+
+    def _compile_jmp(self, ins, nxt):
+        target = self._label(ins)
+        return lambda: target
+
+    def _compile_jc(self, ins, nxt):
+        target = self._label(ins)
+        core = self._core
+        return lambda: target if core.EFLAGS & 0x01 else nxt
+
+    def _compile_jnc(self, ins, nxt):
+        target = self._label(ins)
+        core = self._core
+        return lambda: nxt if core.EFLAGS & 0x01 else target
+
+    def _compile_clc(self, ins, nxt):
+        clear_flags = self._core.clear_flags
+
+        def clc():
+            clear_flags(0x01)
+            return nxt
+        return clc
+
+    def _compile_stc(self, ins, nxt):
+        set_flags = self._core.set_flags
+
+        def stc():
+            set_flags(0x01)
+            return nxt
+        return stc
+
+    def _compile_loop(self, ins, nxt):
+        target = self._label(ins)
+        get_reg = self._core.get_reg
+        mov_reg_imm = self._core.mov_reg_imm
+        ecx = register.ECX
 
+        def loop():
+            value = (get_reg(ecx) - 1) & 0xffffffff
+            mov_reg_imm(ecx, value)
+            return target if value else nxt
+        return loop
 
     # need to move to the interpreter
     def add_pointer(self, name, value=0x00):
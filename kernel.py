@@ -1,9 +1,14 @@
-import collections
+import copy
 import logging
-import json
+import time
 
-from core import Core
-from singleton import Singleton
+import tracer
+from allocator import FreeListAllocator, BEST_FIT
+from arena import Arena
+from console import TextConsole
+from framebuffer import CELL_WIDTH, CELL_HEIGHT
+from heapstats import HeapStats, AllocationProfile, MemoryStatistics
+from slab import SlabAllocator
 
 FORMAT = '%(asctime)-15s %(name)-12s %(levelname)-8s %(message)s'
 LOG = logging.getLogger('kernel')
@@ -13,90 +18,279 @@ ch.setFormatter(logging.Formatter(FORMAT))
 LOG.addHandler(ch)
 
 
-class Kernel(metaclass=Singleton):
+# syscall numbers, passed in EAX to INT 0x80
+SYS_EXIT = 0x01
+SYS_WRITE = 0x04
+SYS_SEND_IPI = 0x100        # EBX: target cpu, ECX: interrupt vector
+SYS_WAIT_IPI = 0x101        # blocks until an IPI arrives, returns the vector in EAX and the sender in EBX
 
-    def __init__(self, core=Core(), screen=None):
+
+class Kernel(object):
+    heap_start = 0x0000
+    heap_end = 0xffff+1
+
+    def __init__(self, core, screen=None, allocation_policy=BEST_FIT, output=None, cpu=0, interrupts=None, heap=True):
+        """
+        :param core: the Core the kernel manages
+        :param screen: Framebuffer sys_write() prints stdout to, through a TextConsole of up to 80x25
+        :param allocation_policy: policy of the heap
+        :param output: function(fd, data) receiving everything written with sys_write() instead of
+            the screen and the log
+        :param cpu: number of the core in a multi-core machine
+        :param interrupts: smp.InterruptController delivering inter-processor interrupts
+        :param heap: False gives the kernel an empty heap, every allocation fails then. Kernels sharing
+            their memory with others must not hand out the same addresses.
+        """
         self.__core = core
         self.__screen = screen
-        self.__memtab = {}
-
+        self.__console = None
+        if screen is not None:
+            self.__console = TextConsole(screen, columns=min(80, screen.screen_width // CELL_WIDTH),
+                                         rows=min(25, screen.screen_height // CELL_HEIGHT), attribute=0x0a)
+        self.__output = output
+        self.__cpu = cpu
+        self.__interrupts = interrupts
+        self.__handlers = {}
+        self.__heap = FreeListAllocator(Kernel.heap_start, Kernel.heap_end if heap else Kernel.heap_start,
+                                        allocation_policy)
+        self.__slabs = SlabAllocator(self.allocate_memory, self.free_memory)
+        self.__stats = HeapStats()
 
         # https://filippo.io/linux-syscall-table/
         # some management tables
         self._syscalls = {
-            0x01: self.sys_exit,
-            0x04: self.sys_write
+            SYS_EXIT: self.sys_exit,
+            SYS_WRITE: self.sys_write,
+            SYS_SEND_IPI: self.sys_send_ipi,
+            SYS_WAIT_IPI: self.sys_wait_ipi
         }
 
     def interrupt(self, num):
-        LOG.debug("Interrupt received: {}".format(num))
+        trace = self.__core.trace
+        if trace is not None:
+            trace.record(tracer.INTERRUPT, 0, num)
         if num == 0x80:
-            LOG.debug("Executing syscall: {}".format(self.__core.EAX))
+            if trace is not None:
+                trace.record(tracer.SYSCALL, 0, self.__core.EAX)
             self._syscalls[self.__core.EAX]()
+        elif num in self.__handlers:
+            self.__handlers[num]()
+
+    def set_interrupt_handler(self, num, handler):
+        """ call handler() whenever interrupt num is raised, None removes the handler
+        """
+        if handler is None:
+            self.__handlers.pop(num, None)
+        else:
+            self.__handlers[num] = handler
+
+    @property
+    def cpu(self):
+        return self.__cpu
+
+    def send_ipi(self, cpu, vector):
+        """ raise interrupt vector on another core
+        """
+        if self.__interrupts is None:
+            raise IOError("No interrupt controller connected!")
+        if vector == 0x80:
+            raise ValueError("Interrupt 0x80 is reserved for syscalls")
+        self.__interrupts.send(cpu, vector, self.__cpu)
+
+    def wait_ipi(self, timeout=None):
+        """ wait for an inter-processor interrupt and raise it on this core
+
+        :return: (vector, sending cpu) or None if the timeout expired
+        """
+        if self.__interrupts is None:
+            raise IOError("No interrupt controller connected!")
+        ipi = self.__interrupts.receive(self.__cpu, timeout)
+        if ipi is not None:
+            self.interrupt(ipi[0])
+        return ipi
 
     def sys_exit(self):
         LOG.debug("sys_exit() ...")
 
+    def sys_send_ipi(self):
+        self.send_ipi(self.__core.EBX, self.__core.ECX)
+
+    def sys_wait_ipi(self):
+        vector, sender = self.wait_ipi()
+        self.__core.EAX = vector
+        self.__core.EBX = sender
+
     def sys_write(self):
         LOG.debug("Printing to screen ...")
         msg_addr = self.__core.ECX
         msg_len = self.__core.EDX
         msg_target = self.__core.EBX
 
-        msg = self.__core.get_memory_range(msg_addr, msg_len)
+        if msg_target not in (1, 2):
+            raise ValueError("sys_write() can only write to stdout or stderr")
+        if self.__output is not None:
+            self.__output(msg_target, self.__core.read_memory(msg_addr, msg_len))
+            return
 
         if msg_target == 1:
-            if not self.__screen:
+            if self.__console is None:
                 raise IOError("No screen connected!")
-            x=0
-            for c in msg:
-                self.__screen.set_character(c, x, 0, 10)
-                x += 1
-            self.__screen.update_screen_buffer()
-        elif msg_target == 2:
+            self.__console.write(self.__core.read_memory(msg_addr, msg_len))
+            self.__console.flush()
+        else:
+            msg = self.__core.get_memory_range(msg_addr, msg_len)
             msg = [chr(c) for c in msg]
             LOG.error("".join(msg))
-        else:
-            raise ValueError("sys_write() can only write to stdout or stderr")
 
-    def allocate_memory(self, size):
-        LOG.debug("Memory allocation table: {}".format(json.dumps(self.__memtab, sort_keys=True)))
-        address = self.__find_free_memory(size)
-        if not address is None:
-            self.__memtab[address] = address + size - 1
-            LOG.debug("Memory allocation table: {}".format(json.dumps(self.__memtab, sort_keys=True)))
+    @property
+    def console(self):
+        """ the TextConsole stdout is written to, None without a screen
+        """
+        return self.__console
+
+    @property
+    def core(self):
+        return self.__core
+
+    @property
+    def slabs(self):
+        """ allocator for small objects, carving its slabs out of the heap
+        """
+        return self.__slabs
+
+    def allocate(self, size):
+        """ allocate a block for a program, small blocks come from the slabs, larger ones from the heap
+
+        :return: the address of the block or None if there is no memory left
+        """
+        start = time.perf_counter_ns()
+        address = self.__slabs.allocate(size)
+        if address is None:
+            address = self.__heap.allocate(size)
+        self.__stats.allocated(address, size, time.perf_counter_ns() - start)
+        return address
+
+    def allocate_zeroed(self, size):
+        """ allocate a block like allocate() and clear it
+        """
+        address = self.allocate(size)
+        if address is not None:
+            self.__core.fill_memory(address, size, 0x00)
         return address
 
-    def __find_free_memory(self, size):
-        last_addr = 0x00
-        current_addr = None
-        is_end = True
+    def reallocate(self, address, size):
+        """ resize a block allocated with allocate()
+
+        Blocks are resized in place if they fit into their slab object or if the heap memory following
+        them is free. Otherwise a new block is allocated, the content copied over and the old block freed.
+
+        :param address: address of the block, None allocates a new one
+        :param size: new size, at least one byte like for allocate(), use free() to release a block
+        :return: the address of the block or None if there is no memory left, the old block is kept then
+        """
+        if size < 1:
+            raise ValueError("Can't resize a block to {} bytes".format(size))
+        if address is None:
+            return self.allocate(size)
+        old = self.__stats.size_of(address)
+        if old is None:
+            raise ValueError("No block allocated at {:04X}".format(address))
+
+        start = time.perf_counter_ns()
+        slab_size = self.__slabs.size_of(address)
+        if slab_size is not None:
+            resized = size <= slab_size
+        else:
+            resized = self.__heap.resize(address, size)
+        if resized:
+            self.__stats.resized(address, size, time.perf_counter_ns() - start)
+            return address
 
-        # transform dict to flat list
-        memtab = collections.OrderedDict(sorted(self.__memtab.items())).items()
-        memtab = [i for s in memtab for i in s]
+        new = self.allocate(size)
+        if new is not None:
+            self.__core.copy_memory(new, address, min(old, size))
+            self.free(address)
+        return new
 
-        # no memory reserved
-        if not memtab:
-            return 0x00
+    def snapshot(self):
+        """ capture the state of the heap, the slabs and the allocation statistics
 
-        # check the amount of from the ending of the last block to the next block
-        for addr in memtab:
-            is_end = not is_end
-            current_addr = addr
-            if not is_end:
-                if (addr - last_addr) > size:
-                    return last_addr + 1
+        :return: an opaque snapshot that can be passed to restore()
+        """
+        # the slabs allocate through this kernel, it must not be copied along with them
+        return copy.deepcopy((self.__heap, self.__slabs, self.__stats), {id(self): self})
 
-            last_addr = addr
+    def restore(self, snapshot):
+        """ reset the allocators to a state captured with snapshot(), blocks allocated since are forgotten
+        A snapshot can be restored any number of times.
+        """
+        self.__heap, self.__slabs, self.__stats = copy.deepcopy(snapshot, {id(self): self})
 
-        if is_end and (0xffff - current_addr > size):
-            return current_addr + 1
+    def arena(self, chunk_size=0x1000):
+        """ returns a new Arena allocating its chunks from this kernel
+        """
+        return Arena(self, chunk_size)
+
+    def free(self, address):
+        """ free a block allocated with allocate(), unknown addresses are ignored
+        """
+        start = time.perf_counter_ns()
+        if not self.__slabs.free(address) and not self.__slabs.is_slab(address):
+            self.__heap.free(address)
+        self.__stats.freed(address, time.perf_counter_ns() - start)
+
+    def memory_statistics(self):
+        """ returns a MemoryStatistics snapshot of the blocks allocated with allocate() and of the heap
+        """
+        stats = self.__stats
+        heap = self.__heap
+        free = heap.free_bytes
+        largest = heap.largest_free_extent
+        return MemoryStatistics(
+            bytes_in_use=stats.bytes_in_use,
+            live_blocks=stats.live_blocks,
+            high_water_mark=stats.high_water_mark,
+            allocations=stats.allocations,
+            reallocations=stats.reallocations,
+            frees=stats.frees,
+            failed_allocations=stats.failed_allocations,
+            heap_in_use=heap.bytes_in_use,
+            free_bytes=free,
+            largest_free_extent=largest,
+            fragmentation=1.0 - largest / free if free else 0.0,
+            allocation_latency=stats.allocation_latency,
+            free_latency=stats.free_latency)
+
+    def start_allocation_profile(self, rate=1):
+        """ start recording which callers allocate memory, sampling every rate-th allocation
+        A running profile gets replaced.
+        """
+        self.__stats.profile = AllocationProfile(rate)
+
+    def stop_allocation_profile(self):
+        """ stop profiling
+
+        :return: the AllocationSites recorded, largest first
+        """
+        profile = self.__stats.profile
+        self.__stats.profile = None
+        return profile.sites() if profile is not None else []
+
+    def allocation_sites(self):
+        """ returns the AllocationSites of the running profile, largest first
+        """
+        profile = self.__stats.profile
+        return profile.sites() if profile is not None else []
+
+    def allocate_memory(self, size):
+        """ reserve a block of memory on the heap
 
-        return None
+        :param size: size of the block in bytes
+        :return: the address of the block or None if the heap has no free extent large enough
+        """
+        return self.__heap.allocate(size)
 
     def free_memory(self, address):
-        if address in self.__memtab:
-            LOG.debug("Freed {} bytes at address {:04X}".format(self.__memtab[address], address))
-            self.__memtab.pop(address)
-        LOG.debug("Memory allocation table: {}".format(json.dumps(self.__memtab, sort_keys=True)))
+        """ release a block allocated with allocate_memory(), unknown addresses are ignored
+        """
+        self.__heap.free(address)
@@ -0,0 +1,443 @@
+from array import array
+
+import numpy as np
+
+import register
+from core import Core
+from instruction import Register, Immediate, Memory, Label
+from interpreter import InterpreterError
+
+# PUSHA stores the registers in this order from the lowest address up, POPA skips the saved ESP
+PUSHA_ORDER = (register.EDI, register.ESI, register.EBP, register.ESP,
+               register.EBX, register.EDX, register.ECX, register.EAX)
+
+
+class LaneCore(object):
+    """ State of N cores, stored lane by lane in NumPy arrays
+
+    Every register slot is a uint32 array with one entry per lane, the memory is an (N, size) uint8
+    array. Lanes only have memory_size bytes of memory, the Core has the full 32 bit address space,
+    accessing memory beyond that raises an IndexError.
+    """
+
+    def __init__(self, lanes, memory_size=0x10000):
+        if lanes < 1:
+            raise ValueError("At least one lane is needed")
+        self._lanes = lanes
+        self._memory_size = memory_size
+        self.registers = np.zeros((len(register.NAMES), lanes), dtype=np.uint32)
+        self.eflags = np.zeros(lanes, dtype=np.uint32)
+        self.memory = np.zeros((lanes, memory_size), dtype=np.uint8)
+        self.registers[register.ESP] = memory_size & 0xffffffff
+
+    @property
+    def lanes(self):
+        return self._lanes
+
+    @property
+    def memory_size(self):
+        return self._memory_size
+
+    def get_reg(self, reg, lanes=slice(None)):
+        """ returns the values of a register operand in the given lanes as int64 array
+        """
+        slot, shift, mask, keep = register.OPERANDS[reg]
+        return (self.registers[slot, lanes].astype(np.int64) >> shift) & mask
+
+    def mov_reg(self, reg, values, lanes=slice(None)):
+        """ set a register operand in the given lanes, values that don't fit set the carry flag
+        like Core.mov_reg_imm() does
+
+        :param values: int or int64 array with one value per lane
+        """
+        slot, shift, mask, keep = register.OPERANDS[reg]
+        if isinstance(values, int):
+            if values > mask or values < 0:
+                self.eflags[lanes] |= 0x01
+            values = values & mask
+        else:
+            values = np.asarray(values, dtype=np.int64)
+            carry = (values > mask) | (values < 0)
+            if carry.any():
+                flags = self.eflags[lanes]
+                flags[carry] |= 0x01
+                self.eflags[lanes] = flags
+            values = values & mask
+        old = self.registers[slot, lanes].astype(np.int64)
+        self.registers[slot, lanes] = ((old & keep) | (values << shift)).astype(np.uint32)
+
+    def read_memory(self, address, number, lanes=slice(None)):
+        """ returns the little endian values of number bytes at one address per lane as int64 array
+        """
+        indices = np.arange(self._lanes)[lanes]
+        address = self._check(address, number)
+        value = np.zeros(len(indices), dtype=np.int64)
+        for k in range(number):
+            value |= self.memory[indices, address + k].astype(np.int64) << (8 * k)
+        return value
+
+    def write_memory(self, address, values, number, lanes=slice(None)):
+        """ store the low number bytes of one value per lane little endian at one address per lane
+        """
+        indices = np.arange(self._lanes)[lanes]
+        address = self._check(address, number)
+        values = np.asarray(values, dtype=np.int64)
+        for k in range(number):
+            self.memory[indices, address + k] = ((values >> (8 * k)) & 0xff).astype(np.uint8)
+
+    def push(self, values, lanes=slice(None)):
+        """ push one 32 bit value per lane onto the stacks of the given lanes
+        """
+        pointer = (self.get_reg(register.ESP, lanes) - 4) & 0xffffffff
+        self.write_memory(pointer, values, 4, lanes)
+        self.mov_reg(register.ESP, pointer, lanes)
+
+    def pop(self, lanes=slice(None)):
+        """ pop the topmost stack entry of the given lanes and return them as int64 array
+        """
+        pointer = self.get_reg(register.ESP, lanes)
+        values = self.read_memory(pointer, 4, lanes)
+        self.mov_reg(register.ESP, (pointer + 4) & 0xffffffff, lanes)
+        return values
+
+    def _check(self, address, number):
+        address = np.asarray(address, dtype=np.int64) & 0xffffffff
+        if np.any(address + number > self._memory_size):
+            raise IndexError("Address outside of the {} bytes of lane memory".format(self._memory_size))
+        return address
+
+    def core(self, lane):
+        """ returns a Core with the state of a single lane
+        """
+        core = Core()
+        core.write_memory(0, self.memory[lane].tobytes())
+        snapshot = core.snapshot()
+        core.restore(snapshot._replace(
+            registers=array('I', self.registers[:, lane].tolist()),
+            eflags=int(self.eflags[lane])))
+        return core
+
+
+class LaneInterpreter(object):
+    """ Runs one program on all lanes of a LaneCore at once
+
+    Instructions are compiled into closures like in the Interpreter, but every closure works on an
+    array of lane indices and returns the next instruction of each of them. Lanes whose branches go
+    different ways are masked: each step executes the instruction with the lowest program counter
+    for all lanes that are waiting there, the others catch up later. Lanes that took a different path
+    join again as soon as they reach the same instruction.
+
+    Return addresses pushed by CALL are instruction indices like in the Interpreter. INT isn't
+    supported, the kernel works on a single Core.
+    """
+
+    def __init__(self, instructions, core):
+        self._core = core
+        self._instructions = list(instructions)
+        self._program = None
+
+    @property
+    def core(self):
+        return self._core
+
+    def compile(self):
+        program = []
+        for index, ins in enumerate(self._instructions):
+            compiler = getattr(self, "_compile_" + ins.instruction.lower(), None)
+            if compiler is None:
+                raise InterpreterError(ins.line, "unsupported instruction '{}'".format(ins.instruction))
+            program.append(compiler(ins, index + 1))
+        self._program = program
+
+    def run(self):
+        """ run until every lane has left the program
+
+        :return: number of steps, each executing one instruction on a group of lanes
+        """
+        if self._program is None:
+            self.compile()
+
+        program = self._program
+        end = len(program)
+        pc = np.zeros(self._core.lanes, dtype=np.int64)
+        steps = 0
+        while True:
+            waiting = pc[pc < end]
+            if not len(waiting):
+                return steps
+            current = int(waiting.min())
+            lanes = np.flatnonzero(pc == current)
+            pc[lanes] = program[current](lanes)
+            steps += 1
+
+    """ Operand helpers
+    """
+    def _address(self, operand):
+        displacement = operand.displacement
+        if operand.base is None:
+            return lambda lanes: displacement
+        get_reg = self._core.get_reg
+        base = operand.base
+        return lambda lanes: (get_reg(base, lanes) + displacement) & 0xffffffff
+
+    def _size(self, operand, size, ins):
+        size = operand.size or size
+        if size is None:
+            raise InterpreterError(ins.line, "operand size unknown, use byte, word or dword")
+        return size
+
+    def _reader(self, operand, size, ins):
+        if isinstance(operand, Immediate):
+            value = operand.value
+            return lambda lanes: value
+        if isinstance(operand, Register):
+            get_reg = self._core.get_reg
+            reg = operand.id
+            return lambda lanes: get_reg(reg, lanes)
+        if isinstance(operand, Memory):
+            address = self._address(operand)
+            read_memory = self._core.read_memory
+            number = self._size(operand, size, ins) // 8
+            return lambda lanes: read_memory(address(lanes), number, lanes)
+        raise InterpreterError(ins.line, "invalid operand {}".format(operand))
+
+    def _immediate(self, ins, index):
+        operand = ins.parameters[index]
+        if not isinstance(operand, Immediate):
+            raise InterpreterError(ins.line, "{} needs an immediate".format(ins.instruction))
+        return operand.value
+
+    def _register(self, ins):
+        operand = ins.parameters[0]
+        if not isinstance(operand, Register):
+            raise InterpreterError(ins.line, "{} needs a register".format(ins.instruction))
+        return operand.id
+
+    def _label(self, ins):
+        operand = ins.parameters[0]
+        if not isinstance(operand, Label):
+            raise InterpreterError(ins.line, "{} needs a label".format(ins.instruction))
+        return operand.target
+
+    """ Instruction compilers
+    """
+    def _compile_nop(self, ins, nxt):
+        return lambda lanes: nxt
+
+    def _compile_mov(self, ins, nxt):
+        target, src = ins.parameters
+        core = self._core
+
+        if isinstance(target, Register):
+            reg = target.id
+            read = self._reader(src, register.width(reg), ins)
+
+            def mov(lanes):
+                core.mov_reg(reg, read(lanes), lanes)
+                return nxt
+            return mov
+
+        if isinstance(target, Memory):
+            width = register.width(src.id) if isinstance(src, Register) else None
+            number = self._size(target, width, ins) // 8
+            address = self._address(target)
+            read = self._reader(src, number * 8, ins)
+
+            def mov(lanes):
+                core.write_memory(address(lanes), read(lanes), number, lanes)
+                return nxt
+            return mov
+
+        raise InterpreterError(ins.line, "invalid MOV target {}".format(target))
+
+    def _compile_lock(self, ins, nxt):
+        """ the LOCK prefix, every lane has memory of its own so there is nothing to lock and the
+        following instruction runs as usual
+        """
+        if nxt >= len(self._instructions):
+            raise InterpreterError(ins.line, "LOCK needs a following instruction")
+        locked = self._instructions[nxt]
+        if locked.instruction not in ('INC', 'DEC') or not isinstance(locked.parameters[0], Memory):
+            raise InterpreterError(ins.line, "LOCK can only be used with INC or DEC on memory")
+        return lambda lanes: nxt
+
+    def _compile_inc(self, ins, nxt):
+        return self._compile_step(ins, nxt, 1)
+
+    def _compile_dec(self, ins, nxt):
+        return self._compile_step(ins, nxt, -1)
+
+    def _compile_step(self, ins, nxt, step):
+        """ INC and DEC of a register or memory operand, wrapping around sets the carry flag
+        """
+        core = self._core
+        operand = ins.parameters[0]
+        if isinstance(operand, Memory):
+            address = self._address(operand)
+            number = self._size(operand, None, ins) // 8
+            mask = (1 << (number * 8)) - 1
+
+            def read(lanes):
+                return core.read_memory(address(lanes), number, lanes)
+
+            def write(lanes, values):
+                core.write_memory(address(lanes), values, number, lanes)
+        else:
+            reg = self._register(ins)
+            mask = register.OPERANDS[reg][2]
+
+            def read(lanes):
+                return core.get_reg(reg, lanes)
+
+            def write(lanes, values):
+                core.mov_reg(reg, values, lanes)
+
+        edge = mask if step > 0 else 0
+
+        def step_(lanes):
+            value = read(lanes)
+            wrap = value == edge
+            if wrap.any():
+                core.eflags[lanes[wrap]] |= 0x01
+            write(lanes, (value + step) & mask)
+            return nxt
+        return step_
+
+    def _compile_push(self, ins, nxt):
+        push = self._core.push
+        read = self._reader(ins.parameters[0], 32, ins)
+
+        def push_(lanes):
+            push(read(lanes), lanes)
+            return nxt
+        return push_
+
+    def _compile_pop(self, ins, nxt):
+        core = self._core
+        reg = self._register(ins) if ins.parameters else None
+
+        def pop(lanes):
+            values = core.pop(lanes)
+            if reg is not None:
+                core.mov_reg(reg, values, lanes)
+            return nxt
+        return pop
+
+    def _compile_pusha(self, ins, nxt):
+        core = self._core
+        esp = register.ESP
+        order = PUSHA_ORDER
+
+        def pusha(lanes):
+            pointer = (core.get_reg(esp, lanes) - 32) & 0xffffffff
+            for k, reg in enumerate(order):
+                core.write_memory(pointer + 4 * k, core.get_reg(reg, lanes), 4, lanes)
+            core.mov_reg(esp, pointer, lanes)
+            return nxt
+        return pusha
+
+    def _compile_popa(self, ins, nxt):
+        core = self._core
+        esp = register.ESP
+        order = PUSHA_ORDER
+
+        def popa(lanes):
+            pointer = core.get_reg(esp, lanes)
+            for k, reg in enumerate(order):
+                if reg != esp:
+                    core.mov_reg(reg, core.read_memory(pointer + 4 * k, 4, lanes), lanes)
+            core.mov_reg(esp, (pointer + 32) & 0xffffffff, lanes)
+            return nxt
+        return popa
+
+    def _compile_call(self, ins, nxt):
+        push = self._core.push
+        target = self._label(ins)
+
+        def call(lanes):
+            push(nxt, lanes)
+            return target
+        return call
+
+    def _compile_ret(self, ins, nxt):
+        core = self._core
+        release = self._immediate(ins, 0) if ins.parameters else 0
+        esp = register.ESP
+
+        def ret(lanes):
+            targets = core.pop(lanes)
+            if release:
+                core.mov_reg(esp, (core.get_reg(esp, lanes) + release) & 0xffffffff, lanes)
+            return targets
+        return ret
+
+    def _compile_enter(self, ins, nxt):
+        core = self._core
+        size = self._immediate(ins, 0)
+        if len(ins.parameters) > 1 and self._immediate(ins, 1):
+            raise InterpreterError(ins.line, "ENTER only supports nesting level 0")
+        esp = register.ESP
+        ebp = register.EBP
+
+        def enter(lanes):
+            core.push(core.get_reg(ebp, lanes), lanes)
+            pointer = core.get_reg(esp, lanes)
+            core.mov_reg(ebp, pointer, lanes)
+            core.mov_reg(esp, (pointer - size) & 0xffffffff, lanes)
+            return nxt
+        return enter
+
+    def _compile_leave(self, ins, nxt):
+        core = self._core
+        esp = register.ESP
+        ebp = register.EBP
+
+        def leave(lanes):
+            core.mov_reg(esp, core.get_reg(ebp, lanes), lanes)
+            core.mov_reg(ebp, core.pop(lanes), lanes)
+            return nxt
+        return leave
+
+    def _compile_int(self, ins, nxt):
+        raise InterpreterError(ins.line, "INT isn't supported on lanes")
+
+    def _compile_jmp(self, ins, nxt):
+        target = self._label(ins)
+        return lambda lanes: target
+
+    def _compile_jc(self, ins, nxt):
+        target = self._label(ins)
+        eflags = self._core.eflags
+        return lambda lanes: np.where(eflags[lanes] & 0x01, target, nxt)
+
+    def _compile_jnc(self, ins, nxt):
+        target = self._label(ins)
+        eflags = self._core.eflags
+        return lambda lanes: np.where(eflags[lanes] & 0x01, nxt, target)
+
+    def _compile_clc(self, ins, nxt):
+        eflags = self._core.eflags
+
+        def clc(lanes):
+            eflags[lanes] &= ~np.uint32(0x01)
+            return nxt
+        return clc
+
+    def _compile_stc(self, ins, nxt):
+        eflags = self._core.eflags
+
+        def stc(lanes):
+            eflags[lanes] |= 0x01
+            return nxt
+        return stc
+
+    def _compile_loop(self, ins, nxt):
+        target = self._label(ins)
+        core = self._core
+        ecx = register.ECX
+
+        def loop(lanes):
+            value = (core.get_reg(ecx, lanes) - 1) & 0xffffffff
+            core.mov_reg(ecx, value, lanes)
+            return np.where(value != 0, target, nxt)
+        return loop
@@ -0,0 +1,89 @@
+import contextlib
+import contextvars
+import threading
+
+from allocator import BEST_FIT
+from core import Core
+from interpreter import Interpreter
+from kernel import Kernel
+
+# machine the stdlib functions work on if none is passed to them
+_current = contextvars.ContextVar('machine', default=None)
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class Machine(object):
+    """ One emulated computer: a Core, the Kernel managing it and the connected devices
+
+    Machines don't share any state, any number of them can run in one process. The stdlib functions
+    work on the machine activated in the current context, see activate().
+    """
+
+    def __init__(self, core=None, screen=None, allocation_policy=BEST_FIT, output=None, cpu=0, interrupts=None,
+                 heap=True):
+        """
+        :param core: the Core to run on, a new one is created if not given
+        :param screen: screen sys_write() prints to
+        :param allocation_policy: policy of the kernel heap
+        :param output: function(fd, data) capturing sys_write() output, see Kernel
+        :param cpu: number of the core in a multi-core machine, see smp
+        :param interrupts: smp.InterruptController connecting the cores
+        :param heap: False disables the kernel heap, see Kernel
+        """
+        self._core = core if core is not None else Core()
+        self._screen = screen
+        self._kernel = Kernel(self._core, screen=screen, allocation_policy=allocation_policy, output=output,
+                              cpu=cpu, interrupts=interrupts, heap=heap)
+
+    @property
+    def core(self):
+        return self._core
+
+    @property
+    def kernel(self):
+        return self._kernel
+
+    @property
+    def screen(self):
+        return self._screen
+
+    @contextlib.contextmanager
+    def activate(self):
+        """ make this the current machine of the stdlib functions in the current thread or task
+
+            with machine.activate():
+                address = stdlib.malloc(16)
+        """
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def interpreter(self, instructions, verbose=False, engine=Interpreter):
+        """ returns an interpreter running the instructions on this machine
+
+        :param engine: Interpreter or one of its subclasses
+        """
+        return engine(instructions, core=self._core, kernel=self._kernel, verbose=verbose)
+
+
+def current_machine():
+    """ returns the machine activated in the current context
+    Without one, a default machine shared by the whole process is created on first use.
+    """
+    machine = _current.get()
+    if machine is not None:
+        return machine
+    return default_machine()
+
+
+def default_machine():
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = Machine()
+    return _default
@@ -1,9 +1,10 @@
 import logging
-import nltk
 import sys
 
-from instruction import Instruction
-from interpreter import Interpreter
+from assembler import AssemblerError
+from framebuffer import HeadlessScreen
+from machine import Machine
+from objectfile import assemble_cached
 
 FORMAT = '%(asctime)-15s %(name)-12s %(levelname)-8s %(message)s'
 LOG = logging.getLogger('main')
@@ -14,39 +15,30 @@ LOG.addHandler(ch)
 
 
 def main():
-    instructions = []
-    tokens = tokenize("input.asm")
-    for t in tokens:
-        ins = Instruction()
-        ins.instruction = t[0].upper()
-        try:
-            ins.parameters.append(t[1].upper())
-            ins.parameters.append(t[3].upper())
-        except:
-            pass
+    program = load("input.asm")
 
-        instructions.append(ins)
+    # frames written to stdout are saved to the directory given as first argument
+    machine = Machine(screen=HeadlessScreen(directory=sys.argv[1] if len(sys.argv) > 1 else None))
+    machine.interpreter(program.instructions).run()
 
-    interpreter = Interpreter(instructions)
-    interpreter.run()
 
-
-def prepare_nltk():
-    """ Download nltk tokenizer data files"""
-    nltk.download(info_or_id='punkt')
-
-
-def tokenize(file):
-    prepare_nltk()
+def load(file):
+    """ read and assemble a source file
+    The assembled program is cached, later runs on the same source load the object file instead.
+    """
     try:
-        with open(file , "r") as f:
-            lines = f.readlines()
-            return [nltk.word_tokenize(l) for l in lines]
-
+        with open(file, "r") as f:
+            source = f.read()
     except Exception as e:
         LOG.error("Couldn't read input file: {}".format(e))
         sys.exit(1)
 
+    try:
+        return assemble_cached(source)
+    except AssemblerError as e:
+        LOG.error("{}: {}".format(file, e))
+        sys.exit(1)
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,190 @@
+import struct
+import sys
+import threading
+
+PAGE_SHIFT = 12
+PAGE_SIZE = 1 << PAGE_SHIFT         # 4 KB pages
+PAGE_MASK = PAGE_SIZE - 1
+
+ADDRESS_MASK = 0xffffffff           # 32 bit address space
+MEMORY_SIZE = ADDRESS_MASK + 1
+
+# every page that has never been written to reads from this one
+ZERO_PAGE = bytes(PAGE_SIZE)
+
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<I')
+I32 = struct.Struct('<i')
+U64 = struct.Struct('<Q')
+
+# an address masked with this equals the base address of a page if it's an aligned dword on that page
+HOT_MASK = ADDRESS_MASK & ~PAGE_MASK | 3
+
+
+class PagedMemory(object):
+    """ Sparse 32 bit address space
+
+    The memory is split into 4 KB pages kept in a page table keyed by the upper address bits.
+    Pages are only allocated on the first write to them, until then they share the zero page.
+    Addresses wrap around at 0xFFFFFFFF.
+
+    Pages can be shared with snapshots, they are copied on the first write after taking
+    or restoring a snapshot (copy-on-write).
+
+    read_u32() and write_u32() are the fast path for the stack. On little endian hosts write_u32()
+    keeps the last page it wrote to as hot_words, a memoryview of its dwords, for as long as the page
+    stays owned. hot is the base address of that page or None. Callers may index hot_words directly
+    with (address - hot) >> 2 if address & HOT_MASK == hot.
+    """
+
+    def __init__(self):
+        self._pages = {}
+        self._owned = set()     # pages that are not shared and can be written in place
+        self.hot = None         # base address of the owned page write_u32() wrote to last
+        self.hot_words = None
+        self.lock = threading.Lock()
+
+    @property
+    def pages(self):
+        """ returns the numbers of all pages that have been written to
+        """
+        return sorted(self._pages)
+
+    @property
+    def resident_size(self):
+        """ returns the amount of bytes actually allocated for the memory image
+        """
+        return len(self._pages) * PAGE_SIZE
+
+    def _page(self, number):
+        return self._pages.get(number, ZERO_PAGE)
+
+    def _writable_page(self, number):
+        if number in self._owned:
+            return self._pages[number]
+        page = self._pages[number] = bytearray(self._pages.get(number, ZERO_PAGE))
+        self._owned.add(number)
+        return page
+
+    def snapshot(self):
+        """ returns a copy-on-write snapshot of the memory image
+        All pages become shared between the memory and the snapshot, so this only costs
+        a copy of the page table.
+        """
+        self._owned.clear()
+        self.hot = None
+        return dict(self._pages)
+
+    def restore(self, snapshot):
+        """ reset the memory to a snapshot taken with snapshot()
+        """
+        self._pages = dict(snapshot)
+        self._owned = set()
+        self.hot = None
+
+    def _chunks(self, address, number):
+        """ split a range into (page number, start, end) tuples, each covering a part of a single page
+        """
+        address &= ADDRESS_MASK
+        while number > 0:
+            start = address & PAGE_MASK
+            end = min(PAGE_SIZE, start + number)
+            yield address >> PAGE_SHIFT, start, end
+            number -= end - start
+            address = (address + end - start) & ADDRESS_MASK
+
+    def get(self, address):
+        address &= ADDRESS_MASK
+        return self._page(address >> PAGE_SHIFT)[address & PAGE_MASK]
+
+    def set(self, address, value):
+        address &= ADDRESS_MASK
+        self._writable_page(address >> PAGE_SHIFT)[address & PAGE_MASK] = value & 0xff
+
+    def read(self, address, number):
+        """ read a block of memory
+
+        :param address: start address
+        :param number: amount of bytes to read
+        :return: the bytes read
+        """
+        address &= ADDRESS_MASK
+        start = address & PAGE_MASK
+        if start + number <= PAGE_SIZE:
+            return bytes(self._page(address >> PAGE_SHIFT)[start:start + number])
+        return b"".join(self._page(p)[s:e] for p, s, e in self._chunks(address, number))
+
+    def write(self, address, data):
+        """ write a block of memory
+
+        :param address: start address
+        :param data: bytes or any other object supporting the buffer protocol
+        """
+        address &= ADDRESS_MASK
+        start = address & PAGE_MASK
+        if type(data) is bytes and start + len(data) <= PAGE_SIZE:
+            self._writable_page(address >> PAGE_SHIFT)[start:start + len(data)] = data
+            return
+
+        data = memoryview(data).cast('B')
+        pos = 0
+        for p, s, e in self._chunks(address, len(data)):
+            self._writable_page(p)[s:e] = data[pos:pos + e - s]
+            pos += e - s
+
+    def unpack(self, fmt, address):
+        """ read a single value
+
+        :param fmt: struct.Struct of the value, e.g. U16
+        """
+        address &= ADDRESS_MASK
+        start = address & PAGE_MASK
+        if start <= PAGE_SIZE - fmt.size:
+            return fmt.unpack_from(self._pages.get(address >> PAGE_SHIFT, ZERO_PAGE), start)[0]
+        return fmt.unpack(self.read(address, fmt.size))[0]
+
+    def read_u32(self, address):
+        """ read a 32 bit little endian value
+        """
+        address &= ADDRESS_MASK
+        if address & HOT_MASK == self.hot:
+            return self.hot_words[(address - self.hot) >> 2]
+        return self.unpack(U32, address)
+
+    def write_u32(self, address, value):
+        """ write a 32 bit little endian value
+        """
+        address &= ADDRESS_MASK
+        if address & HOT_MASK == self.hot:
+            self.hot_words[(address - self.hot) >> 2] = value & 0xffffffff
+            return
+        start = address & PAGE_MASK
+        if start > PAGE_SIZE - 4:
+            self.write(address, (value & 0xffffffff).to_bytes(4, 'little'))
+            return
+        page = self._writable_page(address >> PAGE_SHIFT)
+        U32.pack_into(page, start, value & 0xffffffff)
+        if sys.byteorder == 'little':
+            self.hot = address - start
+            self.hot_words = memoryview(page).cast('I')
+
+    def fill(self, address, number, value=0x00):
+        """ set a block of memory to a single byte value
+        Filling whole untouched pages with zero doesn't allocate them.
+        """
+        value &= 0xff
+        for p, s, e in self._chunks(address, number):
+            if value == 0 and p not in self._pages:
+                continue
+            if value == 0 and s == 0 and e == PAGE_SIZE:
+                del self._pages[p]
+                self._owned.discard(p)
+                if p << PAGE_SHIFT == self.hot:
+                    self.hot = None
+                continue
+            self._writable_page(p)[s:e] = bytes([value]) * (e - s)
+
+    def copy(self, target, src, number):
+        """ copy a block of memory, overlapping ranges are handled like memmove()
+        """
+        self.write(target, self.read(src, number))
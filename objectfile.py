@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+import assembler
+import register
+
+from instruction import Instruction, Register, Immediate, Memory, Label
+
+LOG = logging.getLogger('objectfile')
+
+""" Object file layout, all values little endian
+
+    header          magic, format version, instruction/operand/symbol count, size of the string table
+    opcode table    one entry per instruction: opcode, operand count, first operand, source line
+    operand table   one entry per operand: kind, register id, size, string index, value
+    symbol table    one entry per label: string index, instruction index
+    string table    label names, utf-8 encoded and NUL separated
+"""
+MAGIC = b'PYSM'
+VERSION = 4
+
+HEADER = struct.Struct('<4sHxxIIII')
+OPCODE = struct.Struct('<BBxxII')
+OPERAND = struct.Struct('<BBBxIq')
+SYMBOL = struct.Struct('<II')
+
+OPCODES = tuple(sorted(assembler.MNEMONICS))
+
+# operand kinds
+REGISTER, IMMEDIATE, MEMORY, LABEL = range(4)
+NO_REGISTER = 0xff
+
+
+class ObjectFileError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+
+def dump(program):
+    """ serialize an assembled program
+
+    :param program: assembler.Program
+    :return: the object file as bytes
+    """
+    strings = []
+    string_index = {}
+
+    def string(name):
+        if name not in string_index:
+            string_index[name] = len(strings)
+            strings.append(name)
+        return string_index[name]
+
+    opcodes = bytearray()
+    operands = bytearray()
+    count = 0
+    for ins in program.instructions:
+        opcodes += OPCODE.pack(OPCODES.index(ins.instruction), len(ins.parameters), count, ins.line or 0)
+        for operand in ins.parameters:
+            operands += _pack_operand(operand, string)
+            count += 1
+
+    symbols = bytearray()
+    for name, target in sorted(program.labels.items(), key=lambda l: l[1]):
+        symbols += SYMBOL.pack(string(name), target)
+
+    blob = b"\x00".join(s.encode('utf-8') for s in strings)
+    header = HEADER.pack(MAGIC, VERSION, len(program.instructions), count, len(program.labels), len(blob))
+    return header + opcodes + operands + symbols + blob
+
+
+def _pack_operand(operand, string):
+    if isinstance(operand, Register):
+        return OPERAND.pack(REGISTER, operand.id, 0, 0, 0)
+    if isinstance(operand, Immediate):
+        if not -(1 << 63) <= operand.value < (1 << 63):
+            raise ObjectFileError("immediate {} doesn't fit into an object file".format(operand.value))
+        return OPERAND.pack(IMMEDIATE, NO_REGISTER, 0, 0, operand.value)
+    if isinstance(operand, Memory):
+        base = NO_REGISTER if operand.base is None else operand.base
+        return OPERAND.pack(MEMORY, base, operand.size or 0, 0, operand.displacement)
+    if isinstance(operand, Label):
+        return OPERAND.pack(LABEL, NO_REGISTER, 0, string(operand.name), operand.target)
+    raise ObjectFileError("invalid operand {}".format(operand))
+
+
+def load(buffer):
+    """ deserialize a program written by dump()
+
+    :param buffer: bytes, mmap or any other object supporting the buffer protocol
+    :return: assembler.Program
+    """
+    try:
+        magic, version, n_instructions, n_operands, n_symbols, blob_size = HEADER.unpack_from(buffer, 0)
+    except struct.error:
+        raise ObjectFileError("truncated object file")
+    if magic != MAGIC or version != VERSION:
+        raise ObjectFileError("not a version {} object file".format(VERSION))
+
+    offset = HEADER.size
+    opcode_end = offset + n_instructions * OPCODE.size
+    operand_end = opcode_end + n_operands * OPERAND.size
+    symbol_end = operand_end + n_symbols * SYMBOL.size
+    if len(buffer) != symbol_end + blob_size:
+        raise ObjectFileError("object file has the wrong size")
+
+    view = memoryview(buffer)
+    try:
+        strings = [s.decode('utf-8') for s in bytes(view[symbol_end:]).split(b"\x00")] if blob_size else []
+        operands = [_unpack_operand(o, strings) for o in OPERAND.iter_unpack(view[opcode_end:operand_end])]
+
+        instructions = []
+        for opcode, count, first, line in OPCODE.iter_unpack(view[offset:opcode_end]):
+            instructions.append(Instruction(OPCODES[opcode], operands[first:first + count], line or None))
+
+        labels = {strings[name]: target for name, target in SYMBOL.iter_unpack(view[operand_end:symbol_end])}
+    except (IndexError, ValueError) as e:
+        raise ObjectFileError("corrupt object file: {}".format(e))
+    finally:
+        view.release()
+
+    return assembler.Program(instructions, labels)
+
+
+def _unpack_operand(entry, strings):
+    kind, reg, size, name, value = entry
+    if kind == REGISTER:
+        return Register(register.OPERAND_NAMES[reg], reg)
+    if kind == IMMEDIATE:
+        return Immediate(value)
+    if kind == MEMORY:
+        return Memory(None if reg == NO_REGISTER else reg, value, size or None)
+    if kind == LABEL:
+        return Label(strings[name], value)
+    raise ValueError("unknown operand kind {}".format(kind))
+
+
+def cache_directory():
+    """ returns the directory cached object files are stored in
+    $PYSM_CACHE_DIR if set, ~/.cache/pysm otherwise
+    """
+    return os.environ.get('PYSM_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pysm'))
+
+
+def cache_key(source):
+    """ returns the hash an assembled source is cached under
+    """
+    digest = hashlib.sha256("{}:{}:".format(VERSION, assembler.VERSION).encode('utf-8'))
+    digest.update(source.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def assemble_cached(source, directory=None):
+    """ assemble a source, reusing the object file of an earlier run if there is one
+
+    :param source: the source code as string
+    :param directory: cache directory, defaults to cache_directory()
+    :return: assembler.Program
+    """
+    directory = directory or cache_directory()
+    path = os.path.join(directory, cache_key(source) + ".o")
+
+    try:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return load(m)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, ObjectFileError) as e:
+        LOG.warning("Ignoring cached object file %s: %s", path, e)
+
+    program = assembler.assemble(source)
+    try:
+        data = dump(program)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except (OSError, ObjectFileError) as e:
+        LOG.warning("Couldn't cache object file %s: %s", path, e)
+    return program
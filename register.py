@@ -1,58 +1,57 @@
-from datatypes.dword import Dword
+from array import array
 
+# position of each 32 bit register in the register file
+EAX, EBX, ECX, EDX, EIP, ESP, EBP, ESI, EDI = range(9)
 
-class Register32(object):
-    """ Base class for all registers
+NAMES = ('EAX', 'EBX', 'ECX', 'EDX', 'EIP', 'ESP', 'EBP', 'ESI', 'EDI')
+
+
+def register_file():
+    """ returns a zeroed register file
+    The register file is a flat array with one unsigned 32 bit slot per register, the 16 and 8 bit
+    registers are views on these slots.
     """
+    return array('I', [0] * len(NAMES))
+
+
+# Register operands
+#
+# Every addressable register (EAX, AX, AH, AL, ...) gets a small id. The id indexes OPERANDS, which holds
+# (slot, shift, mask, keep): the slot in the register file, the position and width of the register inside
+# that slot and the mask of the bits that are left untouched when writing it.
+OPERANDS = []
+REGISTERS = {}
+
+
+def _add_operand(name, slot, shift, mask):
+    REGISTERS[name] = len(OPERANDS)
+    OPERANDS.append((slot, shift, mask, 0xffffffff & ~(mask << shift)))
+
+
+for _slot, _name in enumerate(NAMES):
+    _add_operand(_name, _slot, 0, 0xffffffff)
+for _slot, _name in enumerate(NAMES):
+    if _name in ('EAX', 'EBX', 'ECX', 'EDX'):
+        _add_operand(_name[1:], _slot, 0, 0xffff)
+        _add_operand(_name[1] + 'H', _slot, 8, 0xff)
+        _add_operand(_name[1] + 'L', _slot, 0, 0xff)
+    elif _name != 'EIP':
+        _add_operand(_name[1:], _slot, 0, 0xffff)
 
-    def __init__(self):
-        self.__dword = Dword()
-
-    @property
-    def full(self):
-        """ returns full register
-        """
-        return self.__dword.value
-
-    @full.setter
-    def full(self, value):
-        if not isinstance(value, int):
-            raise ValueError("Registers can only take integers")
-        self.__dword.value = value
-
-    @property
-    def half(self):
-        """ returns lowest 16 bit
-        """
-        return self.__dword.low.value
-
-    @half.setter
-    def half(self, value):
-        if not isinstance(value, int):
-            raise ValueError("Registers can only take integers")
-        self.__dword.low.value = value
-
-    @property
-    def high(self):
-        """ returns highest 8 bit of the lower 16 bit
-        """
-        return self.__dword.low.high.value
-
-    @high.setter
-    def high(self, value):
-        if not isinstance(value, int):
-            raise ValueError("Registers can only take integers")
-
-        self.__dword.low.high.value = value
-
-    @property
-    def low(self):
-        """ returns lowest 8 bit of the register
-        """
-        return self.__dword.low.low.value
-
-    @low.setter
-    def low(self, value):
-        if not isinstance(value, int):
-            raise ValueError("Registers can only take integers")
-        self.__dword.low.low.value = value
+OPERANDS = tuple(OPERANDS)
+OPERAND_NAMES = tuple(sorted(REGISTERS, key=REGISTERS.get))
+
+
+def resolve(name):
+    """ returns the operand id of a register
+
+    :param name: register name, e.g. 'eax' or 'AL'
+    :return: the operand id or None if there is no such register
+    """
+    return REGISTERS.get(name.upper())
+
+
+def width(operand):
+    """ returns the size of a register operand in bit
+    """
+    return OPERANDS[operand][2].bit_length()
@@ -1,13 +1,17 @@
 import logging
 import math
 import sys
+import threading
 import time
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QLabel
-from PyQt5.QtGui import QPixmap, QImage, qRgb
-from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot, QPoint
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget
+from PyQt5.QtGui import QPainter, QPixmap, QImage, qRgb
+from PyQt5.QtCore import QRect, QThread, pyqtSignal, pyqtSlot
 
 from characters import ascii_dos
+from console import TextConsole
+from framebuffer import Framebuffer, PALETTE, SCREEN_WIDTH, SCREEN_HEIGHT, MAX_DAMAGE_RECTS, bounding_rect, \
+    PixelIndexError, PixelColorError, CharacterIndexError, AsciiIndexError
 
 FORMAT = '%(asctime)-15s %(name)-12s %(levelname)-8s %(message)s'
 LOG = logging.getLogger('kernel')
@@ -17,81 +21,71 @@ ch.setFormatter(logging.Formatter(FORMAT))
 LOG.addHandler(ch)
 
 
-class PixelIndexError(Exception):
-    def __init__(self):
-        super().__init__()
-
-
-class PixelColorError(Exception):
-    def __init__(self):
-        super().__init__()
-
-
-class CharacterIndexError(Exception):
-    def __init__(self):
-        super().__init__()
-
-
-class AsciiIndexError(Exception):
-    def __init__(self):
-        super().__init__()
-
-
 class VideoClock(QThread):
+    """ Tells the screen to show new frames
+
+    Sleeps until notify() reports a new frame, so an idle screen costs nothing. After every update
+    it waits cf seconds, frames published in the meantime are shown together with the next one.
+    """
     updated_screen_buffer = pyqtSignal()
 
     def __init__(self, cf=0.04):
         super().__init__()
         self._run = True
         self._clock_frequency = cf
+        self._changed = threading.Event()
 
     def __del__(self):
         self.wait()
 
+    def notify(self):
+        self._changed.set()
+
     def run(self):
         while self._run:
+            self._changed.wait()
+            self._changed.clear()
+            if not self._run:
+                break
             self.updated_screen_buffer.emit()
             time.sleep(self._clock_frequency)
 
     def stop(self):
         self._run = False
+        self._changed.set()
 
 
-class ScreenEGA(QMainWindow):
-    color_palette = [           # CGA color palette:
-        qRgb(0, 0, 0),          # black             #000000
-        qRgb(0, 0, 170),        # blue              #0000aa
-        qRgb(0, 170, 0),        # green             #00aa00
-        qRgb(0, 170, 170),      # cyan              #00aaaa
-        qRgb(170, 0, 0),        # red               #aa0000
-        qRgb(170, 0, 170),      # magenta           #aa00aa
-        qRgb(170, 85, 0),       # brown             #aa5500
-        qRgb(170, 170, 170),    # light grey        #aaaaaa
-        qRgb(85, 85, 85),       # dark grey         #555555
-        qRgb(85, 85, 255),      # bright blue       #5555ff
-        qRgb(85, 255, 85),      # bright green      #55ff55
-        qRgb(85, 255, 255),     # bright cyan       #55ffff
-        qRgb(255, 85, 85),      # bright red        #ff5555
-        qRgb(255, 85, 255),     # bright magenta    #ff55ff
-        qRgb(255, 255, 85),     # bright yellow     #ffff55
-        qRgb(255, 255, 255)     # bright white      #ffffff
-    ]
-
-    screen_width = 320
-    screen_height = 200
-
-    character_cell_width = 8
-    character_cell_height = 8
-
-    def __init__(self, scale=3):
-        super().__init__()
-        internal_dimension_x = ScreenEGA.screen_width*scale
-        internal_dimension_y = ScreenEGA.screen_height*scale
+class FrameView(QWidget):
+    """ Widget showing a pixmap, repaints only the areas it is told to update
+    """
+
+    def __init__(self, parent, pixmap):
+        super().__init__(parent)
+        self.pixmap = pixmap
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawPixmap(event.rect(), self.pixmap, event.rect())
+        painter.end()
+
+
+class ScreenEGA(QMainWindow, Framebuffer):
+    """ Qt presenter of a Framebuffer
+
+    The framebuffer only holds the logical 320x200 image, so drawing costs the same at every scale.
+    Published frames wake the VideoClock up. Only the areas damaged since the last update are
+    converted, scaled up to the window with nearest neighbour and repainted.
+    """
+    color_palette = [qRgb(*color) for color in PALETTE]
+
+    def __init__(self, scale=3, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+        QMainWindow.__init__(self)
+        Framebuffer.__init__(self, width, height)
+        internal_dimension_x = self.screen_width*scale
+        internal_dimension_y = self.screen_height*scale
         self._screen_scale = scale
-        self._screen_buffer = QImage(internal_dimension_x, internal_dimension_y, QImage.Format_RGB16)
-        self._screen_dbuffer = QImage(internal_dimension_x, internal_dimension_y, QImage.Format_RGB16)
-        self.cls()
-        self.update_screen_buffer()
+        self._lock = threading.Lock()
+        self._pending = []      # Rects published but not shown yet
 
         self.resize(internal_dimension_x, internal_dimension_y)
         self.setWindowTitle('Screen')
@@ -99,155 +93,45 @@ class ScreenEGA(QMainWindow):
         self._w.resize(internal_dimension_x, internal_dimension_y)
         self.setCentralWidget(self._w)
 
-        self._label = QLabel(self)
-        self._label.setGeometry(0, 0, internal_dimension_x, internal_dimension_y)
-        self._pixmap = QPixmap(internal_dimension_x, internal_dimension_y)
+        pixmap = QPixmap(internal_dimension_x, internal_dimension_y)
+        self._view = FrameView(self, pixmap)
+        self._view.setGeometry(0, 0, internal_dimension_x, internal_dimension_y)
 
         self._updater = VideoClock()
         self._updater.updated_screen_buffer.connect(self.update_screen)
         self._updater.start()
 
+        self.cls()
+        self.update_screen_buffer()
+
     def __del__(self):
         self._updater.stop()
 
+    def present(self, frame, damage):
+        with self._lock:
+            self._pending.extend(damage)
+        self._updater.notify()
+
     @pyqtSlot()
     def update_screen(self):
-        self._label.setPixmap(QPixmap.fromImage(self._screen_buffer))
-        self.repaint()
-
-    def update_screen_buffer(self):
-        self._screen_buffer = self._screen_dbuffer.copy(0, 0, 0, 0)
-
-    def cls(self):
-        self._screen_dbuffer.fill(ScreenEGA.color_palette[0])
-
-    def set_pixel(self, x, y, color_index):
-        """ Set the pixel at the given position to the specified color
-        Maps the virtual 320x200 screen to the actual 640x400 image
-
-        :param x: x coordinate
-        :param y: y coordinate
-        :param color_index: index of the color in the CGA color palatte
-        """
-        if x >= 320 or x < 0:
-            raise PixelIndexError()
-        if y >= 200 or y < 0:
-            raise PixelIndexError
-        try:
-            color = ScreenEGA.color_palette[color_index]
-        except:
-            raise PixelColorError()
-
-        real_x = x*self._screen_scale
-        real_y = y*self._screen_scale
-
-        for _x in range(0, self._screen_scale):
-            for _y in range(0, self._screen_scale):
-                self._screen_dbuffer.setPixel(QPoint(real_x+_x, real_y+_y), color)
-
-    def set_character(self, c, x, y, color):
-        LOG.debug("Setting character '{}' at ({}/{}) in color {}".format(c, x, y, color))
-        if c < 0 or c > 254:
-            raise AsciiIndexError()
-        if x < 0 or x >= ScreenEGA.screen_width/ScreenEGA.character_cell_width:
-            raise CharacterIndexError()
-        if y < 0 or y >= ScreenEGA.screen_height/ScreenEGA.character_cell_height:
-            raise CharacterIndexError()
-
-        real_x = x*ScreenEGA.character_cell_width
-        real_y = y*ScreenEGA.character_cell_height
-
-        for xp in range(0, ScreenEGA.character_cell_width):
-            for yp in range(0, ScreenEGA.character_cell_height):
-                if ascii_dos[c][yp][xp]:
-                    self.set_pixel(real_x + xp, real_y + yp, color)
-
-    def draw_relation(self, func, color, start=0, end=319, shift=0):
-        for x in range(start+shift, end+shift+1):
-            ret = func(x)
-
-            for y in ret:
-                try:
-                    self.set_pixel(x, round(y), color)
-                except PixelIndexError:
-                    pass
-
-    def draw_function(self, func, color, start=0, end=319, shift=0, offset=0):
-        for x in range(start+shift, end+shift+1):
-            y = func(x)
-            y_next = func(x+1)
-
-            try:
-                if y - y_next >= 1 or y - y_next <= -1:
-                    self.draw_line((x, y + offset), (x + 1, y_next + offset), color)
-                else:
-                    self.set_pixel(x, y + offset, color)
-            except PixelIndexError:
-                pass
-
-    def draw_square(self, p, width, height, color):
-        self.draw_relation(lambda x: range(p[1], p[1] + height), color, start=p[0], end=p[0] + width)
-
-    def draw_line(self, a, b, color):
-        # special case: vertical line
-        if a[0] == b[0]:
-            if a[1] < b[1]:
-                x1, y1 = a
-                x2, y2 = b
-            else:
-                x1, y1 = b
-                x2, y2 = a
-
-            self.draw_relation(lambda x: range(round(y1), round(y2)), color, start=x1, end=x2)
+        with self._lock:
+            damage, self._pending = self._pending, []
+            frame = self.frame
+        if not damage:
             return
-
-        if a[0] < b[0]:
-            x1, y1 = a
-            x2, y2 = b
-        else:
-            x1, y1 = b
-            x2, y2 = a
-
-        slope = round((y2 - y1) / (x2 - x1), 2)   # slope per pixel
-
-        # self.drawFunction(lambda x: range(y1, y2 + 1), color, start=x1, end=x2)
-        x_current, y_current = x1, y1
-        for xi in range(x1, x2+1):
-            y_new = y_current + slope
-            if slope <= 1 and slope >= -1:
-                try:
-                    self.set_pixel(xi, round(y_new), color)
-                except PixelIndexError:
-                    continue
-            else:
-                for yi in range(round(y_current), round(y_current+abs(slope))):
-                    try:
-                        self.set_pixel(xi, round(yi), color)
-                    except PixelIndexError:
-                        continue
-
-            x_current, y_current = xi, y_new
-
-    def draw_circle(self, p, r, color):
-        for x in range(-r, r):
-            y = round(math.sqrt(abs(math.pow(r, 2)-math.pow(x, 2))))
-            y_next = round(math.sqrt(abs(math.pow(r, 2)-math.pow(x+1, 2))))
-
-            try:
-                if y_next-y >= 1 or y_next-y <= -1:
-                    self.draw_line((p[0] + x, p[1] + y - 1), (p[0] + x, p[1] + y_next - 1), color)
-                else:
-                    self.set_pixel(p[0] + x, p[1] + y - 1, color)
-            except PixelIndexError:
-                pass
-
-            try:
-                if y-y_next >= 1 or y-y_next <= -1:
-                    self.draw_line((p[0] + x, p[1] - y_next), (p[0] + x, p[1] - y), color)
-                else:
-                    self.set_pixel(p[0] + x, p[1] - y, color)
-            except PixelIndexError:
-                pass
+        if len(damage) > MAX_DAMAGE_RECTS:
+            damage = [bounding_rect(damage)]
+
+        image = QImage(frame, self.screen_width, self.screen_height, self.screen_width,
+                       QImage.Format_Indexed8)
+        image.setColorTable(ScreenEGA.color_palette)
+        scale = self._screen_scale
+        painter = QPainter(self._view.pixmap)
+        for x, y, width, height in damage:
+            painter.drawImage(QRect(x*scale, y*scale, width*scale, height*scale), image, QRect(x, y, width, height))
+        painter.end()
+        for x, y, width, height in damage:
+            self._view.update(x*scale, y*scale, width*scale, height*scale)
 
 
 class TestVideo(QThread):
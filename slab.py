@@ -0,0 +1,109 @@
+SIZE_CLASSES = (8, 16, 32, 64, 128)
+SLAB_SIZE = 0x400       # every slab is carved out of one 1 KB kernel allocation
+
+# size class for every request size up to the largest class, index 0 is unused
+_CLASS_OF = [None] + [next(c for c in SIZE_CLASSES if c >= size) for size in range(1, SIZE_CLASSES[-1] + 1)]
+
+
+class Slab(object):
+    """ One kernel allocation split into equally sized objects
+    Free objects are tracked as set bits in an integer bitmap.
+    """
+    __slots__ = ('address', 'size', 'free', 'empty')
+
+    def __init__(self, address, size):
+        self.address = address
+        self.size = size
+        self.empty = (1 << (SLAB_SIZE // size)) - 1
+        self.free = self.empty
+
+
+class SlabAllocator(object):
+    """ Allocator for small objects
+
+    Requests up to the largest size class are rounded up to their class and served from slabs of
+    that class. Allocation takes the lowest free object of the most recently used slab with free
+    objects, freeing sets its bit again. Both are O(1), the slabs with free objects of each class
+    are kept in an insertion ordered dict. Slabs that become empty are handed back except for the
+    last one of each class.
+    """
+
+    def __init__(self, allocate, release):
+        """
+        :param allocate: function(size) returning the address of a new block or None
+        :param release: function(address) freeing a block returned by allocate
+        """
+        self._allocate = allocate
+        self._release = release
+        self._partial = {size: {} for size in SIZE_CLASSES}    # slabs with free objects per class, as keys
+        self._objects = {}                                      # address -> slab of all allocated objects
+        self._slabs = set()                                     # addresses of all slabs
+
+    @staticmethod
+    def size_class(size):
+        """ returns the size class for a request or None if it's too large for a slab
+        """
+        if size < 1:
+            raise ValueError("Can't allocate {} bytes".format(size))
+        return _CLASS_OF[size] if size < len(_CLASS_OF) else None
+
+    def allocate(self, size):
+        """ allocate a small object
+
+        :return: the address of the object or None if size is too large or no new slab could be allocated
+        """
+        if size >= len(_CLASS_OF):
+            return None
+        if size < 1:
+            raise ValueError("Can't allocate {} bytes".format(size))
+        size = _CLASS_OF[size]
+
+        partial = self._partial[size]
+        if not partial:
+            address = self._allocate(SLAB_SIZE)
+            if address is None:
+                return None
+            partial[Slab(address, size)] = None
+            self._slabs.add(address)
+
+        slab = next(reversed(partial))
+        bit = slab.free & -slab.free
+        slab.free ^= bit
+        if not slab.free:
+            partial.popitem()
+
+        address = slab.address + (bit.bit_length() - 1) * size
+        self._objects[address] = slab
+        return address
+
+    def free(self, address):
+        """ free an object
+
+        :return: False if the address doesn't belong to an object allocated by this allocator
+        """
+        slab = self._objects.pop(address, None)
+        if slab is None:
+            return False
+
+        partial = self._partial[slab.size]
+        if not slab.free:
+            partial[slab] = None
+        slab.free |= 1 << ((address - slab.address) // slab.size)
+
+        if slab.free == slab.empty and len(partial) > 1:
+            del partial[slab]
+            self._slabs.discard(slab.address)
+            self._release(slab.address)
+        return True
+
+    def is_slab(self, address):
+        """ returns True if a slab starts at the given address
+        Its memory is one block of the underlying allocator that must not be released from outside.
+        """
+        return address in self._slabs
+
+    def size_of(self, address):
+        """ returns the size class of the object at the given address or None
+        """
+        slab = self._objects.get(address)
+        return slab.size if slab is not None else None
@@ -0,0 +1,270 @@
+import collections
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+
+import objectfile
+import register
+from blockcompiler import BlockInterpreter
+from core import Core
+from machine import Machine
+from memory import ADDRESS_MASK, PAGE_SHIFT, PAGE_SIZE, ZERO_PAGE, U32
+
+# seconds SMP.run() waits for a result before checking whether the cores are still alive
+POLL_INTERVAL = 0.1
+
+# final state of one core
+CpuResult = collections.namedtuple('CpuResult', ['cpu', 'registers', 'output', 'error'])
+
+
+class SharedMemory(object):
+    """ Flat memory shared between processes
+
+    Drop-in replacement for PagedMemory backed by multiprocessing.shared_memory. Every process
+    attaches to the same block by its name, writes are visible to all cores at once. The address
+    space is limited to the size of the block, accesses beyond it raise an IndexError.
+
+    lock is a multiprocessing.Lock shared the same way, it makes LOCK prefixed instructions atomic.
+    """
+
+    def __init__(self, size, name=None, lock=None):
+        """
+        :param size: size in bytes, rounded up to whole pages
+        :param name: name of an existing block to attach to, a new block is created if not given
+        :param lock: the lock of the existing block
+        """
+        size = (size + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+            lock = multiprocessing.Lock()
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        self._size = size
+        self._buffer = self._shm.buf
+        self.lock = lock
+        self.hot = None         # no page cache, write_u32() writes to the buffer directly
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def pages(self):
+        """ returns the numbers of all pages that aren't zero
+        """
+        return [p for p in range(self._size >> PAGE_SHIFT)
+                if self._buffer[p << PAGE_SHIFT:(p + 1) << PAGE_SHIFT] != ZERO_PAGE]
+
+    @property
+    def resident_size(self):
+        return self._size
+
+    def attach(self):
+        """ returns the arguments to attach to this memory in another process
+        """
+        return self._size, self.name, self.lock
+
+    def close(self):
+        """ detach from the memory, the creating process also frees it
+        """
+        if self._buffer is None:
+            return
+        self._buffer.release()
+        self._buffer = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _check(self, address, number):
+        address &= ADDRESS_MASK
+        if address + number > self._size:
+            raise IndexError("Address {:08X} outside of the {} bytes of shared memory".format(address, self._size))
+        return address
+
+    def snapshot(self):
+        return bytes(self._buffer)
+
+    def restore(self, snapshot):
+        self._buffer[:] = snapshot
+
+    def get(self, address):
+        return self._buffer[self._check(address, 1)]
+
+    def set(self, address, value):
+        self._buffer[self._check(address, 1)] = value & 0xff
+
+    def read(self, address, number):
+        address = self._check(address, number)
+        return bytes(self._buffer[address:address + number])
+
+    def write(self, address, data):
+        data = memoryview(data).cast('B')
+        address = self._check(address, len(data))
+        self._buffer[address:address + len(data)] = data
+
+    def unpack(self, fmt, address):
+        return fmt.unpack_from(self._buffer, self._check(address, fmt.size))[0]
+
+    def read_u32(self, address):
+        return U32.unpack_from(self._buffer, self._check(address, 4))[0]
+
+    def write_u32(self, address, value):
+        U32.pack_into(self._buffer, self._check(address, 4), value & 0xffffffff)
+
+    def fill(self, address, number, value=0x00):
+        address = self._check(address, number)
+        self._buffer[address:address + number] = bytes([value & 0xff]) * number
+
+    def copy(self, target, src, number):
+        self.write(target, self.read(src, number))
+
+
+class InterruptController(object):
+    """ Mailboxes for inter-processor interrupts, one queue per core
+    """
+
+    def __init__(self, cpus):
+        self._queues = [multiprocessing.Queue() for _ in range(cpus)]
+
+    def send(self, cpu, vector, sender):
+        if not 0 <= cpu < len(self._queues):
+            raise ValueError("There is no cpu {}".format(cpu))
+        self._queues[cpu].put((vector, sender))
+
+    def receive(self, cpu, timeout=None):
+        """ returns the next (vector, sender) for a core or None if none arrived within timeout
+        """
+        try:
+            return self._queues[cpu].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class SMP(object):
+    """ Multi-core machine, one OS process per core
+
+    All cores run the same program against one SharedMemory, each with its own registers, stack and
+    kernel. The kernels have no heap, separate heaps would hand out the same shared addresses. Every core starts with its number in EDI and ESP at the top of its own stack_size bytes
+    of stack, the stacks are stacked below the end of the memory. LOCK INC and LOCK DEC on memory are atomic
+    across the cores. SYS_SEND_IPI and SYS_WAIT_IPI pass interrupts between them.
+
+        smp = SMP(program, cpus=4)
+        smp.memory.write(0x1000, data)
+        results = smp.run()
+        smp.close()
+    """
+
+    def __init__(self, program, cpus=None, memory_size=0x10000, engine=BlockInterpreter, stack_size=0x1000):
+        """
+        :param program: assembler.Program all cores run
+        :param cpus: amount of cores, one per host core by default
+        :param memory_size: size of the shared memory
+        :param engine: Interpreter or one of its subclasses, has to be importable by the processes
+        :param stack_size: bytes of stack of every core
+        """
+        self._cpus = cpus if cpus is not None else multiprocessing.cpu_count()
+        if self._cpus * stack_size > memory_size:
+            raise ValueError("The stacks of {} cores don't fit into {} bytes of memory".format(self._cpus, memory_size))
+        self._stack_size = stack_size
+        self._image = objectfile.dump(program)
+        self._engine = engine
+        self._memory = SharedMemory(memory_size)
+        self._interrupts = InterruptController(self._cpus)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def cpus(self):
+        return self._cpus
+
+    @property
+    def memory(self):
+        """ the SharedMemory of the machine, can be read and written while the cores aren't running
+        """
+        return self._memory
+
+    @property
+    def interrupts(self):
+        return self._interrupts
+
+    def core(self):
+        """ returns a Core working on the shared memory, for inspecting or preparing it in this process
+        """
+        return Core(memory=self._memory)
+
+    def machine(self, cpu, output=None):
+        """ returns a Machine set up like the one a core runs on, working on the shared memory in this process
+        """
+        return _machine(cpu, self._memory, self._interrupts, output)
+
+    def run(self, registers=None):
+        """ start all cores and wait for them to leave the program
+
+        :param registers: list with a {name: value} dict of initial registers for every core
+        :return: list with a CpuResult for every core
+        """
+        results = multiprocessing.Queue()
+        processes = []
+        for cpu in range(self._cpus):
+            initial = {'EDI': cpu, 'ESP': self._memory.size - cpu * self._stack_size}
+            if registers is not None:
+                initial.update(registers[cpu])
+            process = multiprocessing.Process(target=_run_core, args=(
+                cpu, self._image, self._engine, self._memory.attach(), self._interrupts, initial, results))
+            process.start()
+            processes.append(process)
+
+        # a core that dies without reporting, e.g. killed by a signal, must not block the others
+        collected = {}
+        while len(collected) < len(processes):
+            finished = all(process.exitcode is not None for process in processes)
+            try:
+                result = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if finished:
+                    break
+                continue
+            collected[result.cpu] = result
+
+        for cpu, process in enumerate(processes):
+            process.join()
+            if cpu not in collected:
+                collected[cpu] = CpuResult(cpu, {}, [], "Process exited with code {}".format(process.exitcode))
+        return [collected[cpu] for cpu in range(len(processes))]
+
+    def close(self):
+        self._memory.close()
+
+
+def _machine(cpu, memory, interrupts, output):
+    return Machine(core=Core(memory=memory), output=output, cpu=cpu, interrupts=interrupts, heap=False)
+
+
+def _run_core(cpu, image, engine, memory, interrupts, registers, results):
+    output = []
+    shared = core = None
+    error = None
+    try:
+        shared = SharedMemory(*memory)
+        machine = _machine(cpu, shared, interrupts, lambda fd, data: output.append((fd, bytes(data))))
+        core = machine.core
+        for name, value in registers.items():
+            core.mov_reg_imm(register.resolve(name), value)
+        machine.interpreter(objectfile.load(image).instructions, engine=engine).run()
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+    finally:
+        state = dict(zip(register.NAMES, core.register_file)) if core is not None else {}
+        results.put(CpuResult(cpu, state, output, error))
+        if shared is not None:
+            shared.close()
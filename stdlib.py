@@ -1,6 +1,7 @@
-import kernel
 import logging
 
+from machine import current_machine
+
 FORMAT = '%(asctime)-15s %(name)-12s %(levelname)-8s %(message)s'
 LOG = logging.getLogger('stdlib')
 LOG.setLevel(logging.DEBUG)
@@ -8,16 +9,45 @@ ch = logging.StreamHandler()
 ch.setFormatter(logging.Formatter(FORMAT))
 LOG.addHandler(ch)
 
-def malloc(size):
-    address = kernel.Kernel().allocate_memory(size)
+def _kernel(machine):
+    return (machine if machine is not None else current_machine()).kernel
+
+def malloc(size, machine=None):
+    """ allocate memory
+    Small requests are served from the kernels slab allocator, larger ones from the heap
+    """
+    address = _kernel(machine).allocate(size)
+    if address is None:
+        raise Exception("Couldn't allocate memory")
+
+    LOG.debug("Allocated %d bytes at address %04X", size, address)
+    return address
+
+def calloc(number, size, machine=None):
+    """ allocate memory for number objects of size bytes each, cleared to zero
+    """
+    address = _kernel(machine).allocate_zeroed(number * size)
     if address is None:
         raise Exception("Couldn't allocate memory")
+    return address
+
+def realloc(address, size, machine=None):
+    """ resize a block allocated with malloc(), moving it only if it can't grow in place
 
-    LOG.debug("Allocated {} bytes at address {:04X}".format(size, address))
+    :return: the new address of the block
+    """
+    address = _kernel(machine).reallocate(address, size)
+    if address is None:
+        raise Exception("Couldn't allocate memory")
     return address
 
-def free(address):
-    kernel.Kernel().free_memory(address)
+def arena(chunk_size=0x1000, machine=None):
+    """ create an Arena, all of its allocations get released at once with reset() or release()
+    """
+    return _kernel(machine).arena(chunk_size)
+
+def free(address, machine=None):
+    _kernel(machine).free(address)
 
 def sizeof(obj):
     try:
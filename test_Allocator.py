@@ -0,0 +1,85 @@
+import random
+from unittest import TestCase
+
+from allocator import FreeListAllocator, BEST_FIT, FIRST_FIT
+
+
+class TestFreeListAllocator(TestCase):
+    def test_policies(self):
+        for policy, expected in ((FIRST_FIT, 0x00), (BEST_FIT, 0x30)):
+            heap = FreeListAllocator(0x00, 0x100, policy)
+            a = heap.allocate(0x10)
+            b = heap.allocate(0x20)
+            c = heap.allocate(0x08)
+            d = heap.allocate(0x08)
+            self.assertEqual([a, b, c, d], [0x00, 0x10, 0x30, 0x38])
+
+            heap.free(a)
+            heap.free(c)
+            self.assertEqual(heap.allocate(0x08), expected)
+
+    def test_resize(self):
+        heap = FreeListAllocator(0x00, 0x100)
+        a = heap.allocate(0x10)
+        b = heap.allocate(0x10)
+        self.assertFalse(heap.resize(a, 0x20))
+        self.assertTrue(heap.resize(b, 0x80))
+        self.assertEqual(heap.free_extents, [(0x90, 0x100)])
+
+        self.assertTrue(heap.resize(b, 0x08))
+        self.assertEqual(heap.free_extents, [(0x18, 0x100)])
+        heap.free(b)
+        self.assertTrue(heap.resize(a, 0x100))
+        self.assertEqual(heap.free_extents, [])
+        self.assertRaises(ValueError, heap.resize, 0x40, 0x10)
+
+    def test_coalescing(self):
+        heap = FreeListAllocator(0x00, 0x100)
+        blocks = [heap.allocate(0x10) for _ in range(0x10)]
+        self.assertIsNone(heap.allocate(1))
+        self.assertEqual(heap.largest_free_extent, 0)
+
+        heap.free(blocks[1])
+        heap.free(blocks[3])
+        self.assertEqual(heap.free_extents, [(0x10, 0x20), (0x30, 0x40)])
+
+        heap.free(blocks[2])
+        self.assertEqual(heap.free_extents, [(0x10, 0x40)])
+        self.assertEqual(heap.allocate(0x30), 0x10)
+
+        for address in blocks:
+            heap.free(address)
+        self.assertEqual(heap.free_extents, [(0x00, 0x100)])
+        self.assertEqual(heap.blocks, {})
+
+    def test_free_unknown(self):
+        heap = FreeListAllocator(0x00, 0x100)
+        self.assertIsNone(heap.free(0x10))
+        self.assertEqual(heap.free(heap.allocate(5)), 5)
+        self.assertRaises(ValueError, heap.allocate, 0)
+
+    def test_random(self):
+        rnd = random.Random(7)
+        for policy in (FIRST_FIT, BEST_FIT):
+            heap = FreeListAllocator(0x00, 0x1000, policy)
+            live = {}
+            for _ in range(2000):
+                if live and rnd.random() < 0.5:
+                    address = rnd.choice(list(live))
+                    self.assertEqual(heap.free(address), live.pop(address))
+                else:
+                    size = rnd.randint(1, 64)
+                    address = heap.allocate(size)
+                    if address is not None:
+                        live[address] = size
+
+                # blocks and free extents never overlap and cover the whole range
+                ranges = sorted([(a, a + s) for a, s in live.items()] + heap.free_extents)
+                self.assertEqual(ranges[0][0], 0x00)
+                self.assertEqual(ranges[-1][1], 0x1000)
+                for (s1, e1), (s2, e2) in zip(ranges, ranges[1:]):
+                    self.assertEqual(e1, s2)
+                # free extents are always merged
+                extents = heap.free_extents
+                for (s1, e1), (s2, e2) in zip(extents, extents[1:]):
+                    self.assertLess(e1, s2)
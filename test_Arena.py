@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from allocator import FreeListAllocator
+from arena import Arena, ArenaError
+
+
+class TestArena(TestCase):
+    def setUp(self):
+        # the heap has the allocate/free interface the arena expects from the kernel
+        self.heap = FreeListAllocator(0x0000, 0x10000)
+
+    def test_bump(self):
+        arena = Arena(self.heap, chunk_size=0x100)
+        self.assertEqual([arena.allocate(n) for n in (3, 4, 1, 8)], [0x00, 0x04, 0x08, 0x0c])
+        self.assertEqual(arena.bytes_in_use, 0x14)
+        self.assertEqual(arena.chunks, [(0x00, 0x100)])
+
+        self.assertEqual(arena.allocate(0xf0), 0x100)
+        self.assertEqual(arena.allocate(0x400), 0x200)
+        self.assertEqual(arena.chunks, [(0x00, 0x100), (0x100, 0x100), (0x200, 0x400)])
+
+    def test_alignment(self):
+        self.heap.allocate(0x03)
+        arena = Arena(self.heap, chunk_size=0x100, alignment=4)
+        blocks = [arena.allocate(n) for n in (1, 4, 4, 0x100)]
+        self.assertEqual(blocks, [0x04, 0x08, 0x0c, 0x104])
+        self.assertEqual(arena.chunks, [(0x03, 0x100), (0x103, 0x103)])
+
+        arena.reset()
+        self.assertEqual(arena.allocate(0xfc), 0x04)
+        self.assertEqual(arena.allocate(0xfc), 0x104)
+        self.assertEqual(arena.allocate(0x04), 0x200)
+        self.assertTrue(all(block % 4 == 0 for block in blocks))
+
+    def test_reset(self):
+        arena = Arena(self.heap, chunk_size=0x100)
+        first = [arena.allocate(0x40) for _ in range(8)]
+        arena.reset()
+        self.assertEqual(arena.bytes_in_use, 0)
+        self.assertEqual([arena.allocate(0x40) for _ in range(8)], first)
+        self.assertEqual(len(self.heap.blocks), 2)
+
+        # a block too large for the kept chunk gets a new chunk in front of it
+        arena.reset()
+        arena.allocate(0x10)
+        self.assertEqual(arena.allocate(0x200), 0x200)
+        self.assertEqual(arena.chunks, [(0x00, 0x100), (0x200, 0x200), (0x100, 0x100)])
+
+    def test_release(self):
+        arena = Arena(self.heap, chunk_size=0x100)
+        for _ in range(10):
+            arena.allocate(0x80)
+        arena.release()
+        self.assertEqual(self.heap.blocks, {})
+        self.assertEqual(arena.chunks, [])
+        self.assertEqual(arena.allocate(1), 0x00)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, Arena, self.heap, 0x100, 3)
+        arena = Arena(FreeListAllocator(0x00, 0x100), chunk_size=0x100)
+        arena.allocate(0x100)
+        self.assertRaises(ArenaError, arena.allocate, 1)
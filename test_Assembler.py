@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+import register
+from assembler import assemble, AssemblerError
+from instruction import Register, Immediate, Memory, Label
+
+
+class TestAssembler(TestCase):
+    def test_operands(self):
+        program = assemble("""
+            ; registers and immediates
+            mov eax, 123
+            MOV bl, 0x1f        ; hex
+            mov cx, 1Fh
+            mov edx, -0b101
+            mov eax, ebx
+            mov ah, [esi+8-2]
+            mov dword ptr [0x1000], 7
+        """)
+
+        ins = program.instructions
+        self.assertEqual([i.instruction for i in ins], ['MOV'] * 7)
+        self.assertEqual([i.line for i in ins], [3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(ins[0].parameters, [Register('EAX', register.resolve('EAX')), Immediate(123)])
+        self.assertEqual(ins[1].parameters[1], Immediate(0x1f))
+        self.assertEqual(ins[2].parameters, [Register('CX', register.resolve('CX')), Immediate(0x1f)])
+        self.assertEqual(ins[3].parameters[1], Immediate(-5))
+        self.assertEqual(ins[4].parameters[1], Register('EBX', register.resolve('EBX')))
+        self.assertEqual(ins[5].parameters[1], Memory(register.resolve('ESI'), 6, None))
+        self.assertEqual(ins[6].parameters, [Memory(None, 0x1000, 32), Immediate(7)])
+
+    def test_labels(self):
+        program = assemble("""
+            start:  mov ecx, 3
+            again:
+                    inc eax
+                    loop again
+                    jmp end
+                    nop
+            end:    pop
+        """)
+
+        self.assertEqual(program.labels, {'start': 0, 'again': 1, 'end': 5})
+        self.assertEqual(program.instructions[2].parameters, [Label('again', 1)])
+        self.assertEqual(program.instructions[3].parameters, [Label('end', 5)])
+
+    def test_errors(self):
+        for source, line in (("mov eax, 1\nfoo eax", 2),
+                             ("inc eax, ebx", 1),
+                             ("\n\njmp nowhere", 3),
+                             ("mov eax, [ax]", 1),
+                             ("x: nop\nx: nop", 2),
+                             ("mov eax, [ebx", 1),
+                             ("mov eax, $1", 1)):
+            with self.assertRaises(AssemblerError) as e:
+                assemble(source)
+            self.assertEqual(e.exception.line, line)
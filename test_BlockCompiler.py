@@ -0,0 +1,129 @@
+import random
+from unittest import TestCase
+
+import register
+from assembler import assemble
+from blockcompiler import BlockInterpreter
+from interpreter import Interpreter
+
+REGISTERS = [n for n in register.REGISTERS if n not in ('EIP', 'ESP', 'SP')]
+
+
+def random_source(rnd, length):
+    lines = ["mov esi, 0x1000", "mov ecx, {}".format(rnd.randint(1, 5)), "top:"]
+    stack = []      # 'push' for every entry on the stack, 'pusha' for a whole PUSHA frame
+    for _ in range(length):
+        choice = rnd.randint(0, 10)
+        reg = rnd.choice(REGISTERS)
+        if reg in ('ECX', 'CX', 'CH', 'CL', 'ESI', 'SI'):
+            reg = 'EAX'
+        if choice == 0:
+            lines.append("mov {}, {}".format(reg, rnd.choice([0, 1, 0xff, 0x100, 0xffff, 0x12345678, -1])))
+        elif choice == 1:
+            lines.append("mov {}, {}".format(reg, rnd.choice(REGISTERS)))
+        elif choice == 2:
+            lines.append("inc {}".format(reg))
+        elif choice == 3:
+            lines.append("dec {}".format(reg))
+        elif choice == 4 and len(stack) < 200:
+            lines.append("push {}".format(rnd.choice(REGISTERS)))
+            stack.append('push')
+        elif choice == 5 and stack:
+            lines.append("pop {}".format(reg))
+            stack.pop()
+        elif choice == 6:
+            lines.append("mov [esi+{}], {}".format(rnd.randint(0, 16), rnd.choice(REGISTERS)))
+        elif choice == 7:
+            lines.append("mov {}, [esi+{}]".format(reg, rnd.randint(0, 16)))
+        elif choice == 8 and len(stack) < 192:
+            lines.append("pusha")
+            stack.extend(['push'] * 7 + ['pusha'])
+        elif choice == 9 and stack and stack[-1] == 'pusha':
+            lines.append("popa")
+            del stack[-8:]
+        else:
+            if rnd.randint(0, 2) == 0:
+                lines.append(rnd.choice(["clc", "stc"]))
+            lines.append("jc skip{0}\ninc edi\nskip{0}:".format(len(lines)))
+    lines.append("loop top")
+    lines.append("nop")
+    return "\n".join(lines)
+
+
+class TestBlockInterpreter(TestCase):
+    def test_matches_interpreter(self):
+        rnd = random.Random(1234)
+        for run in range(50):
+            instructions = assemble(random_source(rnd, 30)).instructions
+
+            expected = Interpreter(instructions)
+            expected.run()
+            actual = BlockInterpreter(instructions)
+            actual.run()
+
+            self.assertEqual(list(actual.core.register_file), list(expected.core.register_file))
+            self.assertEqual(actual.core.EFLAGS, expected.core.EFLAGS)
+            self.assertEqual(actual.core.read_memory(0x1000, 0x20), expected.core.read_memory(0x1000, 0x20))
+            self.assertEqual(actual.core.read_memory(0xfffff000, 0x1000), expected.core.read_memory(0xfffff000, 0x1000))
+
+    def test_call(self):
+        instructions = assemble("""
+                    mov ecx, 5
+            top:    push ecx
+                    call twice
+                    pop ebx
+                    loop top
+                    jmp done
+            twice:  enter 4
+                    mov eax, [ebp+8]
+                    mov [ebp-4], eax
+                    pusha
+                    inc edx
+                    inc edx
+                    popa
+                    inc edx
+                    leave
+                    ret
+            done:   nop
+        """).instructions
+
+        expected = Interpreter(instructions)
+        expected.run()
+        actual = BlockInterpreter(instructions)
+        actual.run()
+
+        self.assertEqual(list(actual.core.register_file), list(expected.core.register_file))
+        self.assertEqual(actual.core.read_memory(0xffffffe0, 0x20), expected.core.read_memory(0xffffffe0, 0x20))
+        self.assertEqual(actual.core.register_file[register.EDX], 5)
+        self.assertEqual(actual.core.register_file[register.ESP], 0)
+
+    def test_pop_esp(self):
+        instructions = assemble("""
+                    mov eax, 0x1234
+                    push eax
+                    push eax
+                    pop esp
+        """).instructions
+
+        expected = Interpreter(instructions)
+        expected.run()
+        actual = BlockInterpreter(instructions)
+        actual.run()
+
+        self.assertEqual(expected.core.register_file[register.ESP], 0x1234)
+        self.assertEqual(list(actual.core.register_file), list(expected.core.register_file))
+
+    def test_block_cache(self):
+        interpreter = BlockInterpreter(assemble("""
+                    mov ecx, 100
+            top:    inc eax
+                    loop top
+        """).instructions)
+        interpreter.run()
+        self.assertEqual(interpreter.core.EAX, 100)
+        self.assertEqual(sorted(interpreter._blocks), [0, 1])
+
+        interpreter.load(assemble("dec ebx").instructions)
+        interpreter.run()
+        self.assertEqual(interpreter.core.EBX, 0xffffffff)
+        self.assertEqual(sorted(interpreter._blocks), [0])
@@ -0,0 +1,110 @@
+from unittest import TestCase
+
+from console import TextConsole
+from framebuffer import Framebuffer, CharacterIndexError, glyph_tile
+from machine import Machine
+
+
+def cell(screen, x, y):
+    """ returns the eight pixel rows of a character cell
+    """
+    width = screen.screen_width
+    return tuple(bytes(screen.pixels[(y * 8 + row) * width + x * 8:(y * 8 + row) * width + x * 8 + 8]) for row in range(8))
+
+
+class TestConsole(TestCase):
+    def test_write(self):
+        console = TextConsole(Framebuffer(), attribute=0x1e)
+        console.write("ab\ncd\r\tx")
+        self.assertEqual(console.cursor, (9, 1))
+        self.assertEqual(console.cells[:4], b"a\x1eb\x1e")
+        self.assertEqual(console.cells[80:84], b"c\x1ed\x1e")
+        self.assertEqual(console.cells[96:98], b"x\x1e")
+
+        console.write("\b\by")
+        self.assertEqual(console.cells[94:96], b"y\x1e")
+
+        # lines wrap at the right edge
+        console.move_cursor(38, 3)
+        console.write("123")
+        self.assertEqual((console.cells[3 * 80 + 76], console.cells[4 * 80]), (ord('1'), ord('3')))
+        self.assertEqual(console.cursor, (1, 4))
+        self.assertRaises(ValueError, console.move_cursor, 40, 0)
+
+    def test_put(self):
+        console = TextConsole(Framebuffer())
+        console.put(ord('x'), 39, 24)
+        self.assertEqual(console.cells[-2:], b"x\x07")
+        for x, y in ((40, 0), (-1, 0), (0, 25), (0, -1)):
+            self.assertRaises(CharacterIndexError, console.put, ord('x'), x, y)
+        self.assertEqual(console.cells.count(ord('x')), 1)
+
+    def test_render(self):
+        screen = Framebuffer()
+        console = TextConsole(screen)
+        self.assertEqual(console.dirty_cells, 40 * 25)
+        console.flush()
+        self.assertEqual(screen.frames, 1)
+        self.assertEqual(console.dirty_cells, 0)
+
+        # only changed cells are drawn again
+        console.write("Hi")
+        console.put(ord('!'), 39, 24, 0x4f)
+        self.assertEqual(console.render(), 3)
+        self.assertEqual(cell(screen, 0, 0), glyph_tile(ord('H'), 7, 0))
+        self.assertEqual(cell(screen, 39, 24), glyph_tile(ord('!'), 15, 4))
+        self.assertEqual(screen.damage, [(0, 0, 16, 8), (312, 192, 8, 8)])
+        console.flush()
+        self.assertEqual(screen.frames, 2)
+
+        # nothing changed, no frame
+        console.flush()
+        self.assertEqual(screen.frames, 2)
+
+    def test_scroll(self):
+        screen = Framebuffer()
+        console = TextConsole(screen)
+        for line in range(30):
+            console.write("line {}\n".format(line))
+        self.assertEqual(console.cursor, (0, 24))
+        console.flush()
+
+        self.assertEqual(bytes(console.cells[0:14:2]), b"line 6 ")
+        self.assertEqual(bytes(console.cells[23 * 80:23 * 80 + 14:2]), b"line 29")
+        self.assertEqual(cell(screen, 5, 0), glyph_tile(ord('6'), 7, 0))
+
+        # scrolling moves the drawn pixels and clears the new row, nothing is drawn again
+        screen.fill_rect(0, 192, 8, 8, 3)
+        console.scroll()
+        self.assertEqual(console.dirty_cells, 0)
+        self.assertEqual(screen.damage, [(0, 192, 8, 8), (0, 0, 320, 200)])
+        self.assertEqual(cell(screen, 5, 0), glyph_tile(ord('7'), 7, 0))
+        self.assertEqual(cell(screen, 0, 24), glyph_tile(0x20, 7, 0))
+
+    def test_wide(self):
+        screen = Framebuffer(width=640)
+        console = TextConsole(screen, columns=80)
+        console.write("x" * 81)
+        console.scroll()
+        console.flush()
+        self.assertEqual(cell(screen, 0, 0), glyph_tile(ord('x'), 7, 0))
+        self.assertEqual(cell(screen, 79, 0), glyph_tile(0x20, 7, 0))
+        self.assertRaises(ValueError, TextConsole, Framebuffer(), columns=80)
+
+    def test_sys_write(self):
+        screen = Framebuffer()
+        machine = Machine(screen=screen)
+        core = machine.core
+        core.set_memory_range(0x100, b"one\ntwo\x00")
+        for _ in range(2):
+            core.EAX = 4
+            core.EBX = 1
+            core.ECX = 0x100
+            core.EDX = 8
+            machine.kernel.interrupt(0x80)
+
+        console = machine.kernel.console
+        self.assertEqual(console.cursor, (3, 2))
+        self.assertEqual(bytes(console.cells[80:92:2]), b"twoone")
+        self.assertEqual(screen.frames, 2)
+        self.assertEqual(cell(screen, 4, 1), glyph_tile(ord('n'), 10, 0))
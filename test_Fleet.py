@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+from assembler import assemble
+from fleet import Fleet, State
+from interpreter import Interpreter
+
+SOURCE = """
+            mov esi, 0x100
+            mov ecx, [esi]
+    top:    inc eax
+            loop top
+            mov [esi+4], eax
+            mov ecx, 0x200
+            mov edx, 2
+            mov ebx, 1
+            mov eax, 4
+            int 0x80
+            mov eax, [esi+4]
+"""
+
+
+def states(count):
+    for n in range(count):
+        yield State({'EAX': n}, {0x100: (n + 1).to_bytes(4, 'little'), 0x200: b"ok"})
+
+
+class TestFleet(TestCase):
+    def check(self, results, count):
+        self.assertEqual([r.index for r in results], list(range(count)))
+        for n, result in enumerate(results):
+            self.assertIsNone(result.error)
+            self.assertEqual(result.registers['EAX'], 2 * n + 1)
+            self.assertEqual(result.registers['ECX'], 0x200)
+            self.assertEqual(result.memory, [(2 * n + 1).to_bytes(4, 'little')])
+            self.assertEqual(result.output, [(1, b"ok")])
+
+    def test_in_process(self):
+        program = assemble(SOURCE)
+        for engine in (Interpreter, None):
+            kwargs = {'engine': engine} if engine else {}
+            with Fleet(program, workers=0, read=[(0x104, 4)], batch_size=3, **kwargs) as fleet:
+                self.check(list(fleet.map(states(10))), 10)
+
+    def test_processes(self):
+        with Fleet(assemble(SOURCE), workers=2, read=[(0x104, 4)], batch_size=4, window=2) as fleet:
+            self.check(list(fleet.map(states(50))), 50)
+            self.check(list(fleet.map(states(5))), 5)
+
+    def test_kernel_restored(self):
+        # blocks allocated by a run don't leak into the next one
+        with Fleet(assemble("int 0x30"), workers=0) as fleet:
+            kernel = fleet._runner._machine.kernel
+            addresses = []
+            kernel.set_interrupt_handler(0x30, lambda: addresses.append(kernel.allocate(0x100)))
+            list(fleet.map([State(), State()]))
+            self.assertEqual(len(addresses), 2)
+            self.assertEqual(addresses[0], addresses[1])
+
+    def test_errors(self):
+        with Fleet(assemble("mov eax, 1\nint 0x80\nmov [eax], ebx"), workers=0) as fleet:
+            result, = fleet.map([State()])
+            self.assertIsNone(result.error)
+
+        with Fleet(assemble("mov eax, 99\nint 0x80"), workers=0) as fleet:
+            result, = fleet.map([State()])
+            self.assertTrue(result.error.startswith("KeyError"))
+            self.assertRaises(ValueError, list, fleet.map([State({'XYZ': 1})]))
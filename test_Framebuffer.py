@@ -0,0 +1,191 @@
+import os
+import struct
+import tempfile
+import zlib
+from unittest import TestCase
+
+from characters import ascii_dos
+from framebuffer import Framebuffer, HeadlessScreen, scale_frame, glyph_tile, bounding_rect, GLYPHS, \
+    MAX_DAMAGE_RECTS, PixelIndexError, PixelColorError, AsciiIndexError, \
+    CharacterIndexError, SCREEN_WIDTH, SCREEN_HEIGHT, CELL_WIDTH, CELL_HEIGHT
+from machine import Machine
+
+
+def decode_png(data):
+    """ returns width, height and the palette indices of an indexed PNG written by encode_png()
+    """
+    width, height = struct.unpack('>II', data[16:24])
+    position = 8
+    idat = b""
+    while position < len(data):
+        length, = struct.unpack('>I', data[position:position + 4])
+        if data[position + 4:position + 8] == b"IDAT":
+            idat += data[position + 8:position + 8 + length]
+        position += length + 12
+    rows = zlib.decompress(idat)
+    return width, height, b"".join(rows[y * (width + 1) + 1:(y + 1) * (width + 1)] for y in range(height))
+
+
+def draw_character(screen, c, x, y, color):
+    """ reference for set_character(), draws the lit pixels of a glyph one by one
+    """
+    for yp, mask in enumerate(GLYPHS[c]):
+        for xp in range(CELL_WIDTH):
+            if mask & (1 << (CELL_WIDTH - 1 - xp)):
+                screen.set_pixel(x*CELL_WIDTH + xp, y*CELL_HEIGHT + yp, color)
+
+
+def draw_square(screen, p, width, height, color):
+    """ reference for draw_square(), sets the pixels of width + 1 columns one by one
+    """
+    for x in range(p[0], p[0] + width + 1):
+        for y in range(p[1], p[1] + height):
+            try:
+                screen.set_pixel(x, y, color)
+            except PixelIndexError:
+                pass
+
+
+class TestFramebuffer(TestCase):
+    def test_pixels(self):
+        screen = Framebuffer()
+        screen.set_pixel(0, 0, 15)
+        screen.set_pixel(319, 199, 4)
+        self.assertEqual(screen.get_pixel(319, 199), 4)
+        self.assertEqual(screen.pixels[0], 15)
+        self.assertRaises(PixelIndexError, screen.set_pixel, 320, 0, 1)
+        self.assertRaises(PixelIndexError, screen.set_pixel, 0, -1, 1)
+        self.assertRaises(PixelColorError, screen.set_pixel, 0, 0, 16)
+
+        # nothing is visible before the frame is published
+        self.assertEqual(screen.frame, bytes(SCREEN_WIDTH * SCREEN_HEIGHT))
+        screen.update_screen_buffer()
+        self.assertEqual(screen.frames, 1)
+        self.assertEqual(screen.frame[0], 15)
+
+        screen.cls(1)
+        self.assertEqual(set(screen.pixels), {1})
+
+    def test_damage(self):
+        published = []
+        screen = Framebuffer()
+        screen.present = lambda frame, damage: published.append(damage)
+        self.assertFalse(screen.update_screen_buffer())
+
+        screen.set_pixel(10, 20, 1)
+        screen.set_pixel(5, 30, 1)
+        screen.set_character(65, 2, 0, 3)
+        screen.set_character(66, 3, 0, 3)
+        screen.fill_rect(-5, 190, 10, 20, 2)
+        self.assertTrue(screen.update_screen_buffer())
+        self.assertEqual(published, [[(16, 0, 16, 8), (0, 190, 5, 10), (5, 20, 6, 11)]])
+        self.assertFalse(screen.update_screen_buffer())
+        self.assertEqual(screen.frames, 1)
+
+        screen.blit(0, 0, 2, b"\x01\x01")
+        for y in range(20):
+            screen.add_damage(100, y * 10, 1, 1)
+        self.assertLessEqual(len(screen.damage), MAX_DAMAGE_RECTS)
+        self.assertEqual(bounding_rect(screen.damage), (0, 0, 101, 191))
+        screen.cls()
+        self.assertEqual(screen.damage, [(0, 0, 320, 200)])
+
+    def test_character(self):
+        screen = Framebuffer()
+        screen.set_character(65, 1, 2, 10)
+        for y in range(8):
+            row = [screen.get_pixel(8 + x, 16 + y) for x in range(8)]
+            self.assertEqual(row, [10 if bit else 0 for bit in ascii_dos[65][y]])
+
+        # the fast path draws the same pixels as setting them one by one
+        screen = Framebuffer()
+        expected = Framebuffer()
+        for c in range(256):
+            draw_character(expected, c, c % 40, c // 40, 1 + c % 15)
+            screen.set_character(c, c % 40, c // 40, 1 + c % 15)
+        self.assertEqual(screen.pixels, expected.pixels)
+
+        # with a background the whole cell is replaced
+        screen.set_character(ord('d'), 0, 0, 14, background=1)
+        cell = [screen.get_pixel(x, y) for y in range(8) for x in range(8)]
+        self.assertEqual(cell, [14 if mask & (0x80 >> x) else 1 for mask in GLYPHS[ord('d')] for x in range(8)])
+        self.assertEqual(glyph_tile(ord('d'), 14, 1), glyph_tile(ord('d'), 14, 1))
+        self.assertEqual(len(GLYPHS), 256)
+        screen.set_character(255, 39, 6, 14, background=1)
+        self.assertEqual(screen.get_pixel(39 * 8, 6 * 8), 1)
+
+        # nothing is marked as damaged if the arguments are rejected
+        screen.update_screen_buffer()
+        self.assertRaises(PixelColorError, screen.set_character, 65, 0, 0, 14, 16)
+        self.assertEqual(screen.damage, [])
+        self.assertRaises(AsciiIndexError, screen.set_character, 256, 0, 0, 1)
+        self.assertRaises(AsciiIndexError, screen.set_character, -1, 0, 0, 1)
+        self.assertRaises(CharacterIndexError, screen.set_character, 65, 40, 0, 1)
+
+    def test_rectangles(self):
+        screen = Framebuffer()
+        screen.fill_rect(-2, 198, 4, 10, 3)
+        self.assertEqual([screen.get_pixel(x, y) for x in range(3) for y in (197, 198, 199)], [0, 3, 3] * 2 + [0] * 3)
+
+        # draw_square fills the same pixels as setting them one by one
+        expected = Framebuffer()
+        draw_square(expected, (315, 5), 10, 4, 9)
+        screen.draw_square((315, 5), 10, 4, 9)
+        self.assertEqual(screen.pixels[:0x4000], expected.pixels[:0x4000])
+
+        screen.blit(10, 20, 2, b"\x01\x02\x03\x04")
+        self.assertEqual([screen.get_pixel(x, y) for y in (20, 21) for x in (10, 11)], [1, 2, 3, 4])
+        screen.blit(0, 199, 320, bytes([5]) * 320)
+        self.assertEqual(screen.get_pixel(319, 199), 5)
+        self.assertRaises(PixelIndexError, screen.blit, 319, 0, 2, b"\x01\x01")
+        self.assertRaises(ValueError, screen.blit, 0, 0, 0, b"")
+        self.assertRaises(ValueError, screen.blit, 0, 0, -2, b"\x01\x01")
+        self.assertRaises(PixelColorError, screen.blit, 0, 0, 1, b"\x10")
+
+    def test_scale(self):
+        self.assertEqual(scale_frame(b"\x01\x02\x03\x04", 2, width=2, height=2),
+                         b"\x01\x01\x02\x02" * 2 + b"\x03\x03\x04\x04" * 2)
+
+        screen = HeadlessScreen(scale=3)
+        screen.set_pixel(1, 0, 14)
+        screen.update_screen_buffer()
+        width, height, frame = decode_png(screen.to_png())
+        self.assertEqual((width, height), (SCREEN_WIDTH * 3, SCREEN_HEIGHT * 3))
+        self.assertEqual(frame, scale_frame(screen.frame, 3))
+        self.assertEqual(frame[:8], b"\x00\x00\x00\x0e\x0e\x0e\x00\x00")
+        self.assertRaises(ValueError, HeadlessScreen, scale=0)
+
+    def test_export(self):
+        screen = HeadlessScreen()
+        screen.draw_line((0, 0), (319, 199), 14)
+        screen.set_pixel(1, 0, 14)
+        screen.update_screen_buffer()
+
+        ppm = screen.to_ppm()
+        header = b"P6\n320 200\n255\n"
+        self.assertTrue(ppm.startswith(header))
+        self.assertEqual(len(ppm), len(header) + SCREEN_WIDTH * SCREEN_HEIGHT * 3)
+        self.assertEqual(ppm[len(header):len(header) + 6], b"\x00\x00\x00\xff\xff\x55")
+
+        self.assertEqual(decode_png(screen.to_png()), (SCREEN_WIDTH, SCREEN_HEIGHT, screen.frame))
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            machine = Machine(screen=HeadlessScreen(directory=directory))
+            core = machine.core
+            core.set_memory_range(0x100, b"HELLO")
+            core.EAX = 4
+            core.EBX = 1
+            core.ECX = 0x100
+            core.EDX = 5
+            machine.kernel.interrupt(0x80)
+
+            self.assertEqual(os.listdir(directory), ["frame_00001.png"])
+            with open(os.path.join(directory, "frame_00001.png"), "rb") as f:
+                width, height, frame = decode_png(f.read())
+            self.assertEqual(frame, machine.screen.frame)
+            self.assertEqual(frame[7 * SCREEN_WIDTH:8 * SCREEN_WIDTH].count(0), SCREEN_WIDTH)
+            self.assertNotEqual(set(frame[:8 * SCREEN_WIDTH]), {0})
+
+        self.assertRaises(ValueError, HeadlessScreen, format='gif')
+        self.assertRaises(ValueError, HeadlessScreen().save, "frame.gif")
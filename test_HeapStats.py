@@ -0,0 +1,130 @@
+from unittest import TestCase
+
+import slab
+import stdlib
+from allocator import FreeListAllocator
+from heapstats import HeapStats, Histogram, AllocationProfile
+from machine import Machine, current_machine
+
+
+class TestHeapStats(TestCase):
+    def test_histogram(self):
+        histogram = Histogram()
+        for value in (0, 1, 2, 3, 100, 120):
+            histogram.add(value)
+        self.assertEqual(len(histogram), 6)
+        self.assertEqual(histogram.buckets(), [(0, 1), (1, 1), (3, 2), (127, 2)])
+        self.assertEqual(histogram.percentile(50), 3)
+        self.assertEqual(histogram.percentile(100), 127)
+        self.assertEqual(len(histogram.dump()), 4)
+
+    def test_counters(self):
+        stats = HeapStats()
+        stats.allocated(0x00, 0x10, 50)
+        stats.allocated(0x10, 0x20, 50)
+        stats.allocated(None, 0x1000, 50)
+        stats.freed(0x00, 20)
+        stats.freed(0x1234, 20)
+
+        self.assertEqual(stats.allocations, 2)
+        self.assertEqual(stats.failed_allocations, 1)
+        self.assertEqual(stats.frees, 1)
+        self.assertEqual(stats.live_blocks, 1)
+        self.assertEqual(stats.bytes_in_use, 0x20)
+        self.assertEqual(stats.high_water_mark, 0x30)
+        self.assertEqual(len(stats.allocation_latency), 3)
+
+    def test_profile(self):
+        stats = HeapStats()
+        stats.profile = AllocationProfile(rate=2, skip=('heapstats',))
+        for i in range(8):
+            stats.allocated(i * 0x10, 0x10, 0)
+        for i in range(4):
+            stats.freed(i * 0x10, 0)
+
+        site, = stats.profile.sites()
+        self.assertEqual(site.function, 'test_profile')
+        self.assertEqual(site.allocations, 8)
+        self.assertEqual(site.bytes, 0x80)
+        self.assertEqual(site.live_bytes, 0x40)
+
+    def test_free_bytes(self):
+        heap = FreeListAllocator(0x00, 0x100)
+        a = heap.allocate(0x10)
+        heap.allocate(0x10)
+        heap.free(a)
+        self.assertEqual(heap.free_bytes, 0xf0)
+        self.assertEqual(heap.bytes_in_use, 0x10)
+
+    def test_kernel(self):
+        machine = Machine()
+        kernel = machine.kernel
+
+        kernel.start_allocation_profile()
+        with machine.activate():
+            small = stdlib.malloc(0x10)
+            large = stdlib.malloc(0x400)
+        stats = kernel.memory_statistics()
+        self.assertEqual(stats.allocations, 2)
+        self.assertEqual(stats.live_blocks, 2)
+        self.assertEqual(stats.bytes_in_use, 0x410)
+        self.assertEqual(stats.high_water_mark, 0x410)
+        self.assertEqual(stats.heap_in_use, 0x400 + slab.SLAB_SIZE)
+        self.assertTrue(0.0 <= stats.fragmentation < 1.0)
+
+        stdlib.free(small, machine=machine)
+        sites = kernel.stop_allocation_profile()
+        self.assertEqual([(s.function, s.bytes, s.live_bytes) for s in sites],
+                         [('test_kernel', 0x400, 0x400), ('test_kernel', 0x10, 0)])
+        self.assertEqual(kernel.allocation_sites(), [])
+
+        stdlib.free(large, machine=machine)
+        stats = kernel.memory_statistics()
+        self.assertEqual(stats.bytes_in_use, 0)
+        self.assertEqual(stats.frees, 2)
+        self.assertEqual(stats.high_water_mark, 0x410)
+
+    def test_snapshot(self):
+        kernel = Machine().kernel
+        kept = kernel.allocate(0x10)
+        snapshot = kernel.snapshot()
+        heap_in_use = kernel.memory_statistics().heap_in_use
+
+        for _ in range(2):
+            self.assertEqual(kernel.allocate(0x10), kept + 0x10)
+            self.assertIsNotNone(kernel.allocate(0x1000))
+            kernel.free(kept)
+            kernel.restore(snapshot)
+            self.assertEqual(kernel.memory_statistics().live_blocks, 1)
+            self.assertEqual(kernel.memory_statistics().heap_in_use, heap_in_use)
+
+        # the restored slabs still allocate their slabs from this kernel's heap
+        self.assertEqual(kernel.allocate(0x200), kernel.allocate(0x200) - 0x200)
+
+    def test_realloc_calloc(self):
+        kernel = current_machine().kernel
+        core = kernel.core
+
+        # slab objects grow within their size class
+        address = stdlib.calloc(3, 4)
+        self.assertEqual(core.read_memory(address, 12), bytes(12))
+        self.assertEqual(stdlib.realloc(address, 16), address)
+
+        core.write_memory(address, b"0123456789abcdef")
+        moved = stdlib.realloc(address, 0x100)
+        self.assertNotEqual(moved, address)
+        self.assertEqual(core.read_memory(moved, 16), b"0123456789abcdef")
+
+        # heap blocks grow in place while the memory behind them is free
+        before = kernel.memory_statistics().reallocations
+        self.assertEqual(stdlib.realloc(moved, 0x200), moved)
+        self.assertEqual(kernel.memory_statistics().reallocations, before + 1)
+
+        # blocks can't shrink to nothing, neither in a slab nor on the heap, and stay allocated
+        small = stdlib.malloc(8)
+        for block in (small, moved):
+            self.assertRaises(ValueError, stdlib.realloc, block, 0)
+        self.assertEqual(stdlib.realloc(small, 8), small)
+        self.assertEqual(stdlib.realloc(moved, 0x200), moved)
+        stdlib.free(small)
+        stdlib.free(moved)
@@ -0,0 +1,113 @@
+from unittest import TestCase
+
+import register
+from assembler import assemble
+from interpreter import Interpreter, InterpreterError
+
+
+def run(source):
+    interpreter = Interpreter(assemble(source).instructions)
+    interpreter.run()
+    return interpreter.core
+
+
+class TestInterpreter(TestCase):
+    def test_mov(self):
+        core = run("""
+            mov eax, 0x12345678
+            mov bx, ax
+            mov ch, 0x1ff
+            mov dword [0x1000], eax
+            mov esi, 0x0ffe
+            mov dl, [esi+3]
+            mov word [esi], 0xbeef
+        """)
+
+        self.assertEqual(core.EAX, 0x12345678)
+        self.assertEqual(core.BX, 0x5678)
+        self.assertEqual(core.CH, 0xff)
+        self.assertEqual(core.EFLAGS & 0x01, 0x01)
+        self.assertEqual(core.read_memory(0x0ffe, 6), b"\xef\xbe\x78\x56\x34\x12")
+        self.assertEqual(core.DL, 0x56)
+
+    def test_loop(self):
+        core = run("""
+                    mov ecx, 10
+            top:    inc eax
+                    push eax
+                    loop top
+                    pop ebx
+                    jnc done
+                    mov edx, 1
+            done:   nop
+        """)
+
+        self.assertEqual(core.EAX, 10)
+        self.assertEqual(core.EBX, 10)
+        self.assertEqual(core.ECX, 0)
+        self.assertEqual(core.EDX, 0)
+
+    def test_carry(self):
+        core = run("""
+                    mov ecx, 600
+            top:    clc
+                    inc al
+                    jc wrap
+                    inc edx
+                    loop top
+                    jmp done
+            wrap:   inc ebx
+                    loop top
+            done:   stc
+        """)
+
+        self.assertEqual(core.EBX, 2)
+        self.assertEqual(core.EDX, 598)
+        self.assertEqual(core.EFLAGS & 0x01, 0x01)
+
+    def test_call(self):
+        core = run("""
+                    mov eax, 7
+                    mov edi, 0x11
+                    pusha
+                    push 3
+                    call square
+                    mov [0x1000], ebx
+                    popa
+                    jmp done
+            square: enter 8
+                    mov ecx, [ebp+8]
+                    mov [ebp-4], ecx
+                    mov ebx, 0
+            add:    inc ebx
+                    loop add
+                    mov edi, 0
+                    leave
+                    ret 4
+            done:   nop
+        """)
+
+        self.assertEqual(core.read_memory(0x1000, 4), b"\x03\x00\x00\x00")
+        self.assertEqual([core.register_file[reg] for reg in (register.EAX, register.EBX, register.EDI)], [7, 0, 0x11])
+        self.assertEqual([core.register_file[reg] for reg in (register.ESP, register.EBP)], [0, 0])
+        self.assertEqual(core.read_memory(0xffffffe0, 4), b"\x11\x00\x00\x00")
+        self.assertEqual(core.read_memory(0xffffffd0, 4), b"\x03\x00\x00\x00")
+
+    def test_recompile(self):
+        interpreter = Interpreter(assemble("inc eax").instructions)
+        interpreter.run()
+        interpreter.run()
+        interpreter.load(assemble("dec eax").instructions)
+        interpreter.run()
+        self.assertEqual(interpreter.core.EAX, 1)
+
+    def test_errors(self):
+        with self.assertRaises(InterpreterError) as e:
+            Interpreter(assemble("nop\nint 0x80").instructions).run()
+        self.assertEqual(e.exception.line, 2)
+
+        with self.assertRaises(InterpreterError):
+            Interpreter(assemble("mov [0x1000], 5").instructions).run()
+
+        with self.assertRaises(InterpreterError):
+            Interpreter(assemble("enter 8, 1").instructions).run()
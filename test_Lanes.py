@@ -0,0 +1,143 @@
+import random
+from unittest import TestCase, skipIf
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import register
+from assembler import assemble
+from core import Core
+from interpreter import Interpreter, InterpreterError
+
+SOURCE = """
+            mov esi, 0x100
+            mov [esi], ecx
+    top:    inc al
+            dec bh
+            push eax
+            loop top
+            jc carry
+            mov dx, 0x1ffff
+            jmp done
+    carry:  mov edx, [esi]
+            pop edi
+            mov word [esi+6], di
+    done:   mov ah, 0x7f
+            inc ah
+            mov [0x200], bl
+"""
+
+CALLS = """
+            mov ebp, 0x1234
+            call twice
+            pusha
+            mov eax, 1
+            mov ebx, 2
+            popa
+            push ecx
+            call frame
+            jmp end
+    twice:  inc eax
+            inc eax
+            ret
+    frame:  enter 8, 0
+            mov [ebp-4], eax
+            mov edx, [ebp-4]
+            leave
+            ret 4
+    end:    nop
+"""
+
+CARRY = """
+            mov ecx, 300
+    top:    clc
+            inc al
+            jc wrap
+            inc dl
+            loop top
+            jmp done
+    wrap:   inc bl
+            dec bh
+            stc
+            loop top
+    done:   nop
+"""
+
+LOCKED = """
+            mov [0x10], eax
+            mov byte [0x14], bl
+    top:    lock inc dword [0x10]
+            lock dec byte [0x14]
+            dec word [0x16]
+            loop top
+"""
+
+
+@skipIf(numpy is None, "the lane engine needs numpy")
+class TestLanes(TestCase):
+    def setUp(self):
+        global LaneCore, LaneInterpreter
+        from lanes import LaneCore, LaneInterpreter
+
+    def compare(self, source, initial):
+        """ run the program on lanes and on one Core per lane, every lane has to end in the same state
+        """
+        program = assemble(source)
+        lanes = LaneCore(len(initial))
+        for name in ('EAX', 'EBX', 'ECX'):
+            lanes.mov_reg(register.resolve(name), numpy.array([state[name] for state in initial]))
+        LaneInterpreter(program.instructions, lanes).run()
+
+        for lane, state in enumerate(initial):
+            core = Core()
+            core.mov_reg_imm(register.ESP, lanes.memory_size)
+            for name, value in state.items():
+                core.mov_reg_imm(register.resolve(name), value)
+            Interpreter(program.instructions, core=core).run()
+
+            # registers and flags have to match, the memory is compared separately
+            result = lanes.core(lane)
+            self.assertEqual(result.snapshot()[1:], core.snapshot()[1:], "lane {}".format(lane))
+            self.assertEqual(result.read_memory(0, 0x400), core.read_memory(0, 0x400))
+            stack = lanes.memory_size - 0x100
+            self.assertEqual(result.read_memory(stack, 0x100), core.read_memory(stack, 0x100))
+
+    def test_divergent(self):
+        rnd = random.Random(7)
+        initial = [{'EAX': rnd.randint(0, 0xffffffff), 'EBX': rnd.randint(0, 0xffffffff), 'ECX': rnd.randint(1, 40)}
+                   for _ in range(32)]
+        initial.append({'EAX': 0xff, 'EBX': 0x0100, 'ECX': 1})
+        initial.append({'EAX': 0, 'EBX': 0, 'ECX': 3})
+        self.compare(SOURCE, initial)
+
+    def test_calls(self):
+        rnd = random.Random(3)
+        initial = [{'EAX': rnd.randint(0, 0xffffffff), 'EBX': rnd.randint(0, 0xffffffff), 'ECX': rnd.randint(1, 40)}
+                   for _ in range(8)]
+        self.compare(CALLS, initial)
+
+    def test_carry(self):
+        rnd = random.Random(11)
+        initial = [{'EAX': rnd.randint(0, 0xffffffff), 'EBX': 0, 'ECX': 0} for _ in range(16)]
+        self.compare(CARRY, initial)
+
+    def test_memory_update(self):
+        rnd = random.Random(5)
+        initial = [{'EAX': rnd.choice((0, 0xfffffffe, rnd.randint(0, 0xffffffff))), 'EBX': rnd.randint(0, 3),
+                    'ECX': rnd.randint(1, 5)} for _ in range(16)]
+        self.compare(LOCKED, initial)
+
+    def test_memory(self):
+        lanes = LaneCore(4, memory_size=0x100)
+        lanes.write_memory(numpy.array([0, 4, 8, 12]), numpy.array([1, 0x100, 0x10000, -1]), 4)
+        self.assertEqual(list(lanes.read_memory(numpy.array([0, 4, 8, 12]), 2)), [1, 0x100, 0, 0xffff])
+        self.assertEqual(lanes.memory[3, 12:16].tobytes(), b"\xff\xff\xff\xff")
+        self.assertRaises(IndexError, lanes.read_memory, 0xfe, 4)
+
+    def test_unsupported(self):
+        lanes = LaneCore(2)
+        self.assertRaises(InterpreterError, LaneInterpreter(assemble("int 0x80").instructions, lanes).run)
+        self.assertRaises(IndexError, LaneInterpreter(assemble("pop eax").instructions, lanes).run)
+        self.assertRaises(InterpreterError, LaneInterpreter(assemble("lock mov eax, 1").instructions, lanes).run)
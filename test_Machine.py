@@ -0,0 +1,51 @@
+import threading
+from unittest import TestCase
+
+import stdlib
+from assembler import assemble
+from machine import Machine, current_machine, default_machine
+
+
+class TestMachine(TestCase):
+    def test_independent(self):
+        a = Machine()
+        b = Machine()
+        self.assertIsNot(a.core, b.core)
+        self.assertIs(a.kernel.core, a.core)
+
+        with a.activate():
+            first = stdlib.malloc(0x200)
+            self.assertIs(current_machine(), a)
+            with b.activate():
+                self.assertEqual(stdlib.malloc(0x200), first)
+                self.assertIs(current_machine(), b)
+            self.assertNotEqual(stdlib.malloc(0x200), first)
+        self.assertIs(current_machine(), default_machine())
+
+        self.assertEqual(a.kernel.memory_statistics().live_blocks, 2)
+        self.assertEqual(b.kernel.memory_statistics().live_blocks, 1)
+        self.assertEqual(stdlib.malloc(0x200, machine=b), first + 0x200)
+
+    def test_threads(self):
+        results = {}
+
+        def run(name):
+            machine = Machine()
+            with machine.activate():
+                results[name] = [stdlib.malloc(0x100) for _ in range(100)]
+                results[name].append(current_machine() is machine)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        expected = [i * 0x100 for i in range(100)] + [True]
+        self.assertEqual(results, {i: expected for i in range(4)})
+
+    def test_interpreter(self):
+        machine = Machine()
+        program = assemble("MOV EAX, 1\nINT 0x80\nMOV ECX, 5\n")
+        machine.interpreter(program.instructions).run()
+        self.assertEqual(machine.core.ECX, 5)
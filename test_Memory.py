@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from memory import PagedMemory, PAGE_SIZE
+
+
+class TestPagedMemory(TestCase):
+    def test_lazy_pages(self):
+        mem = PagedMemory()
+        self.assertEqual(mem.resident_size, 0)
+
+        self.assertEqual(mem.get(0x12345678), 0x00)
+        self.assertEqual(mem.read(0x80000000, 0x2000), bytes(0x2000))
+        self.assertEqual(mem.resident_size, 0)
+
+        mem.set(0x12345678, 0x1ff)
+        self.assertEqual(mem.get(0x12345678), 0xff)
+        self.assertEqual(mem.pages, [0x12345])
+
+        mem.set(0xfffff000, 0x01)
+        self.assertEqual(mem.pages, [0x12345, 0xfffff])
+        self.assertEqual(mem.resident_size, 2 * PAGE_SIZE)
+
+    def test_range_across_pages(self):
+        mem = PagedMemory()
+
+        data = bytes(range(256)) * 32
+        mem.write(PAGE_SIZE - 0x10, data)
+        self.assertEqual(mem.read(PAGE_SIZE - 0x10, len(data)), data)
+        self.assertEqual(mem.pages, [0, 1, 2])
+
+        mem.copy(0x00100000, PAGE_SIZE - 0x10, len(data))
+        self.assertEqual(mem.read(0x00100000, len(data)), data)
+
+        mem.fill(0, 3 * PAGE_SIZE)
+        self.assertEqual(mem.read(0, 3 * PAGE_SIZE), bytes(3 * PAGE_SIZE))
+        self.assertEqual(mem.pages, [0x100, 0x101])
+
+        mem.fill(PAGE_SIZE, 4, 0xaa)
+        self.assertEqual(mem.read(PAGE_SIZE - 2, 8), b"\x00\x00\xaa\xaa\xaa\xaa\x00\x00")
+
+    def test_wrap_around(self):
+        mem = PagedMemory()
+
+        mem.write(0xfffffffc, b"12345678")
+        self.assertEqual(mem.read(0, 4), b"5678")
+        self.assertEqual(mem.read(0xfffffffc, 8), b"12345678")
+        self.assertEqual(mem.get(0x100000000), ord('5'))
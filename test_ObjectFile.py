@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import objectfile
+from assembler import assemble
+
+SOURCE = """
+start:  mov eax, 0x7fffffffffffffff
+        mov bl, -1
+        mov dword [esi+8], eax
+        mov cx, [0x1000]
+again:  inc eax
+        loop again
+        jmp start
+        pop
+"""
+
+
+class TestObjectFile(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameProgram(self, a, b):
+        self.assertEqual([repr(i) for i in a.instructions], [repr(i) for i in b.instructions])
+        self.assertEqual(a.labels, b.labels)
+
+    def test_roundtrip(self):
+        program = assemble(SOURCE)
+        self.assertSameProgram(objectfile.load(objectfile.dump(program)), program)
+
+    def test_invalid(self):
+        data = objectfile.dump(assemble(SOURCE))
+        for broken in (b"", b"ELF!" + data[4:], data[:-1], data + b"\x00"):
+            with self.assertRaises(objectfile.ObjectFileError):
+                objectfile.load(broken)
+
+    def test_cache(self):
+        program = objectfile.assemble_cached(SOURCE, self.directory)
+        files = os.listdir(self.directory)
+        self.assertEqual(files, [objectfile.cache_key(SOURCE) + ".o"])
+        self.assertSameProgram(objectfile.assemble_cached(SOURCE, self.directory), program)
+
+        # broken cache files get replaced
+        with open(os.path.join(self.directory, files[0]), 'wb') as f:
+            f.write(b"garbage")
+        self.assertSameProgram(objectfile.assemble_cached(SOURCE, self.directory), program)
+        self.assertSameProgram(objectfile.assemble_cached(SOURCE, self.directory), program)
+
+    def test_cache_failure(self):
+        # the object file can't replace a directory, the temporary file is removed again
+        os.mkdir(os.path.join(self.directory, objectfile.cache_key(SOURCE) + ".o"))
+        with self.assertLogs('objectfile', 'WARNING'):
+            program = objectfile.assemble_cached(SOURCE, self.directory)
+        self.assertSameProgram(program, assemble(SOURCE))
+        self.assertEqual(os.listdir(self.directory), [objectfile.cache_key(SOURCE) + ".o"])
@@ -3,6 +3,7 @@ import logging
 
 from unittest import TestCase
 
+import datatypes.exceptions as exceptions
 from core import Core
 
 FORMAT = '%(asctime)-15s %(name)-12s %(levelname)-8s %(message)s'
@@ -189,3 +190,25 @@ class TestRegisters(TestCase):
         self.assertEqual(core.DX, 65535)
         self.assertEqual(core.DH, 255)
         self.assertEqual(core.DL, 255)
+
+    def test_carry(self):
+        LOG.debug("Testing register overflow ...")
+
+        core = Core()
+        core.EAX = 0x12345678
+
+        with self.assertRaises(exceptions.CarryOverException):
+            core.AL = 0x1ff
+        self.assertEqual(core.EAX, 0x123456ff)
+
+        with self.assertRaises(exceptions.CarryOverException):
+            core.AH = -1
+        self.assertEqual(core.EAX, 0x1234ffff)
+
+        with self.assertRaises(exceptions.CarryOverException):
+            core.AX = 0x10000
+        self.assertEqual(core.EAX, 0x12340000)
+
+        with self.assertRaises(exceptions.CarryOverException):
+            core.EAX = 0x100000001
+        self.assertEqual(core.EAX, 0x00000001)
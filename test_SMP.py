@@ -0,0 +1,146 @@
+import os
+from unittest import TestCase
+
+import register
+from assembler import assemble
+from blockcompiler import BlockInterpreter
+from core import Core
+from interpreter import Interpreter, InterpreterError
+from kernel import SYS_SEND_IPI, SYS_WAIT_IPI
+from machine import Machine
+from smp import SMP, SharedMemory, InterruptController
+
+COUNTER = """
+            mov ecx, 200
+    top:    lock inc dword [0x100]
+            inc word [esi]
+            loop top
+"""
+
+# cpu 0 pings cpu 1 and waits for the answer, cpu 1 waits for the ping and answers the sender
+PING = """
+            dec edi
+            jc first
+            mov eax, {wait}
+            int 0x80
+            mov esi, eax
+            mov ecx, 0x43
+            mov eax, {send}
+            int 0x80
+            jmp done
+    first:  mov ebx, 1
+            mov ecx, 0x42
+            mov eax, {send}
+            int 0x80
+            mov eax, {wait}
+            int 0x80
+    done:
+""".format(send=SYS_SEND_IPI, wait=SYS_WAIT_IPI)
+
+
+class Dying(Interpreter):
+    """ engine whose second core exits without reporting a result
+    """
+    def run(self):
+        if self.core.register_file[register.EDI] == 1:
+            os._exit(3)
+        super().run()
+
+
+class TestSMP(TestCase):
+    def test_shared_memory(self):
+        memory = SharedMemory(0x100)
+        try:
+            self.assertEqual(memory.size, 0x1000)
+            other = SharedMemory(*memory.attach())
+            a = Core(memory=memory)
+            b = Core(memory=other)
+            a.write_memory(0x10, b"shared")
+            self.assertEqual(b.read_memory(0x10, 6), b"shared")
+            b.inc_memory(0x10, 1)
+            self.assertEqual(a.get_memory_location(0x10), ord('t'))
+            self.assertEqual(b.read_u16(0x11), 0x6168)
+            self.assertEqual(b.read_u32(0x10), 0x72616874)
+            # forking copies the shared memory into a private one
+            a.EAX = 5
+            child = a.fork()
+            child.write_memory(0x10, b"c")
+            self.assertEqual(child.read_memory(0x10, 6), b"chared")
+            self.assertEqual(a.read_memory(0x10, 6), b"thared")
+            self.assertEqual(child.EAX, 5)
+            self.assertEqual(memory.pages, [0])
+            self.assertRaises(IndexError, a.read_memory, 0xffe, 4)
+            other.close()
+        finally:
+            memory.close()
+
+    def test_lock(self):
+        for engine in (Interpreter, BlockInterpreter):
+            for source in ("lock inc dword [0x100]", "lock\ninc dword [0x100]"):
+                program = assemble(source)
+                self.assertEqual([ins.instruction for ins in program.instructions], ['LOCK', 'INC'])
+                core = Core()
+                engine(program.instructions, core=core).run()
+                self.assertEqual(core.read_memory(0x100, 4), b"\x01\x00\x00\x00")
+
+        core = Core()
+        Interpreter(assemble("lock dec byte [0x10]").instructions, core=core).run()
+        self.assertEqual(core.get_memory_location(0x10), 0xff)
+        self.assertEqual(core.EFLAGS & 0x01, 0x01)
+
+        self.assertRaises(InterpreterError, Interpreter(assemble("lock inc eax").instructions).run)
+        self.assertRaises(InterpreterError, Interpreter(assemble("lock").instructions).run)
+
+    def test_counter(self):
+        with SMP(assemble(COUNTER), cpus=3) as smp:
+            results = smp.run(registers=[{'ESI': 0x200 + cpu * 2} for cpu in range(3)])
+            self.assertEqual([r.error for r in results], [None] * 3)
+            core = smp.core()
+            self.assertEqual(int.from_bytes(core.read_memory(0x100, 4), 'little'), 600)
+            self.assertEqual(core.read_memory(0x200, 6), b"\xc8\x00\xc8\x00\xc8\x00")
+
+    def test_ipi(self):
+        # cpu 0 sends an IPI to cpu 1 and waits for the answer, cpu 1 waits and answers
+        with SMP(assemble(PING), cpus=2) as smp:
+            first, second = smp.run()
+            self.assertEqual((first.error, second.error), (None, None))
+            self.assertEqual((first.registers['EAX'], first.registers['EBX']), (0x43, 1))
+            self.assertEqual(second.registers['ESI'], 0x42)
+
+    def test_no_heap(self):
+        # the kernels of the cores would hand out the same shared addresses, so they have no heap
+        with SMP(assemble("nop"), cpus=2) as smp:
+            first, second = smp.machine(0).kernel, smp.machine(1).kernel
+            self.assertIsNone(first.allocate(0x10))
+            self.assertIsNone(second.allocate(0x10))
+            self.assertIsNone(first.allocate(0x100))
+            self.assertEqual(first.memory_statistics().free_bytes, 0)
+
+    def test_failed_core(self):
+        # a core that can't attach to the memory still reports instead of blocking run()
+        smp = SMP(assemble("nop"), cpus=2)
+        smp.close()
+        results = smp.run()
+        self.assertEqual([r.cpu for r in results], [0, 1])
+        self.assertTrue(all(r.error.startswith("FileNotFoundError") for r in results))
+        self.assertEqual(results[0].registers, {})
+
+        with SMP(assemble("nop"), cpus=2, engine=Dying) as smp:
+            first, second = smp.run()
+            self.assertIsNone(first.error)
+            self.assertEqual(second.error, "Process exited with code 3")
+
+    def test_interrupt_handler(self):
+        interrupts = InterruptController(2)
+        a = Machine(cpu=0, interrupts=interrupts)
+        b = Machine(cpu=1, interrupts=interrupts)
+        raised = []
+        b.kernel.set_interrupt_handler(0x30, lambda: raised.append(b.core.EAX))
+
+        b.core.EAX = 7
+        a.kernel.send_ipi(1, 0x30)
+        self.assertEqual(b.kernel.wait_ipi(timeout=5), (0x30, 0))
+        self.assertEqual(raised, [7])
+        self.assertIsNone(b.kernel.wait_ipi(timeout=0.01))
+        self.assertRaises(ValueError, a.kernel.send_ipi, 1, 0x80)
+        self.assertRaises(ValueError, a.kernel.send_ipi, 2, 0x30)
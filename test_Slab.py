@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+import stdlib
+from allocator import FreeListAllocator
+from machine import Machine
+from slab import SlabAllocator, SLAB_SIZE, SIZE_CLASSES
+
+
+class TestSlabAllocator(TestCase):
+    def setUp(self):
+        self.heap = FreeListAllocator(0x0000, 0x10000)
+        self.slabs = SlabAllocator(self.heap.allocate, self.heap.free)
+
+    def test_size_classes(self):
+        for size, expected in ((1, 8), (8, 8), (9, 16), (33, 64), (128, 128), (129, None)):
+            self.assertEqual(SlabAllocator.size_class(size), expected)
+
+        self.assertRaises(ValueError, SlabAllocator.size_class, 0)
+        self.assertRaises(ValueError, self.slabs.allocate, -1)
+        self.assertIsNone(self.slabs.allocate(129))
+        address = self.slabs.allocate(20)
+        self.assertEqual(self.slabs.size_of(address), 32)
+        self.assertEqual(self.heap.blocks, {address: SLAB_SIZE})
+
+    def test_reuse(self):
+        objects = [self.slabs.allocate(16) for _ in range(4)]
+        self.assertEqual(objects, [0x00, 0x10, 0x20, 0x30])
+
+        self.assertTrue(self.slabs.free(0x10))
+        self.assertFalse(self.slabs.free(0x10))
+        self.assertFalse(self.slabs.free(0x1234))
+        self.assertEqual(self.slabs.allocate(12), 0x10)
+        self.assertTrue(self.slabs.is_slab(0x00))
+        self.assertFalse(self.slabs.is_slab(0x10))
+
+    def test_slabs(self):
+        for i, size in enumerate(SIZE_CLASSES):
+            count = SLAB_SIZE // size
+            objects = [self.slabs.allocate(size) for _ in range(count + 1)]
+            self.assertEqual(len(set(objects)), count + 1)
+            self.assertEqual(len(self.heap.blocks), i + 2)
+
+            # the slab that becomes empty first is released, the last one of a class is kept
+            for address in objects:
+                self.slabs.free(address)
+            self.assertEqual(len(self.heap.blocks), i + 1)
+
+    def test_out_of_memory(self):
+        heap = FreeListAllocator(0x0000, SLAB_SIZE)
+        slabs = SlabAllocator(heap.allocate, heap.free)
+        self.assertEqual(slabs.allocate(8), 0x00)
+        self.assertIsNone(slabs.allocate(16))
+
+    def test_double_free(self):
+        machine = Machine()
+        with machine.activate():
+            p = stdlib.malloc(8)
+            stdlib.free(p)
+            stdlib.free(p)
+            q = stdlib.malloc(8)
+            big = stdlib.malloc(512)
+        self.assertEqual(q, p)
+        self.assertGreaterEqual(big, p + SLAB_SIZE)
@@ -3,9 +3,12 @@ import logging
 
 from unittest import TestCase
 
+import register
+import slab
 import stdlib
+import tracer
 from core import Core
-from kernel import Kernel
+from machine import Machine
 
 FORMAT = '%(asctime)-15s %(name)-12s %(levelname)-8s %(message)s'
 LOG = logging.getLogger('t_memory')
@@ -26,22 +29,58 @@ class TestPySM_Core(TestCase):
         core.set_memory_location(0xffff, 0xff)
         self.assertEqual(core.get_memory_location(0xffff), 0xff)
 
-        core.set_memory_location(0x10000, 0xff)
+        core.set_memory_location(0xffffffff, 0xfe)
+        self.assertEqual(core.get_memory_location(0xffffffff), 0xfe)
+
+        core.set_memory_location(0x100000000, 0xff)
         self.assertEqual(core.get_memory_location(0x00), 0xff)
 
         for run in range(100000):
-            offset = random.randint(0x00, 0xffffff)
+            offset = random.randint(0x00, 0xffffffffff)
             value = random.randint(0x00, 0xffff)
             core.set_memory_location(offset, value)
-            self.assertEqual(core.get_memory_location(offset & 0xffff), value & 0xff)
+            self.assertEqual(core.get_memory_location(offset & 0xffffffff), value & 0xff)
 
-        for l in core.dump_memory():
+        for l in core.dump_memory(limit=0x100):
             LOG.debug(l)
 
+    def test_typed_memory(self):
+        core = Core()
+        core.write_u32(0x100, 0x12345678)
+        self.assertEqual(core.read_memory(0x100, 4), b"\x78\x56\x34\x12")
+        self.assertEqual(core.read_u16(0x102), 0x1234)
+        core.write_u16(0x104, -2)
+        self.assertEqual(core.read_u16(0x104), 0xfffe)
+        core.write_u32(0x108, -5)
+        self.assertEqual(core.read_i32(0x108), -5)
+        self.assertEqual(core.read_u32(0x108), 0xfffffffb)
+        core.write_u64(0x110, 0x0102030405060708)
+        self.assertEqual(core.read_u64(0x110), 0x0102030405060708)
+
+        # values crossing the end of the address space wrap around to address 0
+        core.write_u32(0xfffffffe, 0xaabbccdd)
+        self.assertEqual(core.read_memory(0xfffffffe, 2), b"\xdd\xcc")
+        self.assertEqual(core.read_memory(0, 2), b"\xbb\xaa")
+        self.assertEqual(core.read_u32(0xfffffffe), 0xaabbccdd)
+
+        core.write_u32_array(0xfffffff8, range(4))
+        self.assertEqual(list(core.read_u32_array(0xfffffff8, 4)), [0, 1, 2, 3])
+        self.assertEqual(core.read_u32(0x04), 3)
+        self.assertEqual(core.read_u64(0xfffffffc), 0x0000000200000001)
+
+        # the stack page is read through the memory's page cache
+        core.push(0xcafe)
+        self.assertEqual(core.read_u32(core.register_file[register.ESP]), 0xcafe)
+
+        for read in (core.read_u16, core.read_u32, core.read_i32, core.read_u64):
+            self.assertRaises(ValueError, read, 1.0)
+        self.assertRaises(ValueError, core.read_u32_array, 0x100, 1.5)
+
     def test_set_mem_range(self):
         LOG.debug("Testing set_memory_range() ...")
 
-        core = Core()
+        machine = Machine()
+        core = machine.core
         mem_locations = {}
 
         for i in range(6):
@@ -49,33 +88,109 @@ class TestPySM_Core(TestCase):
             msg = [ord(c) for c in "Hello World #{}!".format(i)]
             msg.append(0x00)
 
-            mem_locations[ptr_name] = stdlib.malloc(len(msg))
+            mem_locations[ptr_name] = stdlib.malloc(len(msg), machine=machine)
             core.set_memory_range(mem_locations[ptr_name], msg)
             for l in core.dump_memory(limit=0x0006):
                 LOG.debug(l)
             self.assertEqual(mem_locations[ptr_name], i*0x10)
 
-        stdlib.free(mem_locations.pop('ptr_2'))
+        stdlib.free(mem_locations.pop('ptr_2'), machine=machine)
         for l in core.dump_memory(limit=0x0006):
             LOG.debug(l)
 
         ptr_name = "ptr_{}_n".format(1)
         msg = [ord(c) for c in "Hello!".upper()]
         msg.append(0x00)
-        mem_locations[ptr_name] = stdlib.malloc(len(msg))
+        mem_locations[ptr_name] = stdlib.malloc(len(msg), machine=machine)
         core.set_memory_range(mem_locations[ptr_name], msg)
         for l in core.dump_memory(limit=0x0006):
             LOG.debug(l)
-        self.assertEqual(mem_locations[ptr_name], 0x20)
+        # 7 bytes go to the first slab of the 8 byte class, after the one of the 16 byte class
+        self.assertEqual(mem_locations[ptr_name], slab.SLAB_SIZE)
 
         ptr_name = "ptr_{}_n".format(2)
         msg = [ord(c) for c in "World!123".format(i).upper()]
         msg.append(0x00)
-        mem_locations[ptr_name] = stdlib.malloc(len(msg))
+        mem_locations[ptr_name] = stdlib.malloc(len(msg), machine=machine)
         core.set_memory_range(mem_locations[ptr_name], msg)
         for l in core.dump_memory(limit=0x007):
             LOG.debug(l)
-        self.assertEqual(mem_locations[ptr_name], 0x60)
+        # 10 bytes reuse the freed object of the 16 byte class
+        self.assertEqual(mem_locations[ptr_name], 0x20)
+
+    def test_memory_bulk(self):
+        LOG.debug("Testing bulk memory operations ...")
+        core = Core()
+
+        core.write_memory(0x0100, b"Hello World!")
+        self.assertEqual(core.read_memory(0x0100, 12), b"Hello World!")
+        self.assertEqual(core.get_memory_range(0x0100, 5), [ord(c) for c in "Hello"])
+
+        core.copy_memory(0x0200, 0x0100, 12)
+        self.assertEqual(core.read_memory(0x0200, 12), b"Hello World!")
+
+        core.copy_memory(0x0102, 0x0100, 10)
+        self.assertEqual(core.read_memory(0x0100, 12), b"HeHello Worl")
+
+        core.fill_memory(0x0100, 4, 0x1ff)
+        self.assertEqual(core.read_memory(0x0100, 5), b"\xff\xff\xff\xffl")
+
+        # ranges wrap around at the end of the address space
+        core.write_memory(0xfffffffe, bytearray(b"abcd"))
+        self.assertEqual(core.get_memory_location(0xffffffff), ord('b'))
+        self.assertEqual(core.get_memory_location(0x0000), ord('c'))
+        self.assertEqual(core.read_memory(0xfffffffe, 4), b"abcd")
+        self.assertEqual(core.read_memory(0x1fffffffe, 4), b"abcd")
+
+        core.set_memory_range(0x0300, [0x41, 0x142])
+        self.assertEqual(core.read_memory(0x0300, 2), b"AB")
+
+    def test_snapshot(self):
+        LOG.debug("Testing snapshot() and restore() ...")
+        core = Core()
+
+        core.write_memory(0x1000, b"warm")
+        core.EAX = 0x12345678
+        core.push(0x42)
+        snap = core.snapshot()
+
+        core.write_memory(0x1000, b"cold")
+        core.write_memory(0x00200000, b"new page")
+        core.EAX = 0
+        core.inc("EBX")
+        core.pop()
+        self.assertEqual(core.read_memory(0x1000, 4), b"cold")
+
+        core._IP = 9
+        core.restore(snap)
+        self.assertEqual(core.read_memory(0x1000, 4), b"warm")
+        self.assertEqual(core.read_memory(0x00200000, 8), bytes(8))
+        self.assertEqual(core._IP, 0)
+        self.assertEqual(core.EAX, 0x12345678)
+        self.assertEqual(core.EBX, 0)
+        core.pop("ECX")
+        self.assertEqual(core.ECX, 0x42)
+
+        # restoring twice gives the same state again
+        core.write_memory(0x1000, b"dirt")
+        core.restore(snap)
+        self.assertEqual(core.read_memory(0x1000, 4), b"warm")
+
+    def test_fork(self):
+        LOG.debug("Testing fork() ...")
+        core = Core()
+        core.write_memory(0x1000, b"shared")
+        core.ECX = 7
+
+        child = core.fork()
+        child.write_memory(0x1000, b"child")
+        child.ECX = 8
+        core.write_memory(0x1002, b"AR")
+
+        self.assertEqual(core.read_memory(0x1000, 6), b"shARed")
+        self.assertEqual(child.read_memory(0x1000, 6), b"childd")
+        self.assertEqual(core.ECX, 7)
+        self.assertEqual(child.ECX, 8)
 
     def test_inc(self):
         LOG.debug("Testing inc() ...")
@@ -117,6 +232,96 @@ class TestPySM_Core(TestCase):
         core.mov("CH", "EAX")
         self.assertEqual(core.CH, 0xff)
 
+    def test_register_operands(self):
+        LOG.debug("Testing operand id based commands ...")
+        core = Core()
+        eax, ah, al, cx = (register.resolve(n) for n in ("eax", "AH", "al", "CX"))
+        self.assertIsNone(register.resolve("EFLAGS"))
+        self.assertEqual(register.width(ah), 8)
+        self.assertEqual(register.width(cx), 16)
+
+        core.mov_reg_imm(eax, 0x12345678)
+        self.assertEqual(core.get_reg(ah), 0x56)
+        self.assertEqual(core.get_reg(al), 0x78)
+
+        core.mov_reg_imm(al, 0xff)
+        core.inc_reg(al)
+        self.assertEqual(core.EAX, 0x12345600)
+        self.assertEqual(core.EFLAGS & 0x01, 0x01)
+
+        core.dec_reg(ah)
+        self.assertEqual(core.EAX, 0x12345500)
+
+        core.mov_reg_reg(cx, eax)
+        self.assertEqual(core.ECX, 0x5500)
+
+        core.push_reg(cx)
+        core.pop_reg(al)
+        self.assertEqual(core.EAX, 0x12345500)
+
+    def test_trace(self):
+        LOG.debug("Testing the trace buffer ...")
+        core = Core()
+        core.EAX = 1
+
+        core.trace = tracer.TraceBuffer(capacity=4)
+        core.EAX = 4
+        core.inc("AL")
+        core.push(0xf0)
+        self.assertEqual(core.trace.decode(), [
+            "EAX is now 4",
+            "Incrementing register AL",
+            "AL is now 5",
+            "Pushing 000000F0 to stack"
+        ])
+
+        core.set_memory_location(0x1234, 0x1ff)
+        self.assertEqual(core.trace.dropped, 1)
+        self.assertEqual(tracer.decode(core.trace.dump()), [
+            "Incrementing register AL",
+            "AL is now 5",
+            "Pushing 000000F0 to stack",
+            "memory at address 00001234 is set to FF"
+        ])
+
+        core.trace = None
+        core.EAX = 0
+
+    def test_trace_blocks(self):
+        LOG.debug("Testing trace records of block and stack operations ...")
+        core = Core()
+        core.EAX = 1
+        core.trace = tracer.TraceBuffer()
+        core.fill_memory(0x0100, 8, 0xff)
+        core.copy_memory(0x0200, 0x0100, 4)
+        core.pusha()
+        core.popa()
+        core.enter(8)
+        core.leave()
+        self.assertEqual(core.trace.decode(), [
+            "memory at address 00000100 is set to 8 bytes",
+            "memory at address 00000200 is set to 4 bytes",
+            "Pushing 00000001 to stack",
+            "Pushing 00000000 to stack",
+            "Pushing 00000000 to stack",
+            "Pushing 00000000 to stack",
+            "Pushing 00000000 to stack",
+            "Pushing 00000000 to stack",
+            "Pushing 00000000 to stack",
+            "Pushing 00000000 to stack",
+            "EDI is now 0",
+            "ESI is now 0",
+            "EBP is now 0",
+            "EBX is now 0",
+            "EDX is now 0",
+            "ECX is now 0",
+            "EAX is now 1",
+            "Pushing 00000000 to stack",
+            "EBP is now 4294967292",
+            "EBP is now 0"
+        ])
+        core.trace = None
+
     def test_push_pop(self):
         LOG.debug("Testing stack functions ...")
         core = Core()
@@ -152,13 +357,15 @@ class TestPySM_Core(TestCase):
 
     def test_sys_write(self):
         LOG.debug("Testing sys_write() ...")
-        core = Core()
-        kernel = Kernel(core=core)
+        machine = Machine()
+        core = machine.core
+        kernel = machine.kernel
 
         msg = [ord(c) for c in "Hello!"]
         msg.append(0x00)
         LOG.debug(len(msg))
-        addr = stdlib.malloc(len(msg))
+        with machine.activate():
+            addr = stdlib.malloc(len(msg))
         length = len(msg)
 
         core.EAX = 4        # sys_write
@@ -169,4 +376,4 @@ class TestPySM_Core(TestCase):
 
         kernel.interrupt(0x80)      # handover to kernel
 
-        stdlib.free(addr)
+        stdlib.free(addr, machine=machine)
@@ -0,0 +1,96 @@
+import struct
+
+import register as r
+
+# event types
+REGISTER_WRITE = 0x01
+MEMORY_WRITE = 0x02
+MEMORY_BLOCK_WRITE = 0x03
+PUSH = 0x04
+INC = 0x05
+DEC = 0x06
+INTERRUPT = 0x07
+SYSCALL = 0x08
+
+# every event is a fixed size record: type, operand id, two 32 bit arguments
+EVENT = struct.Struct('<BBxxII')
+
+
+class TraceBuffer(object):
+    """ Ring buffer of binary trace events
+
+    Events are packed into a preallocated bytearray, once the buffer is full the oldest events get
+    overwritten. Nothing gets formatted while recording, decode() turns the events back into the
+    log messages the core used to write.
+    """
+
+    def __init__(self, capacity=0x10000):
+        self._capacity = capacity
+        self._buffer = bytearray(capacity * EVENT.size)
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self._capacity)
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def dropped(self):
+        """ returns the amount of events that have been overwritten
+        """
+        return max(0, self._count - self._capacity)
+
+    def record(self, event, operand=0, a=0, b=0):
+        EVENT.pack_into(self._buffer, (self._count % self._capacity) * EVENT.size, event, operand, a, b)
+        self._count += 1
+
+    def clear(self):
+        self._count = 0
+
+    def events(self):
+        """ returns all recorded events, oldest first, as (type, operand, a, b) tuples
+        """
+        first = self._count - len(self)
+        return [EVENT.unpack_from(self._buffer, (i % self._capacity) * EVENT.size)
+                for i in range(first, self._count)]
+
+    def decode(self):
+        """ returns the recorded events as log messages
+        """
+        return [format_event(*e) for e in self.events()]
+
+    def dump(self):
+        """ returns the raw events, oldest first
+        """
+        first = (self._count - len(self)) % self._capacity * EVENT.size
+        if self._count <= self._capacity:
+            return bytes(self._buffer[:self._count * EVENT.size])
+        return bytes(self._buffer[first:] + self._buffer[:first])
+
+
+def format_event(event, operand, a, b):
+    if event == REGISTER_WRITE:
+        return "{} is now {}".format(r.OPERAND_NAMES[operand], a)
+    if event == MEMORY_WRITE:
+        return "memory at address {:08X} is set to {:02X}".format(a, b)
+    if event == MEMORY_BLOCK_WRITE:
+        return "memory at address {:08X} is set to {} bytes".format(a, b)
+    if event == PUSH:
+        return "Pushing {:08X} to stack".format(a)
+    if event == INC:
+        return "Incrementing register {}".format(r.OPERAND_NAMES[operand])
+    if event == DEC:
+        return "Decrementing register {}".format(r.OPERAND_NAMES[operand])
+    if event == INTERRUPT:
+        return "Interrupt received: {}".format(a)
+    if event == SYSCALL:
+        return "Executing syscall: {}".format(a)
+    raise ValueError("Unknown trace event {:02X}".format(event))
+
+
+def decode(data):
+    """ decode raw events as returned by TraceBuffer.dump() into log messages
+    """
+    return [format_event(*e) for e in EVENT.iter_unpack(data)]